@@ -1,21 +1,227 @@
 import os
+import time
+import hashlib
 import logging
-from flask import Flask, request, jsonify, render_template, send_file
-from flasgger import Swagger
-from dotenv import load_dotenv
+import threading
+import importlib.util
+from flask import (Blueprint, Flask, Response, g, request, jsonify, render_template, send_file, send_from_directory,
+                   stream_template, stream_with_context, url_for, before_render_template, template_rendered)
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
+from flask.json.provider import DefaultJSONProvider
 from io import BytesIO
-from database_handler import DatabaseHandler
+from datetime import datetime, timezone
+from database_handler import (DatabaseHandler, MODERATION_BULK_MAX, MODERATION_CLAIM_MAX, MODERATION_LEASE,
+                              MODERATION_LEASE_MAX, clamp_limit, decode_cursor, decode_key_cursor, encode_key_cursor)
+from db_router import parse_lsn
+from export import EXPORT_FORMATS, serialize_export
+from blob_storage import (BlobTooLargeError, UnsupportedImageError, get_blob_storage, image_response_headers,
+                          sniff_mimetype)
+from reference_cache import ReferenceCache
+from object_cache import PEREVAL_NOTIFY_CHANNEL, CachedPereval, ObjectCache, get_shared_store
+from area_tree import AreaTree
+from validation import ValidationError, validate_pereval
+import serialization
+from serialization import json_array, json_default
+import metrics
+import compression
+from image_derivatives import DERIVATIVE_FORMATS, DERIVATIVE_SIZES, get_derivative_store, negotiate_format
+from ingest_queue import get_ingest_queue
+import geo
+import openapi
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 
 # ----------------- Настройка окружения и логирования -----------------
-load_dotenv()
+def load_env_file():
+    """
+    Переменные из .env для локальной разработки. На платформе они заданы окружением,
+    и без файла python-dotenv даже не импортируется.
+    """
+    for directory in (os.getcwd(), BASE_DIR):
+        path = os.path.join(directory, ".env")
+        if os.path.exists(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return
+
+
+load_env_file()
 logging.basicConfig(level=logging.INFO)
 
-# ----------------- Создание приложения Flask и Swagger -----------------
-app = Flask(__name__)
-swagger = Swagger(app)
 
-# ----------------- Подключение к базе -----------------
-db_handler = DatabaseHandler()  # использует db.py с SSL
+class PerevalJSONProvider(DefaultJSONProvider):
+    """jsonify и request.get_json через кодек serialization.py — тот же JSON, что у asgi_app.py."""
+    ensure_ascii = False
+    default = staticmethod(json_default)
+
+    def dumps(self, obj, **kwargs):
+        return serialization.dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return serialization.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(serialization.dumps(obj), mimetype=self.mimetype)
+
+
+api = Blueprint("api", __name__)
+
+# sync — перевал записывается в БД в запросе; async — через очередь с ответом 202
+INGEST_MODE = os.getenv("FSTR_INGEST_MODE", "sync")
+GEO_TILE_LIMIT = int(os.getenv("FSTR_GEO_TILE_LIMIT", 2000))
+# Готовые ответы GET /submitData/<id>; FSTR_PEREVAL_CACHE_SIZE=0 отключает кэш
+PEREVAL_CACHE_SIZE = int(os.getenv("FSTR_PEREVAL_CACHE_SIZE", 10000))
+
+
+# ----------------- Ресурсы процесса -----------------
+# Подключение к БД, хранилища, кэши и очередь приёма создаются при первом запросе (или
+# первом обращении app.db_handler и т. п.), а не при импорте: холодный старт не ждёт их
+RESOURCE_NAMES = ("db_handler", "blob_storage", "derivatives", "reference_cache", "geo_cache", "pereval_cache",
+                  "ingest_queue")
+_resources_lock = threading.Lock()
+_resources_ready = False
+
+
+def load_cached_pereval(pereval_id):
+    pereval, version = db_handler.get_pereval_with_version(pereval_id)
+    if not pereval:
+        return None
+    return CachedPereval(serialization.dumps(pereval), version['etag'], version['last_modified'])
+
+
+def init_resources():
+    global db_handler, blob_storage, derivatives, reference_cache, geo_cache, pereval_cache, ingest_queue
+    global _resources_ready
+    if _resources_ready:
+        return
+    with _resources_lock:
+        if _resources_ready:
+            return
+        db_handler = DatabaseHandler()
+        blob_storage = get_blob_storage(db_handler=db_handler)
+        derivatives = get_derivative_store(blob_storage)
+
+        # Кэш справочников
+        reference_cache = ReferenceCache(
+            ttl=float(os.getenv("FSTR_REFERENCE_TTL", 300)),
+            connect_factory=db_handler.get_connection if os.getenv("FSTR_REFERENCE_LISTEN", "1") == "1" else None,
+        )
+        reference_cache.register("areas", db_handler.get_all_areas, tables=["pereval_areas"])
+        reference_cache.register("activities", db_handler.get_activities_types, tables=["spr_activities_types"])
+        reference_cache.register("area_tree", lambda: AreaTree(db_handler.get_all_areas()),
+                                 tables=["pereval_areas"], serialize=lambda tree: tree.nested())
+
+        # Координаты всех перевалов в памяти для тайлов карты; обновляются не реже раза в FSTR_GEO_GRID_TTL секунд
+        geo_cache = ReferenceCache(ttl=float(os.getenv("FSTR_GEO_GRID_TTL", 60)))
+        geo_cache.register("grid", lambda: geo.GeoGrid(db_handler.get_geo_points(),
+                                                        float(os.getenv("FSTR_GEO_GRID_CELL", 1.0))),
+                           tables=["pereval_added"], serialize=lambda grid: {"points": grid.size})
+
+        # Кэш перевалов. Изменения через API сбрасывают запись сразу, изменения в обход API
+        # (и в других воркерах) — через NOTIFY pereval_changed из триггера миграции 0009
+        pereval_cache = None
+        if PEREVAL_CACHE_SIZE > 0:
+            pereval_cache = ObjectCache("pereval", load_cached_pereval, max_entries=PEREVAL_CACHE_SIZE,
+                                        ttl=float(os.getenv("FSTR_PEREVAL_CACHE_TTL", 300)),
+                                        shared=get_shared_store(), dump=CachedPereval.dump, load=CachedPereval.load)
+            db_handler.change_listeners.append(pereval_cache.invalidate)
+            reference_cache.subscribe(PEREVAL_NOTIFY_CHANNEL,
+                                      lambda payload: pereval_cache.invalidate(int(payload) if payload else None))
+
+        ingest_queue = get_ingest_queue(db_handler)
+        if INGEST_MODE == "async":
+            # Заявки, не перенесённые до перезапуска, отправляются сразу
+            ingest_queue.start()
+        _resources_ready = True
+
+
+@api.before_app_request
+def ensure_resources():
+    init_resources()
+
+
+# ----------------- Реплики: read-your-writes -----------------
+# После записи клиент получает LSN основного сервера (заголовок X-Read-After и cookie на
+# FSTR_DB_READ_YOUR_WRITES секунд) и в эти секунды читает только с реплик, которые до него дошли
+READ_YOUR_WRITES_WINDOW = int(os.getenv("FSTR_DB_READ_YOUR_WRITES", 10))
+READ_AFTER_HEADER = "X-Read-After"
+READ_AFTER_COOKIE = "fstr_read_after"
+
+
+@api.before_app_request
+def enter_db_scope():
+    if not db_handler.has_replicas:
+        return
+    token = request.headers.get(READ_AFTER_HEADER) or request.cookies.get(READ_AFTER_COOKIE)
+    read_after = None
+    if token:
+        try:
+            read_after = parse_lsn(token)
+        except ValueError:
+            logging.warning(f"Некорректный токен {READ_AFTER_HEADER}: {token!r}")
+    g.db_scope = db_handler.request_scope(read_after)
+    g.db_scope.__enter__()
+
+
+@api.after_app_request
+def issue_read_after(response):
+    # Области нет, если реплик нет или запрос не дошёл до обработчиков
+    if "db_scope" in g and request.method in ("POST", "PUT", "PATCH", "DELETE") and response.status_code < 400:
+        try:
+            lsn = db_handler.current_lsn()
+        except Exception as e:
+            logging.error(f"Ошибка получения LSN после записи: {e}")
+            return response
+        response.headers[READ_AFTER_HEADER] = lsn
+        if READ_YOUR_WRITES_WINDOW > 0:
+            response.set_cookie(READ_AFTER_COOKIE, lsn, max_age=READ_YOUR_WRITES_WINDOW, httponly=True,
+                                samesite="Lax")
+    return response
+
+
+@api.teardown_app_request
+def exit_db_scope(exc):
+    scope = g.pop("db_scope", None)
+    if scope is not None:
+        scope.__exit__(None, None, None)
+
+
+# ----------------- Создание приложения Flask -----------------
+def create_app():
+    """
+    Приложение Flask со всеми маршрутами. Ресурсы (БД, кэши, очередь) не создаются
+    здесь, а при первом запросе; спецификация OpenAPI берётся из собранного файла (openapi.py).
+    """
+    flask_app = Flask(__name__)
+    flask_app.json = PerevalJSONProvider(flask_app)
+    flask_app.register_blueprint(api)
+    before_render_template.connect(start_template_timer, flask_app)
+    template_rendered.connect(observe_template, flask_app)
+    return flask_app
+
+
+def __getattr__(name):
+    # app и ресурсы модуля создаются при первом обращении: import app почти ничего не делает
+    if name == "app":
+        with _resources_lock:
+            if "app" not in globals():
+                globals()["app"] = create_app()
+        return globals()["app"]
+    if name in RESOURCE_NAMES:
+        init_resources()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Содержимое изображения по id не меняется, поэтому кэшируем надолго
+IMAGE_MAX_AGE = 365 * 24 * 3600
+MAX_IMAGE_SIZE = int(os.getenv("FSTR_MAX_IMAGE_SIZE", 10 * 1024 * 1024))
+MAX_IMAGES_PER_REQUEST = int(os.getenv("FSTR_MAX_IMAGES_PER_REQUEST", 10))
+BATCH_MAX_ITEMS = int(os.getenv("FSTR_BATCH_MAX_ITEMS", 1000))
+# Списки перевалов отдаются JSON-текстом из БД без разбора в Python
+JSON_PASSTHROUGH = os.getenv("FSTR_JSON_PASSTHROUGH", "1") == "1"
 
 # ----------------- Вспомогательные функции -----------------
 def parse_input(req):
@@ -34,9 +240,205 @@ def parse_input(req):
         images = [{"url": url.strip()} for url in req.form.get("images", "").split(",") if url.strip()]
         return raw_data, images
 
+
+def wants_async(req):
+    """Асинхронный приём: включён для всех или клиент прислал Prefer: respond-async."""
+    return INGEST_MODE == "async" or "respond-async" in req.headers.get("Prefer", "")
+
+
+class TooManyFilesError(Exception):
+    pass
+
+
+def stream_uploads(req, field):
+    """
+    Разобрать multipart-запрос, записывая файлы сразу в хранилище по частям.
+    Ограничение MAX_IMAGE_SIZE проверяется во время чтения. Возвращает (form, [BlobInfo]).
+    """
+    writers = []
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        if len(writers) >= MAX_IMAGES_PER_REQUEST:
+            raise TooManyFilesError(f"Не больше {MAX_IMAGES_PER_REQUEST} файлов в одном запросе")
+        writer = blob_storage.open_writer(MAX_IMAGE_SIZE)
+        writers.append(writer)
+        return writer
+
+    try:
+        _, form, files = parse_form_data(
+            req.environ, stream_factory=stream_factory,
+            max_content_length=MAX_IMAGE_SIZE * MAX_IMAGES_PER_REQUEST + 64 * 1024)
+        blobs = [f.stream.commit() for f in files.getlist(field) if f.filename]
+        return form, blobs
+    finally:
+        # Файлы из посторонних полей и недописанные при ошибке удаляются
+        for writer in writers:
+            writer.abort()
+
+
+def parse_batch(req):
+    """
+    Элементы пакетной загрузки: JSON-массив или NDJSON (по объекту на строку).
+    Возвращает список (index, data, error) — некорректный JSON отмечается ошибкой элемента.
+    """
+    if req.mimetype == "application/x-ndjson":
+        items = []
+        for index, line in enumerate(req.stream):
+            if len(items) > BATCH_MAX_ITEMS:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append((len(items), serialization.loads(line), None))
+            except ValueError as e:
+                items.append((len(items), None, f"Некорректный JSON в строке {index + 1}: {e}"))
+        return items
+    data = req.get_json(silent=True)
+    if not isinstance(data, list):
+        raise ValidationError("Ожидается JSON-массив или NDJSON")
+    return [(index, item, None) for index, item in enumerate(data)]
+
+
+def page_response(items, next_cursor):
+    """Страница {"items", "next"}; при JSON_PASSTHROUGH items — готовые строки JSON из БД."""
+    if not JSON_PASSTHROUGH:
+        return jsonify({"items": items, "next": next_cursor}), 200
+    body = b'{"items":' + json_array(items) + b',"next":' + serialization.dumps(next_cursor) + b'}'
+    return Response(body, mimetype="application/json"), 200
+
+
+def reference_response(name):
+    """Справочник из кэша: готовое тело, ETag и 304 при совпадении If-None-Match."""
+    entry = reference_cache.get(name)
+    response = Response(entry.body, mimetype="application/json")
+    response.set_etag(entry.etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def not_modified(etag, last_modified=None):
+    """
+    Актуально ли представление у клиента: сравнивается If-None-Match (без суффикса
+    кодировки сжатого ответа), а если его нет — If-Modified-Since.
+    """
+    header = request.headers.get("If-None-Match")
+    if header:
+        tags = {compression.base_etag(t.strip().removeprefix("W/").strip('"')) for t in header.split(",")}
+        return "*" in tags or etag in tags
+    if last_modified is not None and request.if_modified_since:
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= request.if_modified_since
+    return False
+
+
+def if_match_versions(pereval_id):
+    """
+    Версии перевала из If-Match (ETag "<id>-<version>", в том числе с суффиксом сжатия).
+    None — заголовка нет или "*"; слабые ETag и ETag другого перевала не совпадают ни с одной версией.
+    """
+    header = request.headers.get("If-Match")
+    if not header:
+        return None
+    versions = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return None
+        if tag.startswith("W/"):
+            continue
+        resource, _, version = compression.base_etag(tag.strip('"')).rpartition("-")
+        if resource == str(pereval_id) and version.isdigit():
+            versions.append(int(version))
+    return versions
+
+
+def validated_response(response, etag, last_modified=None):
+    """Проставить ETag/Last-Modified; Cache-Control: no-cache — клиент проверяет актуальность каждый раз."""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    response.cache_control.no_cache = True
+    return response
+
+
+def geojson_response(collection, status=200):
+    return Response(serialization.dumps(collection), status=status, mimetype="application/geo+json")
+
+
+def image_file_response(source, mimetype, **kwargs):
+    """send_file для сохранённого изображения: тип только из списка изображений и nosniff."""
+    mimetype, headers = image_response_headers(mimetype)
+    response = send_file(source, mimetype=mimetype, conditional=True, max_age=IMAGE_MAX_AGE, **kwargs)
+    response.headers.update(headers)
+    return response
+
+
+def upload_error_response(e):
+    if isinstance(e, (BlobTooLargeError, RequestEntityTooLarge)):
+        return jsonify({"error": f"Файл больше {MAX_IMAGE_SIZE} байт"}), 413
+    if isinstance(e, TooManyFilesError):
+        return jsonify({"error": str(e)}), 413
+    if isinstance(e, UnsupportedImageError):
+        return jsonify({"error": str(e)}), 415
+    logging.error(f"Ошибка загрузки изображения: {e}")
+    return jsonify({"error": str(e)}), 500
+
+# ----------------- Метрики запросов -----------------
+@api.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@api.after_app_request
+def observe_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # Шаблон маршрута, а не путь: иначе число рядов метрики растёт с каждым id
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        metrics.REQUEST_DURATION.labels(route, request.method, str(response.status_code)).observe(
+            time.perf_counter() - started)
+    return response
+
+
+def start_template_timer(sender, template, context, **extra):
+    g.setdefault("template_started", []).append(time.perf_counter())
+
+
+def observe_template(sender, template, context, **extra):
+    stack = g.get("template_started")
+    if stack:
+        metrics.TEMPLATE_RENDER_DURATION.labels(template.name or "<string>").observe(time.perf_counter() - stack.pop())
+
+
+# ----------------- Сжатие ответов -----------------
+@api.after_app_request
+def encode_response(response):
+    """
+    gzip/br по Accept-Encoding для текстовых ответов (JSON, HTML, CSV/NDJSON, в том
+    числе потоковых). Изображения и файлы send_file не сжимаются.
+    """
+    if request.method not in ("GET", "HEAD") or not compression.is_compressible(response.mimetype):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = compression.negotiate(request.accept_encodings)
+    etag, weak = response.get_etag()
+    if encoding and etag and not weak:
+        # Суффикс кодировки — только у ответа, который действительно будет сжат
+        if response.status_code == 200 and compression.will_compress(response, encoding):
+            response.set_etag(compression.encoded_etag(etag, encoding))
+            # If-None-Match клиента содержит ETag сжатого ответа — сверяем заново
+            response.make_conditional(request)
+        elif response.status_code == 304 and request.if_none_match.contains(compression.encoded_etag(etag, encoding)):
+            # Тела у 304 нет: ETag повторяет то представление, что уже есть у клиента
+            response.set_etag(compression.encoded_etag(etag, encoding))
+    if response.status_code == 200:
+        compression.compress_response(response, encoding)
+    return response
+
+
 # ----------------- Эндпоинты -----------------
 
-@app.route('/')
+@api.route('/')
 def index():
     """
     Главная страница
@@ -44,26 +446,355 @@ def index():
     return render_template("index.html")
 
 
-@app.route('/perevals', methods=['GET'])
+@api.route('/perevals', methods=['GET'])
 def get_perevals():
     """
-    Получить список всех перевалов
+    Получить список перевалов (постранично, потоковой отрисовкой)
     ---
     tags:
       - Perevals
+    parameters:
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Размер страницы (по умолчанию 50, не больше 500)
+      - in: query
+        name: after
+        type: string
+        required: false
+        description: Курсор следующей страницы
     responses:
       200:
         description: Список перевалов
     """
     try:
-        perevals = db_handler.get_all_perevals()
-        return render_template("perevals.html", perevals=perevals)
+        limit = clamp_limit(request.args.get("limit", type=int))
+        after = request.args.get("after")
+        if after:
+            decode_cursor(after)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        perevals = db_handler.iter_perevals_page(limit, after)
+        return Response(stream_template("perevals.html", perevals=perevals, limit=limit))
     except Exception as e:
         logging.error(f"Ошибка при выводе перевалов: {e}")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/submitData', methods=['GET', 'POST'])
+@api.route('/perevals.json', methods=['GET'])
+def get_perevals_json():
+    """
+    Получить страницу перевалов в JSON
+    ---
+    tags:
+      - Perevals
+    parameters:
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Размер страницы (по умолчанию 50, не больше 500)
+      - in: query
+        name: after
+        type: string
+        required: false
+        description: Курсор, полученный в поле next предыдущей страницы
+    responses:
+      200:
+        description: Страница перевалов и курсор следующей страницы
+      400:
+        description: Некорректный limit или курсор
+    """
+    try:
+        limit = clamp_limit(request.args.get("limit", type=int))
+        perevals, next_cursor = db_handler.get_perevals_page(limit, request.args.get("after"),
+                                                             raw_json=JSON_PASSTHROUGH)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Ошибка при выводе страницы перевалов: {e}")
+        return jsonify({"error": str(e)}), 500
+    return page_response(perevals, next_cursor)
+
+
+@api.route('/perevals/search', methods=['GET'])
+def search_perevals():
+    """
+    Поиск перевалов по названию
+    ---
+    tags:
+      - Perevals
+    parameters:
+      - in: query
+        name: q
+        type: string
+        required: true
+        description: Слова или их начало из beautyTitle, title, other_titles; допускаются опечатки
+      - in: query
+        name: limit
+        type: integer
+        required: false
+      - in: query
+        name: after
+        type: string
+        required: false
+        description: Курсор, полученный в поле next предыдущей страницы
+    responses:
+      200:
+        description: Найденные перевалы по убыванию score и курсор следующей страницы
+      400:
+        description: Пустой запрос, некорректный limit или курсор
+    """
+    try:
+        limit = clamp_limit(request.args.get("limit", type=int))
+        after = request.args.get("after")
+        after = decode_key_cursor(after, (float, int)) if after else None
+        items, next_key = db_handler.search_perevals(request.args.get("q"), limit, after)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Ошибка поиска перевалов: {e}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"items": items, "next": encode_key_cursor(*next_key) if next_key else None}), 200
+
+
+@api.route('/perevals/bbox', methods=['GET'])
+def get_perevals_in_bbox():
+    """
+    Перевалы в прямоугольнике (GeoJSON)
+    ---
+    tags:
+      - Geo
+    parameters:
+      - in: query
+        name: bbox
+        type: string
+        required: true
+        description: min_lon,min_lat,max_lon,max_lat; min_lon > max_lon — через линию перемены дат
+      - in: query
+        name: limit
+        type: integer
+        required: false
+      - in: query
+        name: after
+        type: string
+        required: false
+        description: Курсор, полученный в поле next предыдущей страницы
+    responses:
+      200:
+        description: FeatureCollection точек по возрастанию id и курсор следующей страницы
+      400:
+        description: Некорректный bbox, limit или курсор
+    """
+    try:
+        bbox = geo.parse_bbox(request.args.get("bbox"))
+        limit = clamp_limit(request.args.get("limit", type=int))
+        after = request.args.get("after")
+        after_id = decode_key_cursor(after, (int,))[0] if after else 0
+        rows, next_id = db_handler.get_perevals_in_bbox(*bbox, limit=limit, after_id=after_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Ошибка поиска перевалов в прямоугольнике: {e}")
+        return jsonify({"error": str(e)}), 500
+    return geojson_response(geo.feature_collection(
+        rows, next=encode_key_cursor(next_id) if next_id is not None else None))
+
+
+@api.route('/perevals/near', methods=['GET'])
+def get_perevals_near():
+    """
+    Перевалы в радиусе от точки по возрастанию расстояния (GeoJSON)
+    ---
+    tags:
+      - Geo
+    parameters:
+      - in: query
+        name: lat
+        type: number
+        required: true
+      - in: query
+        name: lon
+        type: number
+        required: true
+      - in: query
+        name: radius_km
+        type: number
+        required: true
+      - in: query
+        name: limit
+        type: integer
+        required: false
+      - in: query
+        name: after
+        type: string
+        required: false
+        description: Курсор, полученный в поле next предыдущей страницы
+    responses:
+      200:
+        description: FeatureCollection с distance_km в свойствах и курсор следующей страницы
+      400:
+        description: Некорректные координаты, радиус, limit или курсор
+    """
+    try:
+        lat, lon = geo.check_point(request.args.get("lat", type=float), request.args.get("lon", type=float))
+        radius_km = request.args.get("radius_km", type=float)
+        if radius_km is None or not 0 < radius_km <= geo.MAX_RADIUS_KM:
+            raise ValueError(f"radius_km должен быть в пределах (0, {geo.MAX_RADIUS_KM}]")
+        limit = clamp_limit(request.args.get("limit", type=int))
+        after = request.args.get("after")
+        after = decode_key_cursor(after, (float, int)) if after else None
+        rows, next_key = db_handler.get_perevals_within(lat, lon, radius_km, limit, after)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Ошибка поиска перевалов в радиусе: {e}")
+        return jsonify({"error": str(e)}), 500
+    return geojson_response(geo.feature_collection(
+        rows, next=encode_key_cursor(*next_key) if next_key else None))
+
+
+@api.route('/perevals/nearest', methods=['GET'])
+def get_perevals_nearest():
+    """
+    Ближайшие к точке перевалы (GeoJSON)
+    ---
+    tags:
+      - Geo
+    parameters:
+      - in: query
+        name: lat
+        type: number
+        required: true
+      - in: query
+        name: lon
+        type: number
+        required: true
+      - in: query
+        name: k
+        type: integer
+        required: false
+        description: Сколько перевалов вернуть (по умолчанию 10, не больше 500)
+    responses:
+      200:
+        description: FeatureCollection по возрастанию расстояния
+      400:
+        description: Некорректные координаты или k
+    """
+    try:
+        lat, lon = geo.check_point(request.args.get("lat", type=float), request.args.get("lon", type=float))
+        k = clamp_limit(request.args.get("k", 10, type=int))
+        rows = db_handler.get_nearest_perevals(lat, lon, k)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Ошибка поиска ближайших перевалов: {e}")
+        return jsonify({"error": str(e)}), 500
+    return geojson_response(geo.feature_collection(rows))
+
+
+@api.route('/perevals/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_perevals_tile(z, x, y):
+    """
+    Перевалы в тайле карты z/x/y (GeoJSON) из сетки в памяти
+    ---
+    tags:
+      - Geo
+    parameters:
+      - in: path
+        name: z
+        type: integer
+        required: true
+      - in: path
+        name: x
+        type: integer
+        required: true
+      - in: path
+        name: y
+        type: integer
+        required: true
+    responses:
+      200:
+        description: FeatureCollection; truncated — в тайле больше FSTR_GEO_TILE_LIMIT точек
+      304:
+        description: Тайл не изменился (If-None-Match)
+      400:
+        description: Некорректный тайл
+    """
+    try:
+        bbox = geo.tile_bbox(z, x, y)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        grid = geo_cache.get("grid").data
+        rows = grid.query_bbox(*bbox, limit=GEO_TILE_LIMIT + 1)
+    except Exception as e:
+        logging.error(f"Ошибка получения тайла {z}/{x}/{y}: {e}")
+        return jsonify({"error": str(e)}), 500
+    body = serialization.dumps(geo.feature_collection(rows[:GEO_TILE_LIMIT], truncated=len(rows) > GEO_TILE_LIMIT))
+    response = Response(body, mimetype="application/geo+json")
+    response.set_etag(hashlib.sha256(body).hexdigest()[:32])
+    response.cache_control.public = True
+    response.cache_control.max_age = int(geo_cache.ttl)
+    return response.make_conditional(request)
+
+
+@api.route('/export', methods=['GET'])
+def export_perevals():
+    """
+    Потоковая выгрузка всех перевалов в NDJSON или CSV
+    ---
+    tags:
+      - Perevals
+    parameters:
+      - in: query
+        name: format
+        type: string
+        enum: [ndjson, csv]
+        required: false
+        description: Формат выгрузки (по умолчанию ndjson)
+      - in: query
+        name: status
+        type: string
+        enum: [new, pending, accepted, rejected]
+        required: false
+      - in: query
+        name: date_from
+        type: string
+        required: false
+        description: Начало диапазона date_added (ISO 8601, включительно)
+      - in: query
+        name: date_to
+        type: string
+        required: false
+        description: Конец диапазона date_added (ISO 8601, не включительно)
+    responses:
+      200:
+        description: Файл выгрузки
+      400:
+        description: Некорректные параметры фильтра
+    """
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Неизвестный формат: {fmt}"}), 400
+    try:
+        date_from = request.args.get("date_from")
+        date_to = request.args.get("date_to")
+        rows = db_handler.iter_export(
+            status=request.args.get("status"),
+            date_from=datetime.fromisoformat(date_from) if date_from else None,
+            date_to=datetime.fromisoformat(date_to) if date_to else None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    headers = {"Content-Disposition": f"attachment; filename=perevals.{fmt}"}
+    return Response(stream_with_context(serialize_export(rows, fmt)),
+                    mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+
+@api.route('/submitData', methods=['GET', 'POST'])
 def submit_data():
     """
     Добавление нового перевала
@@ -86,13 +817,23 @@ def submit_data():
                 properties:
                   url:
                     type: string
+      - in: header
+        name: Prefer
+        type: string
+        required: false
+        description: respond-async — принять заявку в очередь и ответить 202
     responses:
       201:
         description: Перевал добавлен
+      202:
+        description: Заявка принята в очередь, статус по status_url
     """
     if request.method == 'GET':
         return render_template("submit.html")
 
+    if request.is_json and wants_async(request):
+        return submit_data_async()
+
     try:
         raw_data, images = parse_input(request)
         if not raw_data:
@@ -105,11 +846,147 @@ def submit_data():
         else:
             return render_template("success.html", pereval_id=pereval_id)
     except Exception as e:
-        logging.error(f"Ошибка в submit_data: {e}")
-        return jsonify({"error": str(e)}), 500
+        logging.error(f"Ошибка в submit_data: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+def submit_data_async():
+    try:
+        raw_data, images = validate_pereval(request.get_json(silent=True))
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        tracking_id = ingest_queue.enqueue(raw_data, images)
+    except Exception as e:
+        logging.error(f"Ошибка постановки заявки в очередь: {e}")
+        return jsonify({"error": str(e)}), 500
+    status_url = url_for('.ingest_status', tracking_id=tracking_id)
+    response = jsonify({"success": True, "message": "Заявка принята", "tracking_id": tracking_id,
+                        "status_url": status_url})
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
+
+@api.route('/submitData/queue/<tracking_id>', methods=['GET'])
+def ingest_status(tracking_id):
+    """
+    Статус заявки из очереди асинхронного приёма
+    ---
+    tags:
+      - Perevals
+    parameters:
+      - in: path
+        name: tracking_id
+        required: true
+        type: string
+    responses:
+      200:
+        description: status — queued, done (pereval_id заполнен) или failed (error заполнен)
+      404:
+        description: Заявка не найдена
+    """
+    try:
+        status = ingest_queue.get_status(tracking_id)
+        if not status:
+            return jsonify({"error": "Заявка не найдена"}), 404
+        return jsonify(status), 200
+    except Exception as e:
+        logging.error(f"Ошибка получения статуса заявки {tracking_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/submitData/queue', methods=['GET'])
+def ingest_stats():
+    """
+    Состояние очереди асинхронного приёма
+    ---
+    tags:
+      - Perevals
+    responses:
+      200:
+        description: Число заявок по статусам и возраст самой старой неперенесённой
+    """
+    try:
+        return jsonify(ingest_queue.stats()), 200
+    except Exception as e:
+        logging.error(f"Ошибка получения состояния очереди: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/submitData/batch', methods=['POST'])
+def submit_data_batch():
+    """
+    Пакетное добавление перевалов одной транзакцией
+    ---
+    tags:
+      - Perevals
+    consumes:
+      - application/json
+      - application/x-ndjson
+    parameters:
+      - in: query
+        name: partial
+        type: boolean
+        required: false
+        description: Добавить корректные записи, даже если часть элементов с ошибками
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              raw_data:
+                type: object
+              images:
+                type: array
+                items:
+                  type: object
+    responses:
+      201:
+        description: Все перевалы добавлены, pereval_ids в порядке элементов запроса
+      207:
+        description: Добавлены только корректные элементы (partial=true), ошибки в errors
+      400:
+        description: Ошибки проверки, ничего не добавлено
+      413:
+        description: Слишком много элементов
+    """
+    partial = request.args.get("partial", "false").lower() in ("1", "true", "yes")
+    try:
+        batch = parse_batch(request)
+    except ValidationError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if len(batch) > BATCH_MAX_ITEMS:
+        return jsonify({"success": False, "error": f"Не больше {BATCH_MAX_ITEMS} элементов в запросе"}), 413
+
+    valid, errors = [], []
+    for index, data, error in batch:
+        if error is None:
+            try:
+                valid.append((index, validate_pereval(data)))
+                continue
+            except ValidationError as e:
+                error = str(e)
+        errors.append({"index": index, "error": error})
+
+    if errors and not partial:
+        return jsonify({"success": False, "errors": errors}), 400
+    try:
+        ids = db_handler.add_perevals_batch([item for _, item in valid])
+    except Exception as e:
+        logging.error(f"Ошибка в submit_data_batch: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    pereval_ids = [None] * len(batch)
+    for (index, _), pereval_id in zip(valid, ids):
+        pereval_ids[index] = pereval_id
+    return jsonify({"success": not errors, "pereval_ids": pereval_ids, "errors": errors}), (207 if errors else 201)
 
 
-@app.route('/submitData/<int:pereval_id>', methods=['GET'])
+@api.route('/submitData/<int:pereval_id>', methods=['GET'])
 def get_pereval(pereval_id):
     """
     Получить перевал по ID
@@ -121,32 +998,67 @@ def get_pereval(pereval_id):
         name: pereval_id
         required: true
         type: integer
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
     responses:
       200:
-        description: Информация о перевале
+        description: Информация о перевале; ETag и Last-Modified для условных запросов
+      304:
+        description: Перевал не изменился (If-None-Match или If-Modified-Since)
+      404:
+        description: Перевал не найден
     """
     try:
-        pereval = db_handler.get_pereval_by_id(pereval_id)
+        if pereval_cache is not None:
+            reference_cache.ensure_listener()
+            entry = pereval_cache.get(pereval_id)
+            if entry is None:
+                return jsonify({"error": "Перевал не найден"}), 404
+            if not_modified(entry.etag, entry.last_modified):
+                return validated_response(Response(status=304, mimetype="application/json"),
+                                          entry.etag, entry.last_modified)
+            return validated_response(Response(entry.body, mimetype="application/json"),
+                                      entry.etag, entry.last_modified)
+
+        # Сначала только версия: при совпадении с If-None-Match/If-Modified-Since тело не читается
+        version = db_handler.get_pereval_version(pereval_id)
+        if not version:
+            return jsonify({"error": "Перевал не найден"}), 404
+        if not_modified(version['etag'], version['last_modified']):
+            return validated_response(Response(status=304, mimetype="application/json"),
+                                      version['etag'], version['last_modified'])
+        # Тело и версия — одним запросом: строка могла измениться после проверки
+        pereval, version = db_handler.get_pereval_with_version(pereval_id)
         if not pereval:
             return jsonify({"error": "Перевал не найден"}), 404
-        return jsonify(pereval), 200
+        return validated_response(jsonify(pereval), version['etag'], version['last_modified'])
     except Exception as e:
         logging.error(f"Ошибка при получении перевала {pereval_id}: {e}")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/submitData/<int:pereval_id>', methods=['PATCH'])
+@api.route('/submitData/<int:pereval_id>', methods=['PATCH'])
 def update_pereval(pereval_id):
     """
-    Обновить перевал, если статус 'new'
+    Обновить перевал, если статус 'new' (JSON merge-patch, RFC 7396)
     ---
     tags:
       - Perevals
+    consumes:
+      - application/merge-patch+json
+      - application/json
     parameters:
       - in: path
         name: pereval_id
         required: true
         type: integer
+      - in: header
+        name: If-Match
+        type: string
+        required: false
+        description: ETag из GET /submitData/<id>; без него версия не проверяется
       - in: body
         name: body
         required: true
@@ -155,27 +1067,42 @@ def update_pereval(pereval_id):
           properties:
             raw_data:
               type: object
+              description: Сливается с текущим raw_data; null удаляет ключ
             images:
               type: array
+              description: Заменяет список изображений целиком
               items:
                 type: object
     responses:
       200:
-        description: Успешное обновление
+        description: Успешное обновление; ETag новой версии
+      400:
+        description: Статус не 'new', изменение защищённого поля или некорректное тело
+      404:
+        description: Перевал не найден
+      412:
+        description: Версия не совпадает с If-Match
     """
     try:
         data = request.get_json()
         if not data:
             return jsonify({"state": 0, "message": "Нет данных для обновления"}), 400
 
-        success, message = db_handler.update_pereval(pereval_id, data)
-        return jsonify({"state": 1 if success else 0, "message": message}), (200 if success else 400)
+        outcome, version, message = db_handler.patch_pereval(pereval_id, data, if_match_versions(pereval_id))
+        if outcome != "updated":
+            status = {"not_found": 404, "version_mismatch": 412}.get(outcome, 400)
+            return jsonify({"state": 0, "message": message}), status
+        response = jsonify({"state": 1, "message": message, "version": version})
+        response.set_etag(f"{pereval_id}-{version}")
+        return response, 200
+    except ValueError as e:
+        return jsonify({"state": 0, "message": str(e)}), 400
     except Exception as e:
         logging.error(f"Ошибка при обновлении перевала {pereval_id}: {e}")
         return jsonify({"state": 0, "message": str(e)}), 500
 
 
-@app.route('/userPerevals', methods=['GET'])
+@api.route('/userPerevals', methods=['GET'])
 def get_perevals_by_email():
     """
     Получить перевалы пользователя по email
@@ -187,22 +1114,295 @@ def get_perevals_by_email():
         name: user__email
         required: true
         type: string
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
     responses:
       200:
-        description: Список перевалов пользователя
+        description: Список перевалов пользователя; ETag для условных запросов
+      304:
+        description: Список не изменился
     """
     email = request.args.get("user__email")
     if not email:
         return jsonify({"error": "Укажите параметр user__email"}), 400
     try:
-        perevals = db_handler.get_perevals_by_email(email)
-        return jsonify(perevals), 200
+        # Передача из БД и разбор дают разные байты, поэтому режим входит в ETag
+        etag = f"{db_handler.get_perevals_by_email_version(email)}-{'p' if JSON_PASSTHROUGH else 'd'}"
+        if not_modified(etag):
+            return validated_response(Response(status=304, mimetype="application/json"), etag)
+        perevals = db_handler.get_perevals_by_email(email, raw_json=JSON_PASSTHROUGH)
+        if JSON_PASSTHROUGH:
+            return validated_response(Response(json_array(perevals), mimetype="application/json"), etag)
+        return validated_response(jsonify(perevals), etag)
     except Exception as e:
         logging.error(f"Ошибка при получении перевалов по email {email}: {e}")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/areas', methods=['GET'])
+# ----------------- Синхронизация офлайн-клиентов -----------------
+@api.route('/sync', methods=['GET'])
+def sync_changes():
+    """
+    Изменения перевалов пользователя и справочников после курсора
+    ---
+    tags:
+      - Sync
+    parameters:
+      - in: query
+        name: user__email
+        type: string
+        required: false
+        description: Email пользователя; без него синхронизируются только справочники
+      - in: query
+        name: cursor
+        type: string
+        required: false
+        description: Курсор из прошлого ответа; без него — полная синхронизация
+      - in: query
+        name: limit
+        type: integer
+        required: false
+    responses:
+      200:
+        description: >
+          {"changes": {"perevals"|"areas"|"activities": {"upserted": [...], "deleted": [id]}},
+          "cursor", "has_more", "reset"}. Сначала применяются deleted, затем upserted; при reset
+          локальные данные заменяются целиком; пока has_more, запрос повторяется с новым курсором
+      400:
+        description: Некорректный limit или курсор
+    """
+    email = request.args.get("user__email") or None
+    try:
+        result = db_handler.get_sync_changes(email, request.args.get("cursor"),
+                                             request.args.get("limit", type=int))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Ошибка при синхронизации: {e}")
+        return jsonify({"error": str(e)}), 500
+    # Строки уже сериализованы в БД — склеиваем ответ без разбора
+    changes = b",".join(
+        serialization.dumps(name) + b':{"upserted":' + json_array(entry["upserted"])
+        + b',"deleted":' + serialization.dumps(entry["deleted"]) + b'}'
+        for name, entry in result["changes"].items()
+    )
+    body = (b'{"changes":{' + changes + b'},"cursor":' + serialization.dumps(result["cursor"])
+            + b',"has_more":' + serialization.dumps(result["has_more"])
+            + b',"reset":' + serialization.dumps(result["reset"]) + b'}')
+    response = Response(body, mimetype="application/json")
+    response.cache_control.no_store = True
+    return response, 200
+
+
+# ----------------- Статистика -----------------
+@api.route('/stats', methods=['GET'])
+def pereval_stats():
+    """
+    Число перевалов по областям, статусам, категориям трудности, высоте и месяцу добавления
+    ---
+    tags:
+      - Stats
+    parameters:
+      - in: query
+        name: dimensions
+        type: string
+        required: false
+        description: Разрезы через запятую (area, status, level, height, month); по умолчанию все
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+    responses:
+      200:
+        description: >
+          {"total": n, "area": {"<id>": n}, "status": {...}, "level": {"summer": {...}, ...},
+          "height": {"<от, м>": n}, "month": {"YYYY-MM": n}}; "" — значение не указано.
+          Область считается вместе с подобластями, высота — интервалами по 500 м
+      304:
+        description: Статистика не изменилась
+      400:
+        description: Неизвестный разрез
+    """
+    dimensions = request.args.get("dimensions")
+    try:
+        stats = db_handler.get_pereval_stats(dimensions.split(",") if dimensions else None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Ошибка при получении статистики: {e}")
+        return jsonify({"error": str(e)}), 500
+    body = serialization.dumps(stats)
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    if not_modified(etag):
+        return validated_response(Response(status=304, mimetype="application/json"), etag)
+    return validated_response(Response(body, mimetype="application/json"), etag)
+
+
+# ----------------- Очередь модерации -----------------
+def moderation_request():
+    """Тело запроса модерации: JSON-объект с непустым moderator."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError("Ожидается JSON-объект")
+    moderator = data.get("moderator")
+    if not isinstance(moderator, str) or not moderator.strip():
+        raise ValueError("Укажите moderator")
+    return data, moderator.strip()
+
+
+def moderation_ids(data):
+    ids = data.get("ids")
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise ValueError("ids: ожидается непустой список целых id")
+    if len(ids) > MODERATION_BULK_MAX:
+        raise ValueError(f"Не больше {MODERATION_BULK_MAX} id в одном запросе")
+    return ids
+
+
+def moderation_lease(data):
+    lease = data.get("lease_seconds", MODERATION_LEASE)
+    if not isinstance(lease, int) or isinstance(lease, bool) or not 1 <= lease <= MODERATION_LEASE_MAX:
+        raise ValueError(f"lease_seconds: ожидается целое число от 1 до {MODERATION_LEASE_MAX}")
+    return lease
+
+
+@api.route('/moderation/claim', methods=['POST'])
+def claim_moderation():
+    """
+    Взять в работу следующие заявки из очереди модерации
+    ---
+    tags:
+      - Moderation
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required: [moderator]
+          properties:
+            moderator:
+              type: string
+            limit:
+              type: integer
+              description: Сколько заявок взять (по умолчанию 10, не больше 100)
+            lease_seconds:
+              type: integer
+              description: Срок аренды, с (не больше недели); по истечении заявка возвращается в очередь
+    responses:
+      200:
+        description: Захваченные заявки (статус pending) и срок аренды
+    """
+    try:
+        data, moderator = moderation_request()
+        limit = min(clamp_limit(data.get("limit", 10)), MODERATION_CLAIM_MAX)
+        lease = moderation_lease(data)
+        items = db_handler.claim_perevals(moderator, limit, lease)
+        return jsonify({"items": items}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Ошибка захвата заявок: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/moderation/decision', methods=['POST'])
+def decide_moderation():
+    """
+    Принять или отклонить несколько заявок одним запросом
+    ---
+    tags:
+      - Moderation
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required: [moderator, ids, status]
+          properties:
+            moderator:
+              type: string
+            ids:
+              type: array
+              items:
+                type: integer
+            status:
+              type: string
+              enum: [accepted, rejected]
+    responses:
+      200:
+        description: updated — изменённые id; skipped — уже решённые или взятые другим модератором
+    """
+    try:
+        data, moderator = moderation_request()
+        ids = moderation_ids(data)
+        updated = db_handler.transition_perevals(moderator, ids, data.get("status"))
+        done = set(updated)
+        return jsonify({"updated": updated, "skipped": [i for i in ids if i not in done]}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Ошибка смены статуса заявок: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/moderation/release', methods=['POST'])
+def release_moderation():
+    """
+    Вернуть взятые заявки в очередь
+    ---
+    tags:
+      - Moderation
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required: [moderator, ids]
+          properties:
+            moderator:
+              type: string
+            ids:
+              type: array
+              items:
+                type: integer
+    responses:
+      200:
+        description: released — id, возвращённые в статус new
+    """
+    try:
+        data, moderator = moderation_request()
+        return jsonify({"released": db_handler.release_perevals(moderator, moderation_ids(data))}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Ошибка возврата заявок в очередь: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/moderation/queue', methods=['GET'])
+def moderation_stats():
+    """
+    Состояние очереди модерации
+    ---
+    tags:
+      - Moderation
+    responses:
+      200:
+        description: Новые заявки, заявки в работе и с истёкшей арендой, возраст самой старой новой, с
+    """
+    try:
+        return jsonify(db_handler.get_moderation_stats()), 200
+    except Exception as e:
+        logging.error(f"Ошибка получения состояния очереди модерации: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/areas', methods=['GET'])
 def get_areas():
     """
     Получить все области
@@ -212,16 +1412,118 @@ def get_areas():
     responses:
       200:
         description: Список областей
+      304:
+        description: Справочник не изменился (совпал If-None-Match)
     """
     try:
-        areas = db_handler.get_all_areas()
-        return jsonify(areas), 200
+        return reference_response("areas")
     except Exception as e:
         logging.error(f"Ошибка получения областей: {e}")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/activities', methods=['GET'])
+@api.route('/areas/tree', methods=['GET'])
+def get_areas_tree():
+    """
+    Получить области вложенным деревом
+    ---
+    tags:
+      - Areas
+    parameters:
+      - in: query
+        name: root
+        type: integer
+        required: false
+        description: Вернуть только поддерево этой области
+    responses:
+      200:
+        description: Дерево областей (поле children у каждого узла)
+      404:
+        description: Область не найдена
+    """
+    root = request.args.get("root", type=int)
+    try:
+        if root is None:
+            return reference_response("area_tree")
+        tree = reference_cache.get("area_tree").data
+        if root not in tree:
+            return jsonify({"error": "Область не найдена"}), 404
+        return jsonify(tree.nested(root)), 200
+    except Exception as e:
+        logging.error(f"Ошибка получения дерева областей: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/areas/<int:area_id>/path', methods=['GET'])
+def get_area_path(area_id):
+    """
+    Получить путь от корня до области
+    ---
+    tags:
+      - Areas
+    parameters:
+      - in: path
+        name: area_id
+        required: true
+        type: integer
+    responses:
+      200:
+        description: Список областей от корня до запрошенной
+      404:
+        description: Область не найдена
+    """
+    try:
+        tree = reference_cache.get("area_tree").data
+        if area_id not in tree:
+            return jsonify({"error": "Область не найдена"}), 404
+        return jsonify(tree.path(area_id)), 200
+    except Exception as e:
+        logging.error(f"Ошибка получения пути к области {area_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/areas/<int:area_id>/perevals', methods=['GET'])
+def get_area_perevals(area_id):
+    """
+    Получить перевалы области, включая все подобласти
+    ---
+    tags:
+      - Areas
+    parameters:
+      - in: path
+        name: area_id
+        required: true
+        type: integer
+      - in: query
+        name: limit
+        type: integer
+        required: false
+      - in: query
+        name: after
+        type: string
+        required: false
+        description: Курсор, полученный в поле next предыдущей страницы
+    responses:
+      200:
+        description: Страница перевалов и курсор следующей страницы
+      404:
+        description: Область не найдена
+    """
+    try:
+        if area_id not in reference_cache.get("area_tree").data:
+            return jsonify({"error": "Область не найдена"}), 404
+        limit = clamp_limit(request.args.get("limit", type=int))
+        perevals, next_cursor = db_handler.get_perevals_by_area(area_id, limit, request.args.get("after"),
+                                                                raw_json=JSON_PASSTHROUGH)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Ошибка получения перевалов области {area_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+    return page_response(perevals, next_cursor)
+
+
+@api.route('/activities', methods=['GET'])
 def get_activities():
     """
     Получить все типы активности
@@ -231,44 +1533,194 @@ def get_activities():
     responses:
       200:
         description: Список активностей
+      304:
+        description: Справочник не изменился (совпал If-None-Match)
     """
     try:
-        activities = db_handler.get_activities_types()
-        return jsonify(activities), 200
+        return reference_response("activities")
     except Exception as e:
         logging.error(f"Ошибка получения активностей: {e}")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/uploadImage', methods=['POST'])
+@api.route('/poolStats', methods=['GET'])
+def get_pool_stats():
+    """
+    Статистика пула соединений с БД
+    ---
+    tags:
+      - Service
+    responses:
+      200:
+        description: Размер пула, число выдач соединений и время ожидания
+    """
+    return jsonify(db_handler.pool_stats()), 200
+
+
+@api.route('/replicaStats', methods=['GET'])
+def get_replica_stats():
+    """
+    Основной сервер и реплики для чтения
+    ---
+    tags:
+      - Service
+    responses:
+      200:
+        description: LSN основного сервера, отставание и доступность реплик, выдачи соединений по серверам
+    """
+    return jsonify(db_handler.routing_stats()), 200
+
+
+@api.route('/cacheStats', methods=['GET'])
+def get_cache_stats():
+    """
+    Статистика кэша перевалов
+    ---
+    tags:
+      - Service
+    responses:
+      200:
+        description: Размер кэша, попадания (в памяти и в общем хранилище), промахи, вытеснения и сбросы
+    """
+    return jsonify({"pereval": pereval_cache.stats() if pereval_cache is not None else None}), 200
+
+
+# ----------------- Документация API -----------------
+_built_spec = None
+
+
+@api.route('/apispec_1.json', methods=['GET'])
+def get_openapi_spec():
+    # Без собранного файла (локальная разработка) спецификация строится один раз при первом запросе
+    global _built_spec
+    if os.path.exists(openapi.SPEC_PATH):
+        return send_file(openapi.SPEC_PATH, mimetype="application/json", conditional=True)
+    if _built_spec is None:
+        _built_spec = openapi.dumps_spec(openapi.build_spec())
+    return Response(_built_spec, mimetype="application/json")
+
+
+@api.route('/apidocs/', methods=['GET'])
+def apidocs():
+    return render_template("apidocs.html")
+
+
+@api.route('/flasgger_static/<path:filename>', methods=['GET'])
+def flasgger_static(filename):
+    # Файлы Swagger UI из пакета flasgger; сам flasgger при этом не импортируется
+    package_dir = importlib.util.find_spec("flasgger").submodule_search_locations[0]
+    return send_from_directory(os.path.join(package_dir, "ui3", "static"), filename, max_age=IMAGE_MAX_AGE)
+
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Метрики в формате Prometheus
+    ---
+    tags:
+      - Service
+    produces:
+      - text/plain
+    responses:
+      200:
+        description: Время запросов по маршрутам, время и число строк по методам DatabaseHandler, ожидание пула
+    """
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+@api.route('/uploadImage', methods=['POST'])
 def upload_image():
     """
     Загрузить изображение
     ---
     tags:
       - Images
+    description: >
+      Файл передаётся полем image в multipart/form-data либо телом запроса
+      с Content-Type image/*. Размер ограничен FSTR_MAX_IMAGE_SIZE. Тип определяется
+      по содержимому (JPEG, PNG, GIF, WebP, HEIC, AVIF), Content-Type клиента не используется.
     parameters:
       - in: formData
         name: image
         type: file
-        required: true
+        required: false
     responses:
       200:
         description: ID загруженного изображения
+      413:
+        description: Файл слишком большой
+      415:
+        description: Файл не является изображением поддерживаемого формата
     """
-    if 'image' not in request.files:
-        return jsonify({"error": "Нет файла в запросе"}), 400
-    file = request.files['image']
-    img_bytes = file.read()
     try:
-        image_id = db_handler.add_image(img_bytes)
-        return jsonify({"image_id": image_id}), 200
+        if request.mimetype == "multipart/form-data":
+            _, blobs = stream_uploads(request, "image")
+            if not blobs:
+                return jsonify({"error": "Нет файла в запросе"}), 400
+            blob = blobs[0]
+        elif request.mimetype.startswith("image/") or request.mimetype == "application/octet-stream":
+            blob = blob_storage.put(request.stream, max_size=MAX_IMAGE_SIZE)
+        else:
+            return jsonify({"error": "Нет файла в запросе"}), 400
+        image_id = db_handler.add_image_blob(blob)
+        derivatives.schedule(blob.key)
+        return jsonify({"image_id": image_id, "sha256": blob.key, "size": blob.size, "mimetype": blob.mimetype}), 200
     except Exception as e:
-        logging.error(f"Ошибка загрузки изображения: {e}")
-        return jsonify({"error": str(e)}), 500
+        return upload_error_response(e)
+
+
+@api.route('/submitData/<int:pereval_id>/images', methods=['POST'])
+def upload_pereval_images(pereval_id):
+    """
+    Загрузить несколько фотографий перевала одним запросом
+    ---
+    tags:
+      - Images
+    consumes:
+      - multipart/form-data
+    parameters:
+      - in: path
+        name: pereval_id
+        required: true
+        type: integer
+      - in: formData
+        name: images
+        type: file
+        required: true
+        description: Файлы (поле повторяется, не больше FSTR_MAX_IMAGES_PER_REQUEST)
+      - in: formData
+        name: titles
+        type: string
+        required: false
+        description: Подписи к файлам в том же порядке (поле повторяется)
+    responses:
+      201:
+        description: Изображения добавлены к перевалу
+      404:
+        description: Перевал не найден
+      413:
+        description: Файл слишком большой или файлов слишком много
+      415:
+        description: Один из файлов не является изображением поддерживаемого формата
+    """
+    if request.mimetype != "multipart/form-data":
+        return jsonify({"error": "Ожидается multipart/form-data"}), 400
+    try:
+        form, blobs = stream_uploads(request, "images")
+        if not blobs:
+            return jsonify({"error": "Нет файлов в запросе"}), 400
+        items = db_handler.add_pereval_images(pereval_id, blobs, form.getlist("titles"))
+        if items is None:
+            return jsonify({"error": "Перевал не найден"}), 404
+        for blob in blobs:
+            derivatives.schedule(blob.key)
+        return jsonify({"pereval_id": pereval_id, "images": items}), 201
+    except Exception as e:
+        return upload_error_response(e)
 
 
-@app.route('/images/<int:image_id>', methods=['GET'])
+@api.route('/images/<int:image_id>', methods=['GET'])
 def get_image(image_id):
     """
     Получить изображение по ID
@@ -280,15 +1732,51 @@ def get_image(image_id):
         name: image_id
         required: true
         type: integer
+      - in: query
+        name: size
+        type: string
+        enum: [thumb, medium]
+        required: false
+        description: Уменьшенная копия; формат (WebP/JPEG) выбирается по заголовку Accept
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+      - in: header
+        name: Range
+        type: string
+        required: false
     responses:
       200:
         description: Изображение
+      206:
+        description: Запрошенный диапазон байтов
+      304:
+        description: Изображение не изменилось
     """
+    size = request.args.get("size")
+    if size is not None and size not in DERIVATIVE_SIZES:
+        return jsonify({"error": f"Неизвестный размер: {size}"}), 400
     try:
-        img = db_handler.get_image_by_id(image_id)
-        if not img:
+        meta = db_handler.get_image_meta(image_id)
+        if not meta:
             return jsonify({"error": "Изображение не найдено"}), 404
-        return send_file(BytesIO(img), mimetype='image/jpeg')
+        if meta['sha256']:
+            key = meta['sha256']
+            if size:
+                fmt = negotiate_format(request.headers.get("Accept"))
+                path = derivatives.get_or_create(key, size, fmt)
+                if path:
+                    response = image_file_response(path, DERIVATIVE_FORMATS[fmt], etag=f"{key}-{size}-{fmt}")
+                    response.vary.add("Accept")
+                    return response
+                # Производная пока недоступна — отдаём оригинал
+            # Файл отдаётся с диска через wsgi.file_wrapper (sendfile), Range и 304 обрабатывает werkzeug
+            source = blob_storage.local_path(key) or blob_storage.open(key)
+            return image_file_response(source, meta['mimetype'], etag=key, last_modified=meta['date_added'])
+        # Запись ещё не перенесена из bytea (см. migrate_images.py)
+        img = bytes(db_handler.get_image_by_id(image_id))
+        return image_file_response(BytesIO(img), sniff_mimetype(img[:16]), etag=hashlib.sha256(img).hexdigest())
     except Exception as e:
         logging.error(f"Ошибка получения изображения {image_id}: {e}")
         return jsonify({"error": str(e)}), 500
@@ -296,5 +1784,5 @@ def get_image(image_id):
 
 # ----------------- Запуск приложения -----------------
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=int(os.getenv("PORT", 10000)), debug=True)
+    create_app().run(host='0.0.0.0', port=int(os.getenv("PORT", 10000)), debug=True)
 
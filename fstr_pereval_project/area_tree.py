@@ -0,0 +1,79 @@
+# ----------------- Дерево областей -----------------
+class AreaTree:
+    """
+    Индекс иерархии pereval_areas (список смежности id_parent) в памяти.
+    Строится один раз за O(n); при обходе в глубину каждому узлу назначается
+    интервал [enter, leave), поэтому проверка «узел в поддереве» выполняется
+    за O(1), а выборка поддерева — за O(размер поддерева).
+    """
+
+    def __init__(self, rows):
+        self.nodes = {}
+        self.children = {}
+        self.roots = []
+        for row in rows:
+            self.nodes[row['id']] = {"id": row['id'], "id_parent": row['id_parent'], "title": row['title']}
+        for area_id, node in sorted(self.nodes.items()):
+            parent = node['id_parent']
+            # Корень ссылается сам на себя (0 -> 0) или на несуществующую запись
+            if parent == area_id or parent not in self.nodes:
+                self.roots.append(area_id)
+            else:
+                self.children.setdefault(parent, []).append(area_id)
+        self.order = []
+        self.enter = {}
+        self.leave = {}
+        self._number()
+
+    def _number(self):
+        stack = [(root, False) for root in reversed(self.roots)]
+        while stack:
+            area_id, done = stack.pop()
+            if done:
+                self.leave[area_id] = len(self.order)
+                continue
+            if area_id in self.enter:
+                continue  # защита от циклов в данных
+            self.enter[area_id] = len(self.order)
+            self.order.append(area_id)
+            stack.append((area_id, True))
+            for child in reversed(self.children.get(area_id, [])):
+                stack.append((child, False))
+
+    def __contains__(self, area_id):
+        return area_id in self.enter
+
+    def is_descendant(self, area_id, ancestor_id):
+        return self.enter[ancestor_id] <= self.enter[area_id] < self.leave[ancestor_id]
+
+    def descendants(self, area_id, include_self=True):
+        """id всех узлов поддерева в порядке обхода."""
+        start = self.enter[area_id] + (0 if include_self else 1)
+        return self.order[start:self.leave[area_id]]
+
+    def path(self, area_id):
+        """Узлы от корня до area_id включительно."""
+        path = []
+        current = area_id
+        while current in self.nodes and current not in path:
+            path.append(current)
+            parent = self.nodes[current]['id_parent']
+            if parent == current or parent not in self.enter:
+                break
+            current = parent
+        return [dict(self.nodes[n]) for n in reversed(path)]
+
+    def nested(self, root_id=None):
+        """Вложенное представление: [{"id", "id_parent", "title", "children": [...]}]."""
+        roots = self.roots if root_id is None else [root_id]
+        result = []
+        built = {}
+        # Узлы собираются снизу вверх, чтобы не упереться в лимит рекурсии
+        for root in roots:
+            ids = self.descendants(root)
+            for area_id in reversed(ids):
+                node = dict(self.nodes[area_id])
+                node['children'] = [built.pop(c) for c in self.children.get(area_id, []) if c in built]
+                built[area_id] = node
+            result.append(built.pop(root))
+        return result
@@ -0,0 +1,229 @@
+"""
+ASGI-вариант API для запуска воркерами uvicorn:
+
+    gunicorn -w 4 -k uvicorn.workers.UvicornWorker asgi_app:app
+
+Отдаёт те же маршруты, что и app.py (/submitData, /submitData/<id>, /userPerevals,
+/areas, /activities, /images/<id>, /poolStats), но ожидание PostgreSQL и передача
+файлов не занимают воркер: запросы к БД идут через пул asyncpg, а блокирующие
+операции с хранилищем — в пуле потоков. Проверка и сериализация общие с app.py.
+"""
+import os
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from async_database_handler import AsyncDatabaseHandler
+from blob_storage import CHUNK_SIZE, get_blob_storage, image_response_headers, sniff_mimetype
+from database_handler import DatabaseHandler
+from image_derivatives import DERIVATIVE_FORMATS, DERIVATIVE_SIZES, get_derivative_store, negotiate_format
+from reference_cache import AsyncReferenceCache
+import serialization
+from serialization import dumps, json_array
+from validation import ValidationError, validate_pereval
+
+# ----------------- Настройка окружения и логирования -----------------
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
+
+# ----------------- Подключение к базе -----------------
+db_handler = AsyncDatabaseHandler()
+# Хранилище файлов синхронное; DatabaseHandler нужен ему только для бэкенда pg_large_object
+blob_storage = get_blob_storage(db_handler=DatabaseHandler())
+derivatives = get_derivative_store(blob_storage)
+
+# ----------------- Кэш справочников -----------------
+reference_cache = AsyncReferenceCache(ttl=float(os.getenv("FSTR_REFERENCE_TTL", 300)))
+reference_cache.register("areas", db_handler.get_all_areas, tables=["pereval_areas"])
+reference_cache.register("activities", db_handler.get_activities_types, tables=["spr_activities_types"])
+
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+
+# ----------------- Вспомогательные функции -----------------
+def json_response(data, status_code=200, headers=None):
+    return Response(dumps(data), status_code=status_code, media_type="application/json", headers=headers)
+
+
+def etag_matches(request, etag):
+    """Совпадает ли If-None-Match с ETag (в кавычках)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def cached_file_response(request, path, mimetype, etag, vary=None):
+    etag = f'"{etag}"'
+    # Тип только из списка изображений и nosniff — как image_file_response во Flask-приложении
+    mimetype, headers = image_response_headers(mimetype)
+    headers.update({"ETag": etag, "Cache-Control": f"public, max-age={IMAGE_MAX_AGE}"})
+    if vary:
+        headers["Vary"] = vary
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    # FileResponse отдаёт файл по частям и сам обрабатывает Range
+    return FileResponse(path, media_type=mimetype, headers=headers)
+
+
+def iter_blob(stream):
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        stream.close()
+
+
+async def reference_response(request, name):
+    """Справочник из кэша: готовое тело, ETag и 304 при совпадении If-None-Match."""
+    entry = await reference_cache.get(name)
+    etag = f'"{entry.etag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+# ----------------- Эндпоинты -----------------
+async def submit_data(request):
+    try:
+        data = serialization.loads(await request.body())
+    except ValueError:
+        data = None
+    try:
+        raw_data, images = validate_pereval(data)
+    except ValidationError as e:
+        return json_response({"error": str(e)}, 400)
+    try:
+        pereval_id = await db_handler.add_pereval(raw_data, images)
+        return json_response({"success": True, "message": "Перевал добавлен", "pereval_id": pereval_id}, 201)
+    except Exception as e:
+        logging.error(f"Ошибка в submit_data: {e}")
+        return json_response({"error": str(e)}, 500)
+
+
+async def get_pereval(request):
+    pereval_id = request.path_params['pereval_id']
+    try:
+        pereval = await db_handler.get_pereval_by_id(pereval_id)
+        if not pereval:
+            return json_response({"error": "Перевал не найден"}, 404)
+        return json_response(pereval)
+    except Exception as e:
+        logging.error(f"Ошибка при получении перевала {pereval_id}: {e}")
+        return json_response({"error": str(e)}, 500)
+
+
+async def get_perevals_by_email(request):
+    email = request.query_params.get("user__email")
+    if not email:
+        return json_response({"error": "Укажите параметр user__email"}, 400)
+    try:
+        # Строки JSON из БД без разбора, как в app.py
+        perevals = await db_handler.get_perevals_by_email(email, raw_json=True)
+        return Response(json_array(perevals), media_type="application/json")
+    except Exception as e:
+        logging.error(f"Ошибка при получении перевалов по email {email}: {e}")
+        return json_response({"error": str(e)}, 500)
+
+
+async def get_areas(request):
+    try:
+        return await reference_response(request, "areas")
+    except Exception as e:
+        logging.error(f"Ошибка получения областей: {e}")
+        return json_response({"error": str(e)}, 500)
+
+
+async def get_activities(request):
+    try:
+        return await reference_response(request, "activities")
+    except Exception as e:
+        logging.error(f"Ошибка получения активностей: {e}")
+        return json_response({"error": str(e)}, 500)
+
+
+async def get_pool_stats(request):
+    return json_response(db_handler.pool_stats())
+
+
+async def get_image(request):
+    image_id = request.path_params['image_id']
+    size = request.query_params.get("size")
+    if size is not None and size not in DERIVATIVE_SIZES:
+        return json_response({"error": f"Неизвестный размер: {size}"}, 400)
+    try:
+        meta = await db_handler.get_image_meta(image_id)
+        if not meta:
+            return json_response({"error": "Изображение не найдено"}, 404)
+        if meta['sha256']:
+            key = meta['sha256']
+            if size:
+                fmt = negotiate_format(request.headers.get("accept"))
+                # Декодирование может ждать свободный слот — не в цикле событий
+                path = await run_in_threadpool(derivatives.get_or_create, key, size, fmt)
+                if path:
+                    return cached_file_response(request, path, DERIVATIVE_FORMATS[fmt],
+                                                f"{key}-{size}-{fmt}", vary="Accept")
+            path = blob_storage.local_path(key)
+            if path:
+                return cached_file_response(request, path, meta['mimetype'], key)
+            mimetype, headers = image_response_headers(meta['mimetype'])
+            headers.update({"ETag": f'"{key}"', "Cache-Control": f"public, max-age={IMAGE_MAX_AGE}"})
+            if etag_matches(request, headers["ETag"]):
+                return Response(status_code=304, headers=headers)
+            # Бэкенд без файлов на диске (large objects) читается в пуле потоков
+            stream = await run_in_threadpool(blob_storage.open, key)
+            return StreamingResponse(iterate_in_threadpool(iter_blob(stream)), media_type=mimetype, headers=headers)
+        # Запись ещё не перенесена из bytea (см. migrate_images.py)
+        img = bytes(await db_handler.get_image_by_id(image_id))
+        etag = f'"{hashlib.sha256(img).hexdigest()}"'
+        mimetype, headers = image_response_headers(sniff_mimetype(img[:16]))
+        headers.update({"ETag": etag, "Cache-Control": f"public, max-age={IMAGE_MAX_AGE}"})
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(img, media_type=mimetype, headers=headers)
+    except Exception as e:
+        logging.error(f"Ошибка получения изображения {image_id}: {e}")
+        return json_response({"error": str(e)}, 500)
+
+
+# ----------------- Запуск и остановка воркера -----------------
+@asynccontextmanager
+async def lifespan(app):
+    # Пул создаётся в каждом воркере uvicorn отдельно
+    await db_handler.open()
+    if os.getenv("FSTR_REFERENCE_LISTEN", "1") == "1":
+        try:
+            await reference_cache.listen(await db_handler.connect())
+        except Exception as e:
+            logging.error(f"Ошибка подписки на изменения справочников: {e}")
+    try:
+        yield
+    finally:
+        await reference_cache.stop()
+        await db_handler.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/submitData', submit_data, methods=['POST']),
+        Route('/submitData/{pereval_id:int}', get_pereval, methods=['GET']),
+        Route('/userPerevals', get_perevals_by_email, methods=['GET']),
+        Route('/areas', get_areas, methods=['GET']),
+        Route('/activities', get_activities, methods=['GET']),
+        Route('/poolStats', get_pool_stats, methods=['GET']),
+        Route('/images/{image_id:int}', get_image, methods=['GET']),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,139 @@
+import os
+import logging
+
+import asyncpg
+
+import serialization
+
+from database_handler import DatabaseHandler, PEREVAL_COLUMNS, PEREVAL_JSON
+
+# ----------------- Логирование -----------------
+logger = logging.getLogger(__name__)
+
+
+# ----------------- AsyncDatabaseHandler -----------------
+class AsyncDatabaseHandler:
+    """
+    Асинхронный доступ к БД для ASGI-приложения (asgi_app.py) через пул asyncpg.
+    Настройки подключения и размеры пула те же, что у DatabaseHandler
+    (переменные FSTR_DB_*), поэтому оба режима настраиваются одинаково.
+    """
+
+    def __init__(self, host=None, port=None, user=None, password=None, database=None,
+                 pool_min=None, pool_max=None, pool_timeout=None):
+        self.settings = DatabaseHandler(host, port, user, password, database, pool_min, pool_max, pool_timeout)
+        self._pool = None
+
+    @staticmethod
+    async def _init_connection(conn):
+        # jsonb приходит уже разобранным, как у psycopg2
+        for type_name in ("json", "jsonb"):
+            await conn.set_type_codec(type_name, encoder=serialization.dumps_text,
+                                      decoder=serialization.loads, schema="pg_catalog")
+
+    # ----------------- Пул соединений -----------------
+    async def open(self):
+        s = self.settings
+        self._pool = await asyncpg.create_pool(
+            host=s.host, port=int(s.port), user=s.user, password=s.password, database=s.database,
+            ssl="require" if s.host != "localhost" else False,
+            min_size=s.pool_min, max_size=s.pool_max,
+            max_inactive_connection_lifetime=float(os.getenv('FSTR_DB_POOL_MAX_IDLE', 300)),
+            init=self._init_connection,
+        )
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def connect(self):
+        """Отдельное соединение вне пула (для LISTEN)."""
+        s = self.settings
+        return await asyncpg.connect(host=s.host, port=int(s.port), user=s.user, password=s.password,
+                                     database=s.database, ssl="require" if s.host != "localhost" else False)
+
+    def acquire(self):
+        return self._pool.acquire(timeout=self.settings.pool_timeout)
+
+    def pool_stats(self):
+        size = self._pool.get_size()
+        idle = self._pool.get_idle_size()
+        return {"size": size, "idle": idle, "in_use": size - idle,
+                "min_size": self._pool.get_min_size(), "max_size": self._pool.get_max_size()}
+
+    def _pereval(self, record):
+        pereval = dict(record)
+        pereval['raw_data'] = self.settings.parse_json_field(pereval['raw_data'])
+        pereval['images'] = self.settings.parse_json_field(pereval['images'])
+        return pereval
+
+    # ----------------- Перевалы -----------------
+    async def add_pereval(self, raw_data, images):
+        query = """
+        INSERT INTO pereval_added (raw_data, images, status, date_added)
+        VALUES ($1, $2, 'new', NOW())
+        RETURNING id
+        """
+        try:
+            async with self.acquire() as conn:
+                pereval_id = await conn.fetchval(query, raw_data, images)
+            logger.info(f"Перевал добавлен, ID: {pereval_id}")
+            return pereval_id
+        except Exception as e:
+            logger.error(f"Ошибка добавления перевала: {e}")
+            raise
+
+    async def get_pereval_by_id(self, pereval_id):
+        query = f"SELECT {PEREVAL_COLUMNS} FROM pereval_added WHERE id = $1"
+        try:
+            async with self.acquire() as conn:
+                record = await conn.fetchrow(query, pereval_id)
+            return self._pereval(record) if record else None
+        except Exception as e:
+            logger.error(f"Ошибка получения перевала {pereval_id}: {e}")
+            raise
+
+    async def get_perevals_by_email(self, email, raw_json=False):
+        columns = PEREVAL_JSON if raw_json else PEREVAL_COLUMNS
+        query = f"SELECT {columns} FROM pereval_added WHERE (raw_data->'user'->>'email') = $1"
+        try:
+            async with self.acquire() as conn:
+                records = await conn.fetch(query, email)
+            if raw_json:
+                return [r['json'] for r in records]
+            return [self._pereval(r) for r in records]
+        except Exception as e:
+            logger.error(f"Ошибка получения перевалов по email {email}: {e}")
+            raise
+
+    # ----------------- Изображения -----------------
+    async def get_image_meta(self, image_id):
+        query = """
+        SELECT id, sha256, mimetype, size, date_added, img IS NOT NULL AS has_bytea
+        FROM pereval_images WHERE id = $1
+        """
+        try:
+            async with self.acquire() as conn:
+                record = await conn.fetchrow(query, image_id)
+            return dict(record) if record else None
+        except Exception as e:
+            logger.error(f"Ошибка получения метаданных изображения {image_id}: {e}")
+            raise
+
+    async def get_image_by_id(self, image_id):
+        try:
+            async with self.acquire() as conn:
+                return await conn.fetchval("SELECT img FROM pereval_images WHERE id = $1", image_id)
+        except Exception as e:
+            logger.error(f"Ошибка получения изображения {image_id}: {e}")
+            raise
+
+    # ----------------- Справочники -----------------
+    async def get_all_areas(self):
+        async with self.acquire() as conn:
+            return [dict(r) for r in await conn.fetch("SELECT id, id_parent, title FROM pereval_areas ORDER BY id")]
+
+    async def get_activities_types(self):
+        async with self.acquire() as conn:
+            return [dict(r) for r in await conn.fetch("SELECT id, title FROM spr_activities_types ORDER BY id")]
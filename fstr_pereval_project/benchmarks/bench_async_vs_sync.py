@@ -0,0 +1,146 @@
+"""
+Сравнение режимов запуска: app.py (WSGI, sync-воркеры gunicorn) против asgi_app.py (ASGI, воркеры uvicorn).
+
+Оба сервера поднимаются с одинаковым числом воркеров и нагружаются одинаковыми
+GET-запросами при разной конкурентности. Во время прогона опрашивается
+pg_stat_activity, чтобы видеть, сколько соединений с БД держит каждый режим:
+
+    python benchmarks/bench_async_vs_sync.py --workers 2 --concurrency 8,32,128 --requests 2000
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from dotenv import load_dotenv
+
+from database_handler import DatabaseHandler
+
+SERVERS = {
+    "wsgi": lambda port, workers: [sys.executable, "-m", "gunicorn", "-w", str(workers),
+                                   "-b", f"127.0.0.1:{port}", "app:app"],
+    # Не «uvicorn --workers»: его общий сокет создаётся без TCP_NODELAY, и ответы
+    # задерживаются на ~40 мс (алгоритм Нейгла + отложенный ACK)
+    "asgi": lambda port, workers: [sys.executable, "-m", "gunicorn", "-w", str(workers),
+                                   "-k", "uvicorn.workers.UvicornWorker", "-b", f"127.0.0.1:{port}", "asgi_app:app"],
+}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def wait_ready(base_url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base_url}/activities", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Сервер {base_url} не запустился за {timeout} с")
+
+
+class ConnectionSampler(threading.Thread):
+    """Наибольшее число соединений с БД (кроме своего) за время прогона."""
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        conn = DatabaseHandler().get_connection()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                while not self._stop_event.is_set():
+                    cur.execute("SELECT count(*) AS n FROM pg_stat_activity"
+                                " WHERE datname = current_database() AND pid <> pg_backend_pid()")
+                    self.peak = max(self.peak, cur.fetchone()['n'])
+                    self._stop_event.wait(self.interval)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_load(url, concurrency, total):
+    local = threading.local()
+
+    def one(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            ok = session.get(url, timeout=60).status_code < 400
+        except requests.RequestException:
+            ok = False
+        return (time.perf_counter() - started) * 1000, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    timings = [t for t, _ in results]
+    return {
+        "rps": total / elapsed,
+        "p50": percentile(timings, 0.5),
+        "p99": percentile(timings, 0.99),
+        "mean": statistics.mean(timings),
+        "errors": sum(1 for _, ok in results if not ok),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", default="8,32,128", help="уровни конкурентности через запятую")
+    parser.add_argument("--requests", type=int, default=2000, help="запросов на каждый уровень")
+    parser.add_argument("--path", default="/userPerevals?user__email=user@email.tld")
+    parser.add_argument("--modes", default="wsgi,asgi")
+    parser.add_argument("--port", type=int, default=18080)
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    levels = [int(c) for c in args.concurrency.split(",")]
+    print(f"{'режим':<6}{'клиентов':>10}{'запр/с':>10}{'p50, мс':>10}{'p99, мс':>10}{'ошибок':>8}{'соед. БД':>10}")
+    for mode in args.modes.split(","):
+        server = subprocess.Popen(SERVERS[mode](args.port, args.workers), cwd=PROJECT_DIR,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            wait_ready(base_url)
+            # Прогрев: пулы соединений и кэши во всех воркерах
+            run_load(base_url + args.path, args.workers * 4, args.workers * 50)
+            for concurrency in levels:
+                sampler = ConnectionSampler()
+                sampler.start()
+                try:
+                    result = run_load(base_url + args.path, concurrency, args.requests)
+                finally:
+                    sampler.stop()
+                print(f"{mode:<6}{concurrency:>10}{result['rps']:>10.0f}{result['p50']:>10.1f}"
+                      f"{result['p99']:>10.1f}{result['errors']:>8}{sampler.peak:>10}")
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
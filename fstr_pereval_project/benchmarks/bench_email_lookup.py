@@ -0,0 +1,87 @@
+"""
+Бенчмарк поиска перевалов по email: json без индекса против jsonb с индексом по выражению.
+
+Данные генерируются во временных таблицах, рабочая таблица pereval_added не затрагивается:
+
+    python benchmarks/bench_email_lookup.py --rows 100000 --lookups 200
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from database_handler import DatabaseHandler
+
+SEED_SQL = """
+CREATE TEMP TABLE {table} (id serial PRIMARY KEY, raw_data {json_type}, status varchar(50));
+INSERT INTO {table} (raw_data, status)
+SELECT json_build_object(
+           'title', 'Перевал ' || n,
+           'user', json_build_object('email', 'user' || (n %% %(users)s) || '@example.com', 'fam', 'Тестов'),
+           'coords', json_build_object('latitude', '45.0', 'longitude', '7.0', 'height', (1000 + n %% 4000)::text)
+       )::{json_type},
+       (ARRAY['new', 'pending', 'accepted', 'rejected'])[1 + n %% 4]
+FROM generate_series(1, %(rows)s) AS n;
+ANALYZE {table};
+"""
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_lookups(cur, table, emails):
+    timings = []
+    query = f"SELECT id, raw_data FROM {table} WHERE (raw_data->'user'->>'email') = %s"
+    for email in emails:
+        started = time.perf_counter()
+        cur.execute(query, (email,))
+        cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=5_000, help="число различных email")
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    conn = DatabaseHandler().get_connection()
+    try:
+        with conn.cursor() as cur:
+            for table, json_type in (("bench_json", "json"), ("bench_jsonb", "jsonb")):
+                started = time.perf_counter()
+                cur.execute(SEED_SQL.format(table=table, json_type=json_type), {"rows": args.rows, "users": args.users})
+                print(f"{table}: {args.rows} строк создано за {time.perf_counter() - started:.1f} с")
+            cur.execute("CREATE INDEX ON bench_jsonb ((raw_data->'user'->>'email'))")
+            cur.execute("ANALYZE bench_jsonb")
+
+            emails = [f"user{random.randrange(args.users)}@example.com" for _ in range(args.lookups)]
+            print(f"\n{'таблица':<14}{'p50, мс':>10}{'p95, мс':>10}{'среднее, мс':>14}")
+            for table in ("bench_json", "bench_jsonb"):
+                timings = run_lookups(cur, table, emails)
+                print(f"{table:<14}{percentile(timings, 0.5):>10.2f}{percentile(timings, 0.95):>10.2f}"
+                      f"{statistics.mean(timings):>14.2f}")
+
+            cur.execute("EXPLAIN SELECT id FROM bench_jsonb WHERE (raw_data->'user'->>'email') = %s", (emails[0],))
+            print("\nПлан запроса для jsonb:")
+            for row in cur.fetchall():
+                print("  " + row['QUERY PLAN'])
+        conn.rollback()
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Микробенчмарк JSON-конвейера: стандартный json против orjson и разбор+сериализация
+против передачи JSON-текста из БД прямо в ответ (FSTR_JSON_PASSTHROUGH).
+
+Перевалы для замера добавляются в pereval_added с отдельным email и удаляются в конце:
+
+    python benchmarks/bench_json_pipeline.py --rows 500 --repeat 30
+"""
+import os
+import sys
+import time
+import argparse
+import importlib
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import serialization
+import app as app_module
+
+BENCH_EMAIL = "bench-json@example.com"
+
+SEED_SQL = """
+INSERT INTO pereval_added (raw_data, images, status, date_added)
+SELECT jsonb_build_object(
+           'beautyTitle', 'пер. ', 'title', 'Перевал ' || n, 'other_titles', 'Триев', 'connect', '',
+           'add_time', '2021-09-22 13:18:13', 'area_id', 65,
+           'user', jsonb_build_object('email', %(email)s, 'phone', '79031234567', 'fam', 'Пупкин',
+                                      'name', 'Василий', 'otc', 'Иванович'),
+           'coords', jsonb_build_object('latitude', '45.3842', 'longitude', '7.1525', 'height', '1200'),
+           'level', jsonb_build_object('winter', '', 'summer', '1А', 'autumn', '1А', 'spring', '')),
+       jsonb_build_array(jsonb_build_object('id', 1, 'url', '/images/1', 'title', 'Седловина'),
+                         jsonb_build_object('id', 2, 'url', '/images/2', 'title', 'Подъём')),
+       'new', NOW() + n * INTERVAL '1 second'
+FROM generate_series(1, %(rows)s) AS n
+"""
+
+ROUTES = {
+    "/userPerevals": f"/userPerevals?user__email={BENCH_EMAIL}",
+    "/perevals.json": "/perevals.json?limit={rows}",
+    "/areas/65/perevals": "/areas/65/perevals?limit={rows}",
+}
+
+
+def use_codec(name):
+    os.environ["FSTR_JSON_CODEC"] = name
+    importlib.reload(serialization)
+    return serialization.JSON_CODEC == name
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def bench_codecs(rows, repeat):
+    row = {"id": 1, "raw_data": {"title": "Перевал", "user": {"email": BENCH_EMAIL, "fam": "Пупкин"},
+                                 "coords": {"latitude": "45.3842", "longitude": "7.1525", "height": "1200"}},
+           "images": [{"id": 1, "url": "/images/1", "title": "Седловина"}], "status": "new"}
+    data = [dict(row, id=n) for n in range(rows)]
+    print(f"{'кодек':<8}{'dumps, мс':>12}{'loads, мс':>12}   ({rows} строк)")
+    for codec in ("json", "orjson"):
+        if not use_codec(codec):
+            print(f"{codec:<8}{'не установлен':>24}")
+            continue
+        body = serialization.dumps(data)
+        print(f"{codec:<8}{timed(lambda: serialization.dumps(data), repeat):>12.2f}"
+              f"{timed(lambda: serialization.loads(body), repeat):>12.2f}")
+
+
+def bench_routes(rows, repeat):
+    client = app_module.app.test_client()
+    modes = [("json", False), ("orjson", False), ("orjson", True)]
+    print(f"\n{'маршрут':<22}" + "".join(f"{c + (' +passthrough' if p else ''):>22}" for c, p in modes)
+          + "   (медиана, мс)")
+    for name, url in ROUTES.items():
+        url = url.format(rows=rows)
+        cells = []
+        for codec, passthrough in modes:
+            if not use_codec(codec):
+                cells.append(f"{'—':>22}")
+                continue
+            app_module.JSON_PASSTHROUGH = passthrough
+            client.get(url)  # прогрев кэшей
+            cells.append(f"{timed(lambda: client.get(url).get_data(), repeat):>22.2f}")
+        print(f"{name:<22}" + "".join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500, help="перевалов в ответе")
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    handler = app_module.db_handler
+    with handler.connection() as conn, conn.cursor() as cur:
+        cur.execute(SEED_SQL, {"rows": args.rows, "email": BENCH_EMAIL})
+        conn.commit()
+    try:
+        bench_codecs(args.rows, args.repeat)
+        bench_routes(args.rows, args.repeat)
+    finally:
+        with handler.connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM pereval_added WHERE raw_data->'user'->>'email' = %s", (BENCH_EMAIL,))
+            conn.commit()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Захват заявок из очереди модерации (/moderation/claim) при длинной очереди и нескольких модераторах.
+
+Добавляет в pereval_added --rows новых заявок (отдельный email, даты старше реальных — очередь
+выдаёт их первыми) и столько же уже решённых, затем --moderators потоков одновременно захватывают
+по --batch заявок и принимают их одним запросом. Проверяет, что ни одна заявка не выдана дважды,
+и удаляет добавленные строки:
+
+    python benchmarks/bench_moderation.py --rows 300000 --moderators 8 --rounds 50
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database_handler import DatabaseHandler
+
+BENCH_EMAIL = "bench-moderation@example.com"
+
+SEED_SQL = """
+INSERT INTO pereval_added (raw_data, images, status, date_added)
+SELECT jsonb_build_object('title', 'Очередь ' || n, 'user', jsonb_build_object('email', %(email)s)),
+       '[]', %(status)s, TIMESTAMP '1990-01-01' + n * interval '1 second'
+FROM generate_series(%(start)s, %(stop)s) AS n
+"""
+
+
+def percentile(timings, q):
+    return timings[min(len(timings) - 1, int(len(timings) * q))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--moderators", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=50, help="захватов на модератора")
+    parser.add_argument("--batch", type=int, default=20, help="заявок за один захват")
+    args = parser.parse_args(argv)
+    if args.moderators * args.rounds * args.batch > args.rows:
+        parser.error("захватов больше, чем заявок в очереди")
+
+    handler = DatabaseHandler(pool_max=args.moderators)
+    started = time.perf_counter()
+    with handler.connection() as conn, conn.cursor() as cur:
+        for status in ("new", "accepted"):
+            for start in range(1, args.rows + 1, 100_000):
+                cur.execute(SEED_SQL, {"email": BENCH_EMAIL, "status": status,
+                                       "start": start, "stop": min(start + 99_999, args.rows)})
+                conn.commit()
+        cur.execute("ANALYZE pereval_added")
+        conn.commit()
+    print(f"Добавлено {2 * args.rows} заявок за {time.perf_counter() - started:.0f} с")
+
+    claim_ms, decide_ms, seen = [], [], []
+    lock = threading.Lock()
+
+    def moderate(n):
+        moderator = f"bench-{n}"
+        for _ in range(args.rounds):
+            t0 = time.perf_counter()
+            ids = [r['id'] for r in handler.claim_perevals(moderator, args.batch)]
+            t1 = time.perf_counter()
+            handler.transition_perevals(moderator, ids, "accepted")
+            t2 = time.perf_counter()
+            with lock:
+                claim_ms.append((t1 - t0) * 1000)
+                decide_ms.append((t2 - t1) * 1000)
+                seen.extend(ids)
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.moderators) as pool:
+            list(pool.map(moderate, range(args.moderators)))
+        elapsed = time.perf_counter() - started
+        print(f"{len(seen)} заявок за {elapsed:.1f} с ({len(seen) / elapsed:.0f}/с), "
+              f"повторов: {len(seen) - len(set(seen))}")
+        print(f"{'операция':<12}{'p50, мс':>10}{'p95, мс':>10}")
+        for name, timings in (("захват", claim_ms), ("решение", decide_ms)):
+            timings.sort()
+            print(f"{name:<12}{statistics.median(timings):>10.1f}{percentile(timings, 0.95):>10.1f}")
+    finally:
+        with handler.connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM pereval_added WHERE raw_data->'user'->>'email' = %s", (BENCH_EMAIL,))
+            conn.commit()
+        handler.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Задержка поиска по названиям (/perevals/search) на большой таблице.
+
+Добавляет в pereval_added перевалы со случайными названиями из словаря слов,
+собранных из слогов (отдельный email), замеряет типичные запросы — слово, префикс, опечатка, несколько слов — и
+удаляет их в конце:
+
+    python benchmarks/bench_search.py --rows 1000000 --repeat 30
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database_handler import DatabaseHandler
+
+BENCH_EMAIL = "bench-search@example.com"
+
+# Словарь из VOCABULARY слов по 2–4 случайных слога; название и other_titles — слова из него.
+# Так в таблице, как и в реальных данных, десятки тысяч различных слов на миллион перевалов.
+# Слагаемое 0 * i привязывает string_agg к подзапросу, иначе агрегат относится к внешнему SELECT
+SEED_SQL = """
+WITH syllables AS (
+    SELECT ARRAY['ка','ра','ту','зю','ль','ми','на','ко','ри','ба','шу','те','ло','ги','ан','ор','ус','ет',
+                 'пхи','три','ев','ак','су','уз','ой','ым','ар','чи','до','ве'] AS s
+), vocabulary AS (
+    SELECT array_agg(w) AS words FROM (
+        SELECT (SELECT string_agg(s[1 + floor(random() * 30)::int + 0 * i], '')
+                FROM generate_series(1, 2 + v %% 3) i) AS w
+        FROM generate_series(1, %(vocabulary)s) AS v, syllables
+    ) v
+)
+INSERT INTO pereval_added (raw_data, images, status, date_added)
+SELECT jsonb_build_object('beautyTitle', 'пер. ',
+                          'title', initcap(words[1 + floor(random() * %(vocabulary)s)::int + 0 * n]),
+                          'other_titles', initcap(words[1 + floor(random() * %(vocabulary)s)::int + 0 * n]),
+                          'user', jsonb_build_object('email', %(email)s), 'area_id', 65),
+       '[]', 'new', NOW()
+FROM generate_series(%(start)s, %(stop)s) AS n, vocabulary
+"""
+
+def bench_queries(handler):
+    """Запросы по случайному длинному слову из словаря: целиком, начало, с опечаткой."""
+    with handler.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT word FROM pereval_title_words WHERE length(word) >= 8 ORDER BY random() LIMIT 2")
+        word, other = [r['word'] for r in cur.fetchall()]
+    return {
+        "слово": word,
+        "префикс": word[:4],
+        "короткий префикс": word[:2],
+        "опечатка": word[:3] + word[4:],
+        "два слова": f"{word} {other}",
+        "частое слово": "перевал",
+        "нет совпадений": "эльбрус",
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--batch", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=20_000, help="различных слов в названиях")
+    args = parser.parse_args(argv)
+
+    handler = DatabaseHandler()
+    started = time.perf_counter()
+    with handler.connection() as conn, conn.cursor() as cur:
+        for start in range(1, args.rows + 1, args.batch):
+            cur.execute(SEED_SQL, {"start": start, "stop": min(start + args.batch - 1, args.rows),
+                                   "vocabulary": args.vocabulary, "email": BENCH_EMAIL})
+            conn.commit()
+        cur.execute("ANALYZE pereval_added")
+        conn.commit()
+    print(f"Добавлено {args.rows} перевалов за {time.perf_counter() - started:.0f} с")
+    try:
+        print(f"{'запрос':<18}{'найдено':>9}{'p50, мс':>10}{'p95, мс':>10}")
+        for name, text in bench_queries(handler).items():
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                items, _ = handler.search_perevals(text, 50)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{name:<18}{len(items):>9}{statistics.median(timings):>10.1f}{p95:>10.1f}")
+    finally:
+        with handler.connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM pereval_added WHERE raw_data->'user'->>'email' = %s", (BENCH_EMAIL,))
+            conn.commit()
+        handler.prune_title_words()
+        handler.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Холодный старт app.py: время импорта, создания приложения и первого ответа в новом процессе.
+
+Каждый прогон — отдельный интерпретатор, как у воркера после масштабирования с нуля.
+С порогами завершается с кодом 1, если медиана их превышает, — для проверки в CI:
+
+    python benchmarks/bench_startup.py --runs 10 --max-import-ms 250 --max-first-response-ms 400
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Выполняется в новом процессе; печатает замеры в мс одной строкой JSON
+CHILD = """
+import sys, json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+response = flask_app.test_client().get(sys.argv[1])
+answered = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({
+    "import": (imported - started) * 1000,
+    "create_app": (created - imported) * 1000,
+    "first_request": (answered - created) * 1000,
+    "first_response": (answered - started) * 1000,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def run_once(url):
+    result = subprocess.run([sys.executable, "-c", CHILD, url], cwd=PROJECT_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Процесс завершился с ошибкой:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--url", default="/activities", help="первый запрос")
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-first-response-ms", type=float)
+    args = parser.parse_args(argv)
+
+    samples = [run_once(args.url) for _ in range(args.runs)]
+    print(f"{'этап':<16}{'p50, мс':>10}{'max, мс':>10}")
+    medians = {}
+    for name in ("import", "create_app", "first_request", "first_response"):
+        values = [s[name] for s in samples]
+        medians[name] = statistics.median(values)
+        print(f"{name:<16}{medians[name]:>10.1f}{max(values):>10.1f}")
+    print(f"Модулей загружено: {samples[-1]['modules']}")
+
+    failed = False
+    for name, limit in (("import", args.max_import_ms), ("first_response", args.max_first_response_ms)):
+        if limit is not None and medians[name] > limit:
+            print(f"{name}: {medians[name]:.1f} мс больше порога {limit:.0f} мс")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Статистика перевалов: счётчики pereval_stats (/stats) против подсчёта по get_all_perevals()
+и цена поддержки счётчиков при вставке.
+
+Добавляет --rows перевалов (отдельный email), сравнивает время get_pereval_stats() с выборкой
+всех перевалов и подсчётом в Python, затем вставляет пакеты по --batch перевалов с триггерами
+счётчиков и без них (в откатываемой транзакции). Добавленные строки удаляются:
+
+    python benchmarks/bench_stats.py --rows 300000 --batch 1000
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from psycopg2.extras import execute_values
+
+from database_handler import DatabaseHandler
+
+BENCH_EMAIL = "bench-stats@example.com"
+STATS_TRIGGERS = ("pereval_added_stats_insert", "pereval_added_stats_update", "pereval_added_stats_delete")
+
+SEED_SQL = """
+INSERT INTO pereval_added (raw_data, images, status, date_added)
+SELECT jsonb_build_object(
+           'title', 'Статистика ' || n, 'area_id', (ARRAY[66, 88, 92, 105, 106])[n %% 5 + 1],
+           'user', jsonb_build_object('email', %(email)s),
+           'coords', jsonb_build_object('latitude', '50.1', 'longitude', '87.6', 'height', (1000 + n %% 4000)::text),
+           'level', jsonb_build_object('summer', (ARRAY['н/к', '1А', '1Б', '2А', '2Б', '3А'])[n %% 6 + 1],
+                                       'winter', '', 'autumn', '1А', 'spring', '')),
+       '[]', (ARRAY['new', 'pending', 'accepted', 'rejected'])[n %% 4 + 1],
+       TIMESTAMP '2015-01-01' + n * interval '17 minutes'
+FROM generate_series(%(start)s, %(stop)s) AS n
+"""
+
+
+def count_in_python(perevals):
+    """Как считалось бы без счётчиков: по всем перевалам в памяти."""
+    counts = Counter()
+    for p in perevals:
+        raw = p['raw_data'] or {}
+        height = str((raw.get('coords') or {}).get('height', '')).strip()
+        counts['status', p['status']] += 1
+        counts['area', raw.get('area_id')] += 1
+        counts['height', int(float(height)) // 500 * 500 if height.replace('.', '', 1).isdigit() else ''] += 1
+        counts['month', p['date_added'].strftime('%Y-%m')] += 1
+        for season, level in (raw.get('level') or {}).items():
+            counts['level', season, level] += 1
+    return counts
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def insert_batches(handler, batch, rounds, with_triggers):
+    rows = [(f'{{"title": "Пакет {n}", "user": {{"email": "{BENCH_EMAIL}"}}, '
+             f'"coords": {{"height": "{1000 + n}"}}, "level": {{"summer": "1А"}}}}', '[]')
+            for n in range(batch)]
+    timings = []
+    with handler.connection() as conn, conn.cursor() as cur:
+        try:
+            if not with_triggers:
+                for trigger in STATS_TRIGGERS:
+                    cur.execute(f"ALTER TABLE pereval_added DISABLE TRIGGER {trigger}")
+            for _ in range(rounds):
+                started = time.perf_counter()
+                execute_values(cur, "INSERT INTO pereval_added (raw_data, images) VALUES %s", rows, page_size=batch)
+                timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            # Вставки и отключение триггеров откатываются вместе
+            conn.rollback()
+    return statistics.median(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--batch", type=int, default=1000, help="перевалов в пакете вставки")
+    parser.add_argument("--rounds", type=int, default=20, help="пакетов и повторов замера")
+    args = parser.parse_args(argv)
+
+    handler = DatabaseHandler()
+    started = time.perf_counter()
+    with handler.connection() as conn, conn.cursor() as cur:
+        for start in range(1, args.rows + 1, 100_000):
+            cur.execute(SEED_SQL, {"email": BENCH_EMAIL, "start": start, "stop": min(start + 99_999, args.rows)})
+            conn.commit()
+        cur.execute("ANALYZE pereval_added")
+        conn.commit()
+    print(f"Добавлено {args.rows} перевалов за {time.perf_counter() - started:.0f} с")
+
+    try:
+        print(f"{'способ':<32}{'p50, мс':>10}")
+        print(f"{'get_pereval_stats()':<32}{timed(handler.get_pereval_stats, args.rounds):>10.2f}")
+        print(f"{'get_all_perevals() + Counter':<32}"
+              f"{timed(lambda: count_in_python(handler.get_all_perevals()), 3):>10.0f}")
+        plain = insert_batches(handler, args.batch, args.rounds, with_triggers=False)
+        counted = insert_batches(handler, args.batch, args.rounds, with_triggers=True)
+        print(f"Вставка {args.batch} перевалов: {plain:.1f} мс без счётчиков, {counted:.1f} мс со счётчиками")
+    finally:
+        with handler.connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM pereval_added WHERE raw_data->'user'->>'email' = %s", (BENCH_EMAIL,))
+            cur.execute("DELETE FROM sync_tombstones WHERE scope = %s", (BENCH_EMAIL,))
+            conn.commit()
+        handler.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,437 @@
+"""
+Нагрузочный тест API на одноразовой локальной PostgreSQL.
+
+Поднимает временный кластер (initdb/pg_ctl из PATH или --pg-bin) либо временную базу
+на существующем сервере (--existing, подключение из FSTR_DB_*), накатывает pereval.sql
+и миграции, заполняет синтетическими перевалами и изображениями, запускает приложение
+(gunicorn или uvicorn) и нагружает все маршруты по заданной смеси. Результат — JSON
+с пропускной способностью и p50/p95/p99 по каждому маршруту; его можно сравнить с
+сохранённым эталоном, регрессия даёт код выхода 1:
+
+    python benchmarks/loadtest.py run --rows 100000 --concurrency 32 --duration 30 \\
+        --output benchmarks/results/run.json --baseline benchmarks/baseline.json
+    python benchmarks/loadtest.py compare benchmarks/results/run.json benchmarks/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import statistics
+from datetime import datetime, timezone
+
+import psycopg2
+import requests
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from dotenv import load_dotenv
+
+from database_handler import DatabaseHandler
+from migrate import migrate
+from bench_async_vs_sync import SERVERS, percentile, wait_ready
+
+SEED_PEREVALS_SQL = """
+INSERT INTO pereval_images (img, date_added)
+SELECT decode(%(image_hex)s, 'hex'), NOW() - random() * INTERVAL '365 days'
+FROM generate_series(1, %(images)s);
+
+INSERT INTO pereval_added (raw_data, images, status, date_added)
+SELECT jsonb_build_object(
+           'beautyTitle', 'пер. ',
+           'title', 'Перевал ' || n,
+           'area_id', (%(area_ids)s::int8[])[1 + n %% array_length(%(area_ids)s::int8[], 1)],
+           'user', jsonb_build_object('email', 'user' || (n %% %(users)s) || '@example.com',
+                                      'fam', 'Тестов', 'name', 'Тест', 'phone', '79000000000'),
+           'coords', jsonb_build_object('latitude', round((40 + random() * 15)::numeric, 4)::text,
+                                        'longitude', round((60 + random() * 40)::numeric, 4)::text,
+                                        'height', (1000 + n %% 4000)::text),
+           'level', jsonb_build_object('summer', '1А')
+       ),
+       (SELECT jsonb_agg(jsonb_build_object('id', i, 'url', '/images/' || i, 'title', 'Фото'))
+        FROM unnest(ARRAY[%(first_image)s + (n * 7) %% %(image_mod)s, %(first_image)s + (n * 13) %% %(image_mod)s]) AS i
+        WHERE n %% 10 < %(with_images)s),
+       (ARRAY['new', 'pending', 'accepted', 'rejected'])[1 + n %% 4],
+       NOW() - (n %% 100000) * INTERVAL '5 minutes'
+FROM generate_series(1, %(rows)s) AS n;
+
+ANALYZE;
+"""
+
+# Сигнатура JPEG и 2 КБ данных: тип изображения приложение определяет по первым байтам
+IMAGE_BYTES = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 8
+
+
+# ----------------- Одноразовая PostgreSQL -----------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class DisposablePostgres:
+    """Временный кластер в каталоге tmp; удаляется вместе с данными при stop()."""
+
+    def __init__(self, pg_bin=None):
+        initdb = shutil.which("initdb", path=pg_bin) if pg_bin else shutil.which("initdb")
+        if initdb is None:
+            raise RuntimeError("initdb не найден: укажите --pg-bin или используйте --existing")
+        self.bin = os.path.dirname(initdb)
+        self.dir = tempfile.mkdtemp(prefix="fstr_loadtest_pg_")
+        self.port = free_port()
+        self.database = "pereval"
+
+    def start(self):
+        data = os.path.join(self.dir, "data")
+        subprocess.run([os.path.join(self.bin, "initdb"), "-D", data, "-U", "postgres", "--auth=trust",
+                        "-E", "UTF8", "--locale=C"], check=True, stdout=subprocess.DEVNULL)
+        # Данные одноразовые, поэтому fsync не нужен
+        options = f"-p {self.port} -k {self.dir} -c listen_addresses=127.0.0.1 -c fsync=off -c max_connections=300"
+        subprocess.run([os.path.join(self.bin, "pg_ctl"), "-D", data, "-o", options, "-w",
+                        "-l", os.path.join(self.dir, "postgres.log"), "start"], check=True, stdout=subprocess.DEVNULL)
+        conn = psycopg2.connect(host="localhost", port=self.port, user="postgres", dbname="postgres")
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE DATABASE {self.database}")
+        conn.close()
+        return {"FSTR_DB_HOST": "localhost", "FSTR_DB_PORT": str(self.port), "FSTR_DB_LOGIN": "postgres",
+                "FSTR_DB_PASS": "postgres", "FSTR_DB_NAME": self.database}
+
+    def stop(self):
+        subprocess.run([os.path.join(self.bin, "pg_ctl"), "-D", os.path.join(self.dir, "data"), "-m", "fast",
+                        "-w", "stop"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class TemporaryDatabase:
+    """Временная база на сервере из FSTR_DB_*; удаляется при stop()."""
+
+    def __init__(self):
+        self.handler = DatabaseHandler()
+        self.database = f"fstr_loadtest_{os.getpid()}"
+
+    def _admin(self):
+        conn = DatabaseHandler(database="postgres").get_connection()
+        conn.autocommit = True
+        return conn
+
+    def start(self):
+        conn = self._admin()
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE DATABASE {self.database}")
+        conn.close()
+        h = self.handler
+        return {"FSTR_DB_HOST": h.host, "FSTR_DB_PORT": str(h.port), "FSTR_DB_LOGIN": h.user,
+                "FSTR_DB_PASS": h.password, "FSTR_DB_NAME": self.database}
+
+    def stop(self):
+        conn = self._admin()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {self.database} WITH (FORCE)")
+        conn.close()
+
+
+def handler_for(env):
+    return DatabaseHandler(host=env["FSTR_DB_HOST"], port=env["FSTR_DB_PORT"], user=env["FSTR_DB_LOGIN"],
+                           password=env["FSTR_DB_PASS"], database=env["FSTR_DB_NAME"])
+
+
+def prepare_database(handler, rows, images, users):
+    """Схема, миграции и синтетические данные. Возвращает справочник для генерации запросов."""
+    conn = handler.get_connection()
+    try:
+        with conn.cursor() as cur, open(os.path.join(PROJECT_DIR, "pereval.sql"), encoding="utf-8") as f:
+            cur.execute(f.read())
+        conn.commit()
+    finally:
+        conn.close()
+    migrate(handler)
+
+    conn = handler.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM pereval_areas ORDER BY id")
+            area_ids = [r['id'] for r in cur.fetchall()]
+            cur.execute("SELECT COALESCE(MAX(id), 0) + 1 AS first FROM pereval_images")
+            first_image = cur.fetchone()['first']
+            started = time.perf_counter()
+            cur.execute(SEED_PEREVALS_SQL, {
+                "rows": rows, "images": images, "image_mod": max(images, 1), "users": users, "area_ids": area_ids,
+                "first_image": first_image, "image_hex": IMAGE_BYTES.hex(), "with_images": 10 if images else 0,
+            })
+            conn.commit()
+            print(f"Заполнено: {rows} перевалов, {images} изображений за {time.perf_counter() - started:.1f} с")
+            cur.execute("SELECT MIN(id) AS lo, MAX(id) AS hi FROM pereval_added")
+            ids = cur.fetchone()
+            cur.execute("SELECT MIN(id) AS lo, MAX(id) AS hi FROM pereval_images")
+            image_ids = cur.fetchone()
+    finally:
+        conn.close()
+    return {"pereval_ids": (ids['lo'], ids['hi']), "image_ids": (image_ids['lo'], image_ids['hi']),
+            "users": users, "area_ids": area_ids}
+
+
+# ----------------- Маршруты и смесь запросов -----------------
+def new_pereval(rnd, data):
+    return {"raw_data": {"title": f"Нагрузка {rnd.randrange(10 ** 9)}",
+                         "user": {"email": f"user{rnd.randrange(data['users'])}@example.com"},
+                         "coords": {"latitude": "45.0", "longitude": "7.0", "height": "1200"}},
+            "images": []}
+
+
+# Маршрут: (метод, функция построения запроса, поддерживается asgi_app.py)
+ROUTES = {
+    "pereval": ("GET", lambda rnd, d: (f"/submitData/{rnd.randint(*d['pereval_ids'])}", {}), True),
+    "user_perevals": ("GET", lambda rnd, d: (f"/userPerevals?user__email=user{rnd.randrange(d['users'])}@example.com", {}), True),
+    "submit": ("POST", lambda rnd, d: ("/submitData", {"json": new_pereval(rnd, d)}), True),
+    "submit_batch": ("POST", lambda rnd, d: ("/submitData/batch", {"json": [new_pereval(rnd, d) for _ in range(20)]}), False),
+    "patch": ("PATCH", lambda rnd, d: (f"/submitData/{rnd.randint(*d['pereval_ids'])}",
+                                       {"json": {"raw_data": {"title": "Обновлён"}}}), False),
+    "perevals_json": ("GET", lambda rnd, d: ("/perevals.json?limit=50", {}), False),
+    "perevals_html": ("GET", lambda rnd, d: ("/perevals?limit=50", {}), False),
+    "export": ("GET", lambda rnd, d: ("/export?format=ndjson&date_from=" + datetime.now().strftime("%Y-%m-%d"), {}), False),
+    "areas": ("GET", lambda rnd, d: ("/areas", {}), True),
+    "area_tree": ("GET", lambda rnd, d: ("/areas/tree", {}), False),
+    "area_perevals": ("GET", lambda rnd, d: (f"/areas/{rnd.choice(d['area_ids'])}/perevals?limit=50", {}), False),
+    "activities": ("GET", lambda rnd, d: ("/activities", {}), True),
+    "image": ("GET", lambda rnd, d: (f"/images/{rnd.randint(*d['image_ids'])}", {}), True),
+    "upload": ("POST", lambda rnd, d: ("/uploadImage", {"data": IMAGE_BYTES,
+                                                         "headers": {"Content-Type": "image/jpeg"}}), False),
+}
+
+DEFAULT_MIX = ("pereval=30,user_perevals=15,perevals_json=10,submit=10,image=10,area_perevals=5,areas=4,"
+               "activities=4,area_tree=3,perevals_html=3,patch=2,upload=2,submit_batch=1,export=1")
+
+
+def parse_mix(spec, mode):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise SystemExit(f"Неизвестный маршрут: {name}")
+        if mode == "asgi" and not ROUTES[name][2]:
+            continue
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_load(base_url, mix, data, concurrency, duration, seed=0):
+    """Каждый поток выбирает маршрут по весам; возвращает {маршрут: [(мс, статус)]}."""
+    names, weights = list(mix), list(mix.values())
+    samples = {name: [] for name in names}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(n):
+        rnd = random.Random(seed * 1000 + n)
+        session = requests.Session()
+        local = {name: [] for name in names}
+        while time.monotonic() < deadline:
+            name = rnd.choices(names, weights)[0]
+            method, build, _ = ROUTES[name]
+            path, kwargs = build(rnd, data)
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, timeout=60, **kwargs)
+                response.content
+                status = response.status_code
+            except requests.RequestException:
+                status = 0
+            local[name].append(((time.perf_counter() - started) * 1000, status))
+        with lock:
+            for name, values in local.items():
+                samples[name].extend(values)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.monotonic() - started
+
+
+def summarize(samples, elapsed):
+    routes = {}
+    for name, values in samples.items():
+        if not values:
+            continue
+        timings = [t for t, _ in values]
+        statuses = {}
+        for _, status in values:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        routes[name] = {
+            "count": len(values),
+            "rps": round(len(values) / elapsed, 2),
+            "p50": round(percentile(timings, 0.50), 2),
+            "p95": round(percentile(timings, 0.95), 2),
+            "p99": round(percentile(timings, 0.99), 2),
+            "mean": round(statistics.mean(timings), 2),
+            # Ошибки сервера и сети; 4xx (например, PATCH не-new перевала) ожидаемы
+            "errors": sum(1 for _, status in values if status == 0 or status >= 500),
+            "statuses": statuses,
+        }
+    everything = [t for values in samples.values() for t, _ in values]
+    total = {"count": len(everything), "rps": round(len(everything) / elapsed, 2),
+             "p50": round(percentile(everything, 0.50), 2), "p95": round(percentile(everything, 0.95), 2),
+             "p99": round(percentile(everything, 0.99), 2),
+             "errors": sum(r["errors"] for r in routes.values())}
+    return routes, total
+
+
+def print_report(result):
+    print(f"\n{'маршрут':<16}{'запросов':>10}{'запр/с':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'ошибок':>8}")
+    for name, r in sorted(result["routes"].items()):
+        print(f"{name:<16}{r['count']:>10}{r['rps']:>9.1f}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}{r['errors']:>8}")
+    t = result["total"]
+    print(f"{'всего':<16}{t['count']:>10}{t['rps']:>9.1f}{t['p50']:>10.1f}{t['p95']:>10.1f}{t['p99']:>10.1f}{t['errors']:>8}")
+
+
+# ----------------- Сравнение с эталоном -----------------
+def compare(result, baseline, threshold=0.2, min_delta_ms=2.0):
+    """
+    Регрессии по маршрутам, общим для обоих прогонов: p95/p99 выросли больше чем на
+    threshold (и больше чем на min_delta_ms), пропускная способность упала больше чем
+    на threshold или появились ошибки. Возвращает список строк-описаний.
+    """
+    regressions = []
+    routes = dict(result["routes"], **{"всего": result["total"]})
+    base_routes = dict(baseline["routes"], **{"всего": baseline["total"]})
+    for name in sorted(set(routes) & set(base_routes)):
+        new, old = routes[name], base_routes[name]
+        for metric in ("p95", "p99"):
+            if new[metric] > old[metric] * (1 + threshold) and new[metric] - old[metric] > min_delta_ms:
+                regressions.append(f"{name}: {metric} {old[metric]:.1f} → {new[metric]:.1f} мс")
+        if new["rps"] < old["rps"] * (1 - threshold):
+            regressions.append(f"{name}: запр/с {old['rps']:.1f} → {new['rps']:.1f}")
+        if new["errors"] > old["errors"]:
+            regressions.append(f"{name}: ошибок {old['errors']} → {new['errors']}")
+    return regressions
+
+
+def report_comparison(result, baseline, threshold):
+    regressions = compare(result, baseline, threshold)
+    if regressions:
+        print(f"\nРегрессии относительно эталона (порог {threshold:.0%}):")
+        for line in regressions:
+            print("  " + line)
+        return 1
+    print(f"\nРегрессий относительно эталона нет (порог {threshold:.0%})")
+    return 0
+
+
+# ----------------- Запуск -----------------
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def cmd_run(args):
+    mix = parse_mix(args.mix, args.mode)
+    database = TemporaryDatabase() if args.existing else DisposablePostgres(args.pg_bin)
+    blob_root = tempfile.mkdtemp(prefix="fstr_loadtest_blobs_")
+    server = None
+    try:
+        env = database.start()
+        data = prepare_database(handler_for(env), args.rows, args.images, args.users)
+        if not args.images:
+            mix.pop("image", None)
+        port = free_port()
+        server_env = dict(os.environ, **env, FSTR_BLOB_ROOT=blob_root,
+                          FSTR_DERIVATIVES_ROOT=os.path.join(blob_root, "derivatives"),
+                          FSTR_INGEST_QUEUE_PATH=os.path.join(blob_root, "ingest_queue.sqlite3"))
+        server = subprocess.Popen(SERVERS[args.mode](port, args.workers), cwd=PROJECT_DIR, env=server_env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{port}"
+        wait_ready(base_url)
+        if args.warmup:
+            run_load(base_url, mix, data, args.concurrency, args.warmup, seed=args.seed + 1)
+        samples, elapsed = run_load(base_url, mix, data, args.concurrency, args.duration, seed=args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        database.stop()
+        shutil.rmtree(blob_root, ignore_errors=True)
+
+    routes, total = summarize(samples, elapsed)
+    result = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(), "python": platform.python_version(), "host": platform.node(),
+            "mode": args.mode, "workers": args.workers, "concurrency": args.concurrency,
+            "duration": round(elapsed, 2), "rows": args.rows, "images": args.images, "users": args.users,
+            "mix": mix, "seed": args.seed,
+        },
+        "routes": routes,
+        "total": total,
+    }
+    print_report(result)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультат сохранён в {args.output}")
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            return report_comparison(result, json.load(f), args.threshold)
+    return 0
+
+
+def cmd_compare(args):
+    with open(args.result, encoding="utf-8") as f:
+        result = json.load(f)
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print_report(result)
+    return report_comparison(result, baseline, args.threshold)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="поднять БД и приложение и выполнить нагрузку")
+    run.add_argument("--rows", type=int, default=10_000, help="число синтетических перевалов (10k–1M)")
+    run.add_argument("--images", type=int, default=1_000, help="число изображений в pereval_images")
+    run.add_argument("--users", type=int, default=1_000, help="число различных email")
+    run.add_argument("--mode", choices=sorted(SERVERS), default="wsgi")
+    run.add_argument("--workers", type=int, default=2)
+    run.add_argument("--concurrency", type=int, default=16)
+    run.add_argument("--duration", type=float, default=30.0, help="длительность замера, с")
+    run.add_argument("--warmup", type=float, default=5.0, help="прогрев перед замером, с")
+    run.add_argument("--mix", default=DEFAULT_MIX, help="веса маршрутов: имя=вес,...")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--pg-bin", default=os.getenv("FSTR_PG_BIN"), help="каталог с initdb и pg_ctl")
+    run.add_argument("--existing", action="store_true",
+                     help="временная база на сервере из FSTR_DB_* вместо своего кластера")
+    run.add_argument("--output", help="куда сохранить JSON с результатом")
+    run.add_argument("--baseline", help="эталонный JSON для сравнения")
+    run.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение, доля")
+    run.set_defaults(func=cmd_run)
+
+    cmp = sub.add_parser("compare", help="сравнить сохранённый результат с эталоном")
+    cmp.add_argument("result")
+    cmp.add_argument("baseline")
+    cmp.add_argument("--threshold", type=float, default=0.2)
+    cmp.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    load_dotenv()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
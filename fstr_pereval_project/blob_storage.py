@@ -0,0 +1,343 @@
+import io
+import os
+import hashlib
+import logging
+import tempfile
+
+# ----------------- Логирование -----------------
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Сигнатуры форматов изображений: (смещение, байты, mimetype)
+MAGIC_NUMBERS = [
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (4, b"ftypheic", "image/heic"),
+    (4, b"ftypavif", "image/avif"),
+]
+
+
+IMAGE_MIMETYPES = frozenset(mimetype for _, _, mimetype in MAGIC_NUMBERS)
+
+
+def sniff_mimetype(head, default="application/octet-stream"):
+    """Определить тип изображения по первым байтам файла."""
+    for offset, magic, mimetype in MAGIC_NUMBERS:
+        if head[offset:offset + len(magic)] == magic:
+            return mimetype
+    return default
+
+
+def image_response_headers(mimetype):
+    """
+    Тип и заголовки для отдачи сохранённого файла. Браузер не должен угадывать тип
+    (nosniff), а всё, что не из списка изображений, только скачивается.
+    """
+    if mimetype in IMAGE_MIMETYPES:
+        return mimetype, {"X-Content-Type-Options": "nosniff", "Content-Disposition": "inline"}
+    return "application/octet-stream", {"X-Content-Type-Options": "nosniff", "Content-Disposition": "attachment"}
+
+
+class BlobTooLargeError(Exception):
+    """Загружаемый файл превысил допустимый размер."""
+
+
+class UnsupportedImageError(Exception):
+    """Содержимое файла не похоже ни на один поддерживаемый формат изображения."""
+
+
+class BlobInfo:
+    def __init__(self, key, size, mimetype):
+        self.key = key
+        self.size = size
+        self.mimetype = mimetype
+
+    def __repr__(self):
+        return f"BlobInfo(key={self.key!r}, size={self.size}, mimetype={self.mimetype!r})"
+
+
+# ----------------- Потоковая запись -----------------
+class BlobWriter:
+    """
+    Файлоподобный объект для записи блоба по частям. Хэш SHA-256 считается
+    по мере поступления данных, а превышение max_size обрывает запись сразу,
+    не дожидаясь конца загрузки. Подходит как stream_factory для werkzeug.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.size = 0
+        self.head = b""
+        self.finished = False
+        self._digest = hashlib.sha256()
+
+    def write(self, chunk):
+        if self.max_size is not None and self.size + len(chunk) > self.max_size:
+            self.abort()
+            raise BlobTooLargeError(f"Файл больше допустимого размера {self.max_size} байт")
+        if len(self.head) < 16:
+            self.head += chunk[:16 - len(self.head)]
+        self._digest.update(chunk)
+        self.size += len(chunk)
+        self._write(chunk)
+        return len(chunk)
+
+    def seek(self, *args):
+        # werkzeug перематывает контейнер после записи; читать из него мы не будем
+        return 0
+
+    def tell(self):
+        return self.size
+
+    def commit(self, require_image=True):
+        """
+        Сохранить блоб. Тип определяется только по содержимому: Content-Type клиента не
+        используется. Если это не изображение, запись отменяется (UnsupportedImageError),
+        кроме require_image=False — тогда тип application/octet-stream.
+        """
+        mimetype = sniff_mimetype(self.head, None)
+        if mimetype is None and require_image:
+            self.abort()
+            raise UnsupportedImageError("Файл не является изображением поддерживаемого формата")
+        key = self._digest.hexdigest()
+        # При ошибке _commit сам освобождает ресурсы, повторный abort не нужен
+        self.finished = True
+        self._commit(key)
+        return BlobInfo(key, self.size, mimetype or "application/octet-stream")
+
+    def abort(self):
+        if not self.finished:
+            self.finished = True
+            self._abort()
+
+    def _write(self, chunk):
+        raise NotImplementedError
+
+    def _commit(self, key):
+        raise NotImplementedError
+
+    def _abort(self):
+        raise NotImplementedError
+
+
+# ----------------- Интерфейс хранилища -----------------
+class BlobStorage:
+    """
+    Хранилище содержимого, адресуемого по SHA-256. Одинаковые файлы
+    сохраняются один раз.
+    """
+
+    def open_writer(self, max_size=None):
+        raise NotImplementedError
+
+    def put(self, stream, chunk_size=CHUNK_SIZE, max_size=None, require_image=True):
+        """Сохранить поток по частям и вернуть BlobInfo (require_image — см. BlobWriter.commit)."""
+        writer = self.open_writer(max_size)
+        try:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                writer.write(chunk)
+            return writer.commit(require_image)
+        except BaseException:
+            writer.abort()
+            raise
+
+    def open(self, key):
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Путь к файлу на диске, если бэкенд его предоставляет (для sendfile)."""
+        return None
+
+
+# ----------------- Локальная файловая система -----------------
+class LocalBlobWriter(BlobWriter):
+    def __init__(self, storage, max_size=None):
+        super().__init__(max_size)
+        self.storage = storage
+        fd, self.tmp_path = tempfile.mkstemp(dir=storage.tmp_dir)
+        self._file = os.fdopen(fd, "wb")
+
+    def _write(self, chunk):
+        self._file.write(chunk)
+
+    def _commit(self, key):
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            path = self.storage.local_path(key)
+            if os.path.exists(path):
+                # Такой файл уже есть — дубликат не сохраняем
+                os.unlink(self.tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(self.tmp_path, path)
+        except BaseException:
+            self._abort()
+            raise
+
+    def _abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+
+class LocalBlobStorage(BlobStorage):
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def _path(self, key):
+        if len(key) != 64 or not all(c in "0123456789abcdef" for c in key):
+            raise ValueError(f"Некорректный ключ блоба: {key}")
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def open_writer(self, max_size=None):
+        return LocalBlobWriter(self, max_size)
+
+    def open(self, key):
+        return open(self._path(key), "rb")
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key):
+        return self._path(key)
+
+
+# ----------------- Large objects PostgreSQL -----------------
+class LargeObjectWriter(BlobWriter):
+    def __init__(self, storage, max_size=None):
+        super().__init__(max_size)
+        self.storage = storage
+        self.conn = storage.pool.getconn()
+        self.lobject = self.conn.lobject(0, "wb")
+
+    def _write(self, chunk):
+        self.lobject.write(chunk)
+
+    def _commit(self, key):
+        try:
+            self.lobject.close()
+            with self.conn.cursor() as cur:
+                cur.execute("INSERT INTO image_large_objects (sha256, oid, size) VALUES (%s, %s, %s)"
+                            " ON CONFLICT (sha256) DO NOTHING",
+                            (key, self.lobject.oid, self.size))
+                if cur.rowcount:
+                    self.conn.commit()
+                else:
+                    # Такой файл уже есть — новый large object откатывается вместе с транзакцией
+                    self.conn.rollback()
+        except BaseException:
+            self._abort()
+            raise
+        self.storage.pool.putconn(self.conn)
+
+    def _abort(self):
+        try:
+            self.conn.rollback()
+        finally:
+            self.storage.pool.putconn(self.conn)
+
+
+class LargeObjectReader(io.RawIOBase):
+    """Чтение large object по частям; соединение возвращается в пул при close()."""
+
+    def __init__(self, storage, oid):
+        self.storage = storage
+        self.conn = storage.pool.getconn()
+        try:
+            self.lobject = self.conn.lobject(oid, "rb")
+        except BaseException:
+            storage.pool.putconn(self.conn)
+            raise
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.lobject.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self.lobject.close()
+                self.conn.rollback()
+            finally:
+                self.storage.pool.putconn(self.conn)
+        super().close()
+
+
+class LargeObjectBlobStorage(BlobStorage):
+    """Блобы в large objects PostgreSQL (таблица image_large_objects, миграция 0003)."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def _oid(self, key):
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT oid FROM image_large_objects WHERE sha256 = %s", (key,))
+                row = cur.fetchone()
+            conn.rollback()
+            return row['oid'] if row else None
+        finally:
+            self.pool.putconn(conn)
+
+    def open_writer(self, max_size=None):
+        return LargeObjectWriter(self, max_size)
+
+    def open(self, key):
+        oid = self._oid(key)
+        if oid is None:
+            raise FileNotFoundError(key)
+        return io.BufferedReader(LargeObjectReader(self, oid), buffer_size=CHUNK_SIZE)
+
+    def exists(self, key):
+        return self._oid(key) is not None
+
+    def delete(self, key):
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT lo_unlink(oid) FROM image_large_objects WHERE sha256 = %s", (key,))
+                cur.execute("DELETE FROM image_large_objects WHERE sha256 = %s", (key,))
+            conn.commit()
+        finally:
+            self.pool.putconn(conn)
+
+
+# ----------------- Выбор бэкенда -----------------
+def get_blob_storage(backend=None, db_handler=None):
+    backend = backend or os.getenv("FSTR_BLOB_BACKEND", "local")
+    if backend == "local":
+        return LocalBlobStorage(
+            os.getenv("FSTR_BLOB_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "blobs")))
+    if backend == "pg_large_object":
+        if db_handler is None:
+            raise ValueError("Для хранилища pg_large_object нужен DatabaseHandler")
+        return LargeObjectBlobStorage(db_handler.pool)
+    raise ValueError(f"Неизвестное хранилище изображений: {backend}")
@@ -0,0 +1,113 @@
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Brotli не установлен — ответы сжимаются только gzip
+    brotli = None
+
+# Ответы короче порога не сжимаются: выигрыш меньше заголовков и затрат CPU
+MIN_SIZE = int(os.getenv("FSTR_COMPRESS_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("FSTR_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("FSTR_BROTLI_QUALITY", 5))
+
+# Кодировки в порядке предпочтения сервера при одинаковом q у клиента
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+# Сжимаются только текстовые форматы; изображения и архивы уже сжаты
+COMPRESSIBLE_TYPES = {
+    "application/json", "application/geo+json", "application/x-ndjson", "application/javascript",
+    "application/xml", "image/svg+xml",
+}
+
+
+def is_compressible(mimetype):
+    return bool(mimetype) and (mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES)
+
+
+def negotiate(accept_encodings):
+    """Кодировка из Accept-Encoding (werkzeug MIMEAccept/Accept) или None — без сжатия."""
+    return accept_encodings.best_match(ENCODINGS) if accept_encodings else None
+
+
+# ----------------- ETag сжатого представления -----------------
+def encoded_etag(etag, encoding):
+    """
+    Сильный ETag сжатого ответа: байты представления другие, поэтому и ETag другой
+    (как mod_deflate в Apache: "<etag>-gzip").
+    """
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def base_etag(etag):
+    """ETag без суффикса кодировки — для сравнения с If-None-Match."""
+    for encoding in ENCODINGS:
+        if etag.endswith(f"-{encoding}"):
+            return etag[:-len(encoding) - 1]
+    return etag
+
+
+# ----------------- Сжатие -----------------
+class _Gzip:
+    def __init__(self):
+        self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def process(self, data):
+        # Z_SYNC_FLUSH: каждая часть потокового ответа уходит клиенту сразу, а не копится в буфере
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self):
+        self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def process(self, data):
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self):
+        return self._obj.finish()
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return zlib.compress(data, GZIP_LEVEL, wbits=31)
+
+
+def compress_stream(chunks, encoding):
+    """Сжимать части потокового ответа по мере их появления."""
+    compressor = _Brotli() if encoding == "br" else _Gzip()
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        if chunk:
+            yield compressor.process(chunk)
+    yield compressor.finish()
+
+
+def will_compress(response, encoding):
+    """
+    Сожмёт ли compress_response этот ответ. Ответы, отдаваемые файлами (send_file),
+    несжимаемые типы и ответы с Content-Encoding не трогаются; обычные ответы короче
+    MIN_SIZE отдаются как есть.
+    """
+    if (encoding is None or response.direct_passthrough or "Content-Encoding" in response.headers
+            or not is_compressible(response.mimetype)):
+        return False
+    return response.is_streamed or len(response.get_data()) >= MIN_SIZE
+
+
+def compress_response(response, encoding):
+    """Сжать ответ Flask/werkzeug выбранной кодировкой (см. will_compress). Возвращает True, если ответ сжат."""
+    if not will_compress(response, encoding):
+        return False
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+    response.headers["Content-Encoding"] = encoding
+    return True
@@ -1,23 +1,307 @@
 import os
+import re
 import logging
 import psycopg2
-from psycopg2.extras import RealDictCursor
-import json
+import psycopg2.extras
+from psycopg2.extras import RealDictCursor, execute_values
+import time
+import base64
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from functools import partial
+
+from db_pool import ConnectionPool
+from db_router import ReplicaRouter, is_connection_error
+from metrics import POOL_ACQUIRE_DURATION, InstrumentedCursor, instrumented, timed_json_loads
+from serialization import dumps_text
+from validation import validate_images, validate_raw_data
+import geo
 
 # ----------------- Логирование -----------------
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PEREVAL_COLUMNS = "id, raw_data, images, status, date_added, date_updated"
+PAGE_LIMIT_DEFAULT = 50
+PAGE_LIMIT_MAX = 500
+PEREVAL_STATUSES = ('new', 'pending', 'accepted', 'rejected')
+EXPORT_BATCH_SIZE = 1000
+
+# Перевал целиком как JSON-текст, собранный в PostgreSQL: raw_data и images не разбираются
+# в Python. Даты в формате HTTP (UTC), как у serialization.json_default
+HTTP_DATE_FORMAT = 'Dy, DD Mon YYYY HH24:MI:SS "GMT"'
+PEREVAL_JSON = f"""json_build_object(
+    'id', id, 'raw_data', COALESCE(raw_data, '[]'), 'images', COALESCE(images, '[]'), 'status', status,
+    'date_added', to_char(date_added, '{HTTP_DATE_FORMAT}'),
+    'date_updated', to_char(date_updated, '{HTTP_DATE_FORMAT}')
+)::text AS json"""
+
+# Точка перевала для карты: координаты из столбцов миграции 0007 и минимум свойств
+GEO_COLUMNS = "id, lat, lon, raw_data->>'title' AS title, status"
+# Расстояние по гаверсинусу от точки (%(lat)s, %(lon)s), км
+GEO_DISTANCE = f"""2 * {geo.EARTH_RADIUS_KM} * asin(least(1, sqrt(
+    power(sin(radians(lat - %(lat)s) / 2), 2)
+    + cos(radians(%(lat)s)) * cos(radians(lat)) * power(sin(radians(lon - %(lon)s) / 2), 2))))"""
+
+# Поиск по названиям (миграция 0008): сколько совпадений ранжируется, порог сходства
+# pg_trgm для исправления опечаток и сколько похожих слов словаря берётся на слово запроса
+SEARCH_CANDIDATES = int(os.getenv("FSTR_SEARCH_CANDIDATES", 500))
+SEARCH_SIMILARITY = float(os.getenv("FSTR_SEARCH_SIMILARITY", 0.4))
+SEARCH_VARIANTS = int(os.getenv("FSTR_SEARCH_VARIANTS", 5))
+SEARCH_MAX_TERMS = 8
+
+# PATCH перевала (миграция 0010): что можно менять и какие поля raw_data защищены.
+# Путь через точку — вложенное поле (user.email)
+PATCHABLE_FIELDS = ("raw_data", "images")
+PROTECTED_FIELDS = ("fio", "email", "phone", "user.fio", "user.email", "user.phone")
+PATCH_MESSAGES = {
+    "updated": "Запись успешно обновлена",
+    "not_found": "Запись не найдена",
+    "not_new": "Редактирование запрещено: статус не 'new'",
+    "version_mismatch": "Запись уже изменена: версия не совпадает с If-Match",
+}
+
+# Слияние, проверки статуса, версии и защищённых полей — одним UPDATE. Внешний SELECT видит
+# строку до изменения и объясняет, какое условие не выполнилось
+PATCH_SQL = """
+WITH updated AS (
+    UPDATE pereval_added p
+    SET raw_data = jsonb_merge_patch(p.raw_data, %(raw_data)s::jsonb),
+        images = CASE WHEN %(set_images)s THEN %(images)s::jsonb ELSE p.images END,
+        date_updated = NOW()
+    WHERE p.id = %(id)s AND p.status = 'new'
+      AND (%(versions)s::int[] IS NULL OR p.version = ANY(%(versions)s::int[]))
+      AND NOT EXISTS (
+          SELECT 1 FROM unnest(%(protected)s::text[]) AS f
+          WHERE jsonb_merge_patch(p.raw_data, %(raw_data)s::jsonb) #> string_to_array(f, '.')
+                IS DISTINCT FROM p.raw_data #> string_to_array(f, '.'))
+    RETURNING p.version
+)
+SELECT c.status, c.version, u.version AS new_version,
+       (SELECT f FROM unnest(%(protected)s::text[]) AS f
+        WHERE jsonb_merge_patch(c.raw_data, %(raw_data)s::jsonb) #> string_to_array(f, '.')
+              IS DISTINCT FROM c.raw_data #> string_to_array(f, '.')
+        LIMIT 1) AS protected_field
+FROM pereval_added c LEFT JOIN updated u ON true
+WHERE c.id = %(id)s
+"""
+
+# Очередь модерации (миграция 0011): срок аренды захваченных заявок по умолчанию и наибольший, с,
+# и сколько заявок можно захватить или решить одним запросом
+MODERATION_LEASE = int(os.getenv("FSTR_MODERATION_LEASE", 900))
+MODERATION_LEASE_MAX = 7 * 24 * 3600
+MODERATION_CLAIM_MAX = 100
+MODERATION_BULK_MAX = int(os.getenv("FSTR_MODERATION_BULK_MAX", 1000))
+MODERATION_DECISIONS = ('accepted', 'rejected')
+
+# Сначала просроченные аренды, затем новые заявки по порядку поступления. SKIP LOCKED:
+# модераторы, захватывающие одновременно, получают разные заявки и не ждут друг друга.
+# id передаются массивом: с соединением по CTE планировщик не знает, что строк не больше
+# limit, и выбирает полный просмотр таблицы
+CLAIM_SQL = """
+WITH expired AS (
+    SELECT id FROM pereval_added
+    WHERE status = 'pending' AND (claimed_until IS NULL OR claimed_until < NOW())
+    ORDER BY claimed_until NULLS FIRST
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+), fresh AS (
+    SELECT id FROM pereval_added
+    WHERE status = 'new'
+    ORDER BY date_added, id
+    LIMIT %(limit)s - (SELECT count(*) FROM expired)
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE pereval_added p
+SET status = 'pending', claimed_by = %(moderator)s, claimed_until = NOW() + make_interval(secs => %(lease)s)
+WHERE p.id = ANY(ARRAY(SELECT id FROM expired UNION ALL SELECT id FROM fresh))
+RETURNING p.id, p.raw_data, p.images, p.status, p.date_added, p.date_updated, p.claimed_until
+"""
+
+# Синхронизация офлайн-клиентов (миграция 0012): источники в порядке выдачи — имя в ответе,
+# таблица, JSON строки и условие области видимости (перевалы — только свои, по email)
+SYNC_SOURCES = (
+    ("perevals", "pereval_added", PEREVAL_JSON, "(raw_data->'user'->>'email') = %(scope)s"),
+    ("areas", "pereval_areas",
+     "json_build_object('id', id, 'id_parent', id_parent, 'title', title)::text AS json", None),
+    ("activities", "spr_activities_types", "json_build_object('id', id, 'title', title)::text AS json", None),
+)
+# Сколько дней хранятся записи об удалении: более старый курсор требует полной синхронизации
+SYNC_RETENTION_DAYS = int(os.getenv("FSTR_SYNC_RETENTION_DAYS", 30))
+SYNC_MAX_ID = 2 ** 63 - 1
+
+# Статистика (миграция 0013): разрезы и счётчики pereval_stats, из которых они состоят.
+# Область считается вместе с подобластями — по таблице замыкания, как /areas/<id>/perevals
+STATS_DIMENSIONS = {
+    "area": ("area",),
+    "status": ("status",),
+    "level": ("level.summer", "level.winter", "level.autumn", "level.spring"),
+    "height": ("height",),
+    "month": ("month",),
+}
+STATS_SQL = """
+WITH counts AS (
+    SELECT dimension, key, sum(count) AS count FROM pereval_stats
+    WHERE dimension = ANY(%(dimensions)s)
+    GROUP BY dimension, key HAVING sum(count) <> 0
+)
+SELECT dimension, key, count FROM counts WHERE dimension <> 'area' OR key = ''
+UNION ALL
+SELECT 'area', COALESCE(c.ancestor_id::text, a.key), sum(a.count)
+FROM counts a LEFT JOIN pereval_area_closure c
+    ON c.descendant_id = CASE WHEN a.dimension = 'area' AND a.key ~ '^[0-9]{1,18}$' THEN a.key::int8 END
+WHERE a.dimension = 'area' AND a.key <> ''
+GROUP BY 2
+"""
+
+# Разбор json/jsonb из ответов БД учитывается в метрике fstr_json_decode_seconds_total
+psycopg2.extras.register_default_json(globally=True, loads=timed_json_loads)
+psycopg2.extras.register_default_jsonb(globally=True, loads=timed_json_loads)
+
+
+# ----------------- Курсоры постраничной выборки -----------------
+def encode_cursor(row):
+    """Непрозрачный курсор keyset-пагинации по (date_added, id)."""
+    raw = f"{row['date_added'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date_added, pereval_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(date_added), int(pereval_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+
+
+def encode_key_cursor(*values):
+    """Непрозрачный курсор по произвольному ключу сортировки, например (расстояние, id)."""
+    raw = "|".join(repr(v) for v in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_key_cursor(cursor, types):
+    """Разобрать курсор encode_key_cursor; types — типы элементов ключа."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        if len(parts) != len(types):
+            raise ValueError(f"ожидается {len(types)} элемента ключа")
+        return tuple(t(p) for t, p in zip(types, parts))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+
+
+def encode_sync_cursor(base, base_at, target=None, target_at=None, position=None):
+    """
+    Курсор синхронизации. base — снимок (pg_snapshot) прошлой синхронизации и время его
+    получения; при выдаче по страницам target — снимок первой страницы, position —
+    (xid, ранг, id) последнего отданного изменения.
+    """
+    xid, rank, row_id = position or ("", "", "")
+    raw = f"{base or ''}|{base_at or ''}|{target or ''}|{target_at or ''}|{xid}|{rank}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_sync_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        base, base_at, target, target_at, xid, rank, row_id = \
+            base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        position = (int(xid), int(rank), int(row_id)) if target else None
+        return (base or None, float(base_at) if base else None,
+                target or None, float(target_at) if target else None, position)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+
+
+def sync_lower_bound(rank, position):
+    """Нижняя граница (xid, id) источника с данным рангом, чтобы продолжить после position."""
+    xid, last_rank, last_id = position
+    if rank < last_rank:
+        return xid, SYNC_MAX_ID
+    if rank == last_rank:
+        return xid, last_id
+    return xid, -1
+
+
+def search_terms(text):
+    """Слова запроса так же, как они нормализованы в search_title: нижний регистр, «ё» → «е»."""
+    return re.findall(r"\w+", (text or "").lower().replace("ё", "е"))[:SEARCH_MAX_TERMS]
+
+
+def tsquery_quote(word):
+    """Слово как лексема tsquery в кавычках."""
+    return "'" + word.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def clamp_limit(limit):
+    if limit is None:
+        return PAGE_LIMIT_DEFAULT
+    limit = int(limit)
+    if limit < 1:
+        raise ValueError("limit должен быть положительным")
+    return min(limit, PAGE_LIMIT_MAX)
+
+
+# ----------------- Потоковая выдача страницы -----------------
+class PerevalStream:
+    """
+    Итератор по странице перевалов, читающий строки серверным курсором.
+    После полного прохода в ``next_cursor`` лежит курсор следующей страницы
+    (или None, если страница последняя).
+    """
+
+    def __init__(self, handler, limit, after=None, itersize=100):
+        self.handler = handler
+        self.limit = limit
+        self.after = after
+        self.itersize = itersize
+        self.next_cursor = None
+
+    def __iter__(self):
+        query, params = self.handler._keyset_query(self.limit, self.after)
+        with self.handler.connection(read_only=True) as conn:
+            with conn.cursor(name="perevals_stream", cursor_factory=RealDictCursor) as cur:
+                cur.itersize = self.itersize
+                cur.execute(query, params)
+                last = None
+                for n, row in enumerate(cur):
+                    if n == self.limit:
+                        self.next_cursor = encode_cursor(last)
+                        break
+                    row['raw_data'] = self.handler.parse_json_field(row['raw_data'])
+                    row['images'] = self.handler.parse_json_field(row['images'])
+                    last = row
+                    yield row
+
 # ----------------- DatabaseHandler -----------------
 class DatabaseHandler:
-    def __init__(self, host=None, port=None, user=None, password=None, database=None):
+    def __init__(self, host=None, port=None, user=None, password=None, database=None,
+                 pool_min=None, pool_max=None, pool_timeout=None, dsn=None, replica_dsns=None):
         self.host = host or os.getenv('FSTR_DB_HOST', 'dpg-d363cj2li9vc738t3dn0-a.oregon-postgres.render.com')
         self.port = port or os.getenv('FSTR_DB_PORT', '5432')
         self.user = user or os.getenv('FSTR_DB_LOGIN', os.getenv('FSTR_LOGIN', 'pereval_pvcx'))
         self.password = password or os.getenv('FSTR_DB_PASS', 'tqa9CrJHcFjPKwuuwaUbAmGzmjyhJarO')
         self.database = database or os.getenv('FSTR_DB_NAME', 'pereval_pvcx_user')
+        # DSN основного сервера заменяет параметры выше; реплики — DSN через запятую
+        self.dsn = dsn or os.getenv('FSTR_DB_DSN')
+        if replica_dsns is None:
+            replica_dsns = [d.strip() for d in os.getenv('FSTR_DB_REPLICA_DSNS', '').split(',') if d.strip()]
+        self.replica_dsns = list(replica_dsns)
+        self.pool_min = int(pool_min if pool_min is not None else os.getenv('FSTR_DB_POOL_MIN', 1))
+        self.pool_max = int(pool_max if pool_max is not None else os.getenv('FSTR_DB_POOL_MAX', 10))
+        self.pool_timeout = float(pool_timeout if pool_timeout is not None else os.getenv('FSTR_DB_POOL_TIMEOUT', 30))
+        self._router = None
+        self._pool_lock = threading.Lock()
+        # Вызываются с id перевала после фиксации его изменения (сброс кэшей этого процесса)
+        self.change_listeners = []
 
     def get_connection(self):
+        if self.dsn:
+            return self._connect_dsn(self.dsn)
         # Включаем SSL только если хост не localhost
         ssl_mode = "require" if self.host != "localhost" else "disable"
 
@@ -28,236 +312,1035 @@ class DatabaseHandler:
             password=self.password,
             dbname=self.database,
             sslmode=ssl_mode,
-            cursor_factory=RealDictCursor
+            cursor_factory=InstrumentedCursor
         )
         conn.set_client_encoding('UTF8')
         return conn
 
+    @staticmethod
+    def _connect_dsn(dsn):
+        # Недоступная реплика должна быстро уступить очередь следующей, а не ждать таймаута TCP
+        conn = psycopg2.connect(dsn, cursor_factory=InstrumentedCursor,
+                                connect_timeout=int(os.getenv('FSTR_DB_CONNECT_TIMEOUT', 3)))
+        conn.set_client_encoding('UTF8')
+        return conn
+
+    # ----------------- Пул соединений -----------------
+    def _make_pool(self, connect_factory):
+        return ConnectionPool(
+            connect_factory,
+            min_size=self.pool_min,
+            max_size=self.pool_max,
+            timeout=self.pool_timeout,
+            max_idle=float(os.getenv('FSTR_DB_POOL_MAX_IDLE', 300)),
+            max_lifetime=float(os.getenv('FSTR_DB_POOL_MAX_LIFETIME', 3600)),
+        )
+
+    @property
+    def router(self):
+        # Пулы создаются лениво при первом запросе, уже в процессе воркера
+        if self._router is None:
+            with self._pool_lock:
+                if self._router is None:
+                    replicas = [(f"replica{n}", self._make_pool(partial(self._connect_dsn, dsn)))
+                                for n, dsn in enumerate(self.replica_dsns, 1)]
+                    primary = self._make_pool(self.get_connection)
+                    try:
+                        # FSTR_DB_POOL_MIN соединений открываются сразу, уже в процессе воркера
+                        primary.prefill()
+                    except Exception as e:
+                        logger.error(f"Ошибка открытия соединений пула: {e}")
+                    self._router = ReplicaRouter(primary, replicas)
+        return self._router
+
+    @property
+    def pool(self):
+        """Пул основного сервера."""
+        return self.router.primary.pool
+
+    @property
+    def has_replicas(self):
+        return bool(self.replica_dsns)
+
+    def request_scope(self, read_after=None):
+        """Границы HTTP-запроса для выбора реплики, см. ReplicaRouter.request_scope."""
+        return self.router.request_scope(read_after)
+
+    @contextmanager
+    def connection(self, read_only=False):
+        """
+        Взять соединение из пула и вернуть его обратно по выходу из блока.
+        read_only=True — запрос только читает и может уйти на реплику; если она
+        не отвечает, берётся следующая, а затем основной сервер.
+        При исключении незавершённая транзакция откатывается, а разорванное
+        соединение выбрасывается из пула; реплика исключается только при ошибке
+        соединения, но не запроса (таймаут, конфликт с восстановлением).
+        """
+        router = self.router
+        started = time.perf_counter()
+        while True:
+            target = router.choose(read_only)
+            try:
+                conn = target.pool.getconn()
+                break
+            except psycopg2.OperationalError as e:
+                if target.primary:
+                    raise
+                router.mark_failed(target, e)
+        POOL_ACQUIRE_DURATION.observe(time.perf_counter() - started)
+        router.checked_out(target)
+        pool = target.pool
+        discard = False
+        try:
+            yield conn
+        except Exception as e:
+            if is_connection_error(e, conn):
+                discard = True
+                router.mark_failed(target, e)
+            elif not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn, discard=discard)
+
+    @instrumented
+    def current_lsn(self):
+        """Текущая позиция WAL основного сервера — токен read-your-writes после записи."""
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_current_wal_lsn()::text AS lsn")
+            lsn = cur.fetchone()['lsn']
+            conn.rollback()
+            return lsn
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    def routing_stats(self):
+        """Основной сервер и реплики: выдачи соединений, отставание, доступность."""
+        return self.router.stats()
+
+    def close(self):
+        if self._router is not None:
+            self._router.close()
+            self._router = None
+
 
     # ----------------- Вспомогательные методы -----------------
     def parse_json_field(self, field):
         if isinstance(field, str):
-            return json.loads(field)
+            return timed_json_loads(field)
         elif field is None:
             return []
         return field
 
     # ----------------- Добавление перевала -----------------
+    @instrumented
     def add_pereval(self, raw_data, images):
         query = """
         INSERT INTO pereval_added (raw_data, images, status, date_added)
         VALUES (%s, %s, 'new', NOW())
         RETURNING id
         """
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cur:
-                cur.execute(query, (json.dumps(raw_data, ensure_ascii=False),
-                                    json.dumps(images, ensure_ascii=False)))
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute(query, (dumps_text(raw_data),
+                                    dumps_text(images)))
                 pereval_id = cur.fetchone()['id']
                 conn.commit()
-                logger.info(f"Перевал добавлен, ID: {pereval_id}")
-                return pereval_id
+            logger.info(f"Перевал добавлен, ID: {pereval_id}")
+            return pereval_id
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"Ошибка добавления перевала: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
+
+    # ----------------- Пакетное добавление перевалов -----------------
+    @instrumented
+    def add_perevals_batch(self, items):
+        """
+        Добавить список (raw_data, images) одной транзакцией многострочным INSERT.
+        id выделяются заранее из последовательности, поэтому возвращаются строго
+        в порядке items.
+        """
+        if not items:
+            return []
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute("SELECT nextval('pereval_id_seq') AS id FROM generate_series(1, %s)", (len(items),))
+                ids = [r['id'] for r in cur.fetchall()]
+                rows = [(pereval_id, dumps_text(raw_data), dumps_text(images))
+                        for pereval_id, (raw_data, images) in zip(ids, items)]
+                execute_values(cur, """
+                    INSERT INTO pereval_added (id, raw_data, images, status, date_added) VALUES %s
+                """, rows, template="(%s, %s, %s, 'new', NOW())", page_size=500)
+                conn.commit()
+            logger.info(f"Пакетно добавлено перевалов: {len(ids)}")
+            return ids
+        except Exception as e:
+            logger.error(f"Ошибка пакетного добавления перевалов: {e}")
+            raise
+
+    @instrumented
+    def add_perevals_ingested(self, items):
+        """
+        Перенести заявки из очереди приёма: items — список (ingest_id, raw_data, images).
+        Уже перенесённые заявки пропускаются по уникальному ingest_id, поэтому
+        повтор пачки безопасен. Возвращает {ingest_id: id перевала}.
+        """
+        if not items:
+            return {}
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                rows = [(ingest_id, dumps_text(raw_data), dumps_text(images))
+                        for ingest_id, raw_data, images in items]
+                execute_values(cur, """
+                    INSERT INTO pereval_added (ingest_id, raw_data, images, status, date_added) VALUES %s
+                    ON CONFLICT (ingest_id) DO NOTHING
+                """, rows, template="(%s, %s, %s, 'new', NOW())", page_size=500)
+                cur.execute("SELECT id, ingest_id FROM pereval_added WHERE ingest_id = ANY(%s)",
+                            ([ingest_id for ingest_id, _, _ in items],))
+                ids = {r['ingest_id']: r['id'] for r in cur.fetchall()}
+                conn.commit()
+            logger.info(f"Перенесено заявок из очереди: {len(ids)}")
+            return ids
+        except Exception as e:
+            logger.error(f"Ошибка переноса заявок из очереди: {e}")
+            raise
 
     # ----------------- Получение всех перевалов -----------------
+    @instrumented
     def get_all_perevals(self):
         query = "SELECT id, raw_data, images, status, date_added, date_updated FROM pereval_added ORDER BY date_added DESC"
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cur:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
                 cur.execute(query)
                 results = cur.fetchall()
-                for r in results:
-                    r['raw_data'] = self.parse_json_field(r['raw_data'])
-                    r['images'] = self.parse_json_field(r['images'])
-                return results
+            for r in results:
+                r['raw_data'] = self.parse_json_field(r['raw_data'])
+                r['images'] = self.parse_json_field(r['images'])
+            return results
         except Exception as e:
             logger.error(f"Ошибка получения всех перевалов: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
+
+    # ----------------- Постраничная выборка перевалов -----------------
+    def _keyset_query(self, limit, after=None, conditions=(), condition_params=(), columns=PEREVAL_COLUMNS):
+        # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+        conditions = list(conditions)
+        params = list(condition_params)
+        if after:
+            conditions.append("(date_added, id) < (%s, %s)")
+            params.extend(decode_cursor(after))
+        params.append(limit + 1)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT {columns} FROM pereval_added {where} ORDER BY date_added DESC, id DESC LIMIT %s"
+        return query, params
+
+    @instrumented
+    def get_perevals_page(self, limit=PAGE_LIMIT_DEFAULT, after=None, conditions=(), condition_params=(),
+                          raw_json=False):
+        """
+        Страница перевалов и курсор следующей. raw_json=True — элементы страницы
+        строками JSON из БД (см. PEREVAL_JSON) для передачи в ответ без разбора.
+        """
+        columns = f"{PEREVAL_JSON}, date_added, id" if raw_json else PEREVAL_COLUMNS
+        query, params = self._keyset_query(limit, after, conditions, condition_params, columns)
+        try:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute(query, params)
+                results = cur.fetchall()
+            next_cursor = encode_cursor(results[limit - 1]) if len(results) > limit else None
+            results = results[:limit]
+            if raw_json:
+                return [r['json'] for r in results], next_cursor
+            for r in results:
+                r['raw_data'] = self.parse_json_field(r['raw_data'])
+                r['images'] = self.parse_json_field(r['images'])
+            return results, next_cursor
+        except Exception as e:
+            logger.error(f"Ошибка постраничной выборки перевалов: {e}")
+            raise
+
+    def iter_perevals_page(self, limit=PAGE_LIMIT_DEFAULT, after=None):
+        return PerevalStream(self, limit, after)
+
+    @instrumented
+    def get_perevals_by_area(self, area_id, limit=PAGE_LIMIT_DEFAULT, after=None, raw_json=False):
+        """Перевалы области и всех её подобластей (через таблицу замыкания pereval_area_closure)."""
+        return self.get_perevals_page(
+            limit, after,
+            conditions=["area_id IN (SELECT descendant_id FROM pereval_area_closure WHERE ancestor_id = %s)"],
+            condition_params=[area_id],
+            raw_json=raw_json,
+        )
+
+    # ----------------- Поиск перевалов по координатам -----------------
+    @staticmethod
+    def _geo_box_condition(min_lon, min_lat, max_lon, max_lat, params):
+        # Каждый прямоугольник — отдельное условие <@, которое обслуживает GiST-индекс pereval_added_geo_idx
+        boxes = []
+        for n, box in enumerate(geo.split_bbox(min_lon, min_lat, max_lon, max_lat)):
+            names = [f"box{n}_{i}" for i in range(4)]
+            params.update(zip(names, box))
+            boxes.append(f"point(lon, lat) <@ box(point(%({names[0]})s, %({names[1]})s), "
+                         f"point(%({names[2]})s, %({names[3]})s))")
+        return f"lat IS NOT NULL AND lon IS NOT NULL AND ({' OR '.join(boxes)})"
+
+    @instrumented
+    def get_perevals_in_bbox(self, min_lon, min_lat, max_lon, max_lat, limit=PAGE_LIMIT_DEFAULT, after_id=0):
+        """Точки перевалов в прямоугольнике по возрастанию id и id последней точки, если есть ещё."""
+        params = {"after_id": after_id, "limit": limit + 1}
+        condition = self._geo_box_condition(min_lon, min_lat, max_lon, max_lat, params)
+        try:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT {GEO_COLUMNS} FROM pereval_added
+                    WHERE {condition} AND id > %(after_id)s
+                    ORDER BY id LIMIT %(limit)s
+                """, params)
+                results = cur.fetchall()
+            next_id = results[limit - 1]['id'] if len(results) > limit else None
+            return results[:limit], next_id
+        except Exception as e:
+            logger.error(f"Ошибка поиска перевалов в прямоугольнике: {e}")
+            raise
+
+    @instrumented
+    def get_perevals_within(self, lat, lon, radius_km, limit=PAGE_LIMIT_DEFAULT, after=None):
+        """
+        Перевалы не дальше radius_km от точки по возрастанию расстояния.
+        after — (distance_km, id) последней точки предыдущей страницы; второй
+        элемент результата — такая же пара для следующей страницы или None.
+        Индекс отбирает точки в описанном прямоугольнике, точное расстояние
+        считается только для них.
+        """
+        after_distance, after_id = after or (-1.0, 0)
+        params = {"lat": lat, "lon": lon, "radius": radius_km, "after_distance": after_distance,
+                  "after_id": after_id, "limit": limit + 1}
+        condition = self._geo_box_condition(*geo.bbox_around(lat, lon, radius_km), params)
+        try:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT * FROM (
+                        SELECT {GEO_COLUMNS}, {GEO_DISTANCE} AS distance_km
+                        FROM pereval_added WHERE {condition}
+                    ) p
+                    WHERE distance_km <= %(radius)s AND (distance_km, id) > (%(after_distance)s, %(after_id)s)
+                    ORDER BY distance_km, id LIMIT %(limit)s
+                """, params)
+                results = cur.fetchall()
+            if len(results) > limit:
+                last = results[limit - 1]
+                return results[:limit], (last['distance_km'], last['id'])
+            return results, None
+        except Exception as e:
+            logger.error(f"Ошибка поиска перевалов в радиусе: {e}")
+            raise
+
+    @instrumented
+    def get_nearest_perevals(self, lat, lon, k):
+        """
+        k ближайших перевалов по расстоянию на сфере. GiST-индекс отдаёт k ближайших
+        в градусах (ORDER BY <->); наибольшее расстояние до них по сфере — радиус,
+        в котором заведомо лежат k настоящих ближайших, их и выбирает get_perevals_within.
+        """
+        try:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT lat, lon FROM pereval_added
+                    WHERE lat IS NOT NULL AND lon IS NOT NULL
+                    ORDER BY point(lon, lat) <-> point(%s, %s) LIMIT %s
+                """, (lon, lat, k))
+                candidates = cur.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка поиска ближайших перевалов: {e}")
+            raise
+        if not candidates:
+            return []
+        radius = max(geo.haversine_km(lat, lon, c['lat'], c['lon']) for c in candidates)
+        # Запас на расхождение округления между Python и PostgreSQL
+        results, _ = self.get_perevals_within(lat, lon, radius * (1 + 1e-9) + 1e-6, k)
+        return results
+
+    @instrumented
+    def get_geo_points(self):
+        """Все перевалы с координатами — для сетки тайлов в памяти."""
+        try:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute(f"SELECT {GEO_COLUMNS} FROM pereval_added WHERE lat IS NOT NULL AND lon IS NOT NULL")
+                return cur.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка получения координат перевалов: {e}")
+            raise
+
+    # ----------------- Поиск по названиям -----------------
+    @instrumented
+    def search_perevals(self, text, limit=PAGE_LIMIT_DEFAULT, after=None):
+        """
+        Поиск по beautyTitle, title и other_titles. Каждое слово запроса совпадает
+        с учётом русской морфологии, как начало слова или с опечаткой (похожие
+        слова из словаря pereval_title_words); нужны все слова запроса. Результаты
+        по убыванию score; after — (score, id) последней строки предыдущей страницы,
+        второй элемент результата — такая же пара для следующей страницы или None.
+
+        Ранжируются только SEARCH_CANDIDATES новейших (по id) совпадений: время запроса
+        не растёт с размером таблицы, но для слишком частых слов более старый перевал
+        с высоким score может не попасть в выдачу — такой запрос нужно уточнить.
+        """
+        terms = search_terms(text)
+        if not terms:
+            raise ValueError("Пустой поисковый запрос")
+        try:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
+                # Действует до конца транзакции, соединение возвращается в пул с откатом
+                cur.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)",
+                            (str(SEARCH_SIMILARITY),))
+                cur.execute("""
+                    SELECT q.n, w.word
+                    FROM unnest(%s::text[]) WITH ORDINALITY AS q(term, n)
+                    CROSS JOIN LATERAL (
+                        SELECT word FROM pereval_title_words
+                        WHERE word %% q.term AND word <> q.term
+                        ORDER BY similarity(word, q.term) DESC, word LIMIT %s
+                    ) w
+                """, (terms, SEARCH_VARIANTS))
+                variants = {}
+                for row in cur.fetchall():
+                    variants.setdefault(row['n'] - 1, []).append(row['word'])
+
+                # Слово запроса: (морфология | префикс | похожие слова), слова запроса через AND
+                parts, params = [], []
+                for n, term in enumerate(terms):
+                    alternatives = [f"{tsquery_quote(term)}:*"]
+                    alternatives += [tsquery_quote(word) for word in variants.get(n, ())]
+                    parts.append("(plainto_tsquery('russian', %s) || to_tsquery('simple', %s))")
+                    params += [term, " | ".join(alternatives)]
+                page_condition = ""
+                if after:
+                    page_condition = "WHERE (score, id) < (%s, %s)"
+                cur.execute(f"""
+                    WITH query AS (SELECT {" && ".join(parts)} AS tsq),
+                    -- Из совпадений ранжируются SEARCH_CANDIDATES новейших: набор не зависит от физического
+                    -- порядка строк, и курсор (score, id) не повторяет и не пропускает строки между страницами.
+                    -- MATERIALIZED: совпадения берутся по GIN-индексу, а не обходом первичного ключа с конца
+                    -- до SEARCH_CANDIDATES-го совпадения (для редкого слова — почти вся таблица)
+                    matched AS MATERIALIZED (
+                        SELECT id FROM pereval_added, query WHERE search_tsv @@ query.tsq
+                    ),
+                    candidates AS (SELECT id FROM matched ORDER BY id DESC LIMIT %s)
+                    SELECT * FROM (
+                        SELECT p.id, p.raw_data->>'beautyTitle' AS "beautyTitle", p.raw_data->>'title' AS title,
+                               p.raw_data->>'other_titles' AS other_titles, p.status,
+                               -- float8: курсор передаёт score обратно без потери точности
+                               (ts_rank_cd(p.search_tsv, query.tsq) + word_similarity(%s, p.search_title))::float8
+                                   AS score
+                        FROM candidates JOIN pereval_added p USING (id), query
+                    ) found
+                    {page_condition}
+                    ORDER BY score DESC, id DESC LIMIT %s
+                """, params + [SEARCH_CANDIDATES, " ".join(terms)] + list(after or ()) + [limit + 1])
+                results = cur.fetchall()
+            if len(results) > limit:
+                last = results[limit - 1]
+                return results[:limit], (last['score'], last['id'])
+            return results, None
+        except Exception as e:
+            logger.error(f"Ошибка поиска перевалов по запросу {text!r}: {e}")
+            raise
+
+    @instrumented
+    def prune_title_words(self):
+        """
+        Удалить из словаря pereval_title_words слова, которых больше нет ни в одном
+        названии (перевал удалён или переименован). Триггеры словарь только пополняют,
+        поэтому метод стоит вызывать периодически; возвращает число удалённых слов.
+        """
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    DELETE FROM pereval_title_words w
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM pereval_added p WHERE p.search_tsv @@ plainto_tsquery('simple', w.word)
+                    )
+                """)
+                conn.commit()
+                return cur.rowcount
+        except Exception as e:
+            logger.error(f"Ошибка очистки словаря названий: {e}")
+            raise
+
+    # ----------------- Выгрузка перевалов -----------------
+    def iter_export(self, status=None, date_from=None, date_to=None, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Итератор по всем перевалам, подходящим под фильтр. Строки читаются
+        серверным курсором пачками по batch_size, поэтому память не зависит
+        от размера таблицы.
+        """
+        if status is not None and status not in PEREVAL_STATUSES:
+            raise ValueError(f"Неизвестный статус: {status}")
+        conditions, params = [], []
+        if status:
+            conditions.append("status = %s")
+            params.append(status)
+        if date_from:
+            conditions.append("date_added >= %s")
+            params.append(date_from)
+        if date_to:
+            conditions.append("date_added < %s")
+            params.append(date_to)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT {PEREVAL_COLUMNS} FROM pereval_added {where} ORDER BY id"
+        return self._stream_rows(query, params, batch_size)
+
+    def _stream_rows(self, query, params, batch_size, cursor_name="perevals_export"):
+        try:
+            with self.connection(read_only=True) as conn:
+                with conn.cursor(name=cursor_name, cursor_factory=RealDictCursor) as cur:
+                    cur.itersize = batch_size
+                    cur.execute(query, params)
+                    while True:
+                        rows = cur.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        for r in rows:
+                            r['raw_data'] = self.parse_json_field(r['raw_data'])
+                            r['images'] = self.parse_json_field(r['images'])
+                            yield r
+        except Exception as e:
+            logger.error(f"Ошибка выгрузки перевалов: {e}")
+            raise
+
+    def _changed(self, pereval_id):
+        for listener in self.change_listeners:
+            try:
+                listener(pereval_id)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика изменения перевала {pereval_id}: {e}")
 
     # ----------------- Получение перевала по ID -----------------
+    @instrumented
     def get_pereval_by_id(self, pereval_id):
         query = "SELECT id, raw_data, images, status, date_added, date_updated FROM pereval_added WHERE id = %s"
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cur:
+            with self.connection() as conn, conn.cursor() as cur:
                 cur.execute(query, (pereval_id,))
                 pereval = cur.fetchone()
-                if not pereval:
-                    return None
-                pereval['raw_data'] = self.parse_json_field(pereval['raw_data'])
-                pereval['images'] = self.parse_json_field(pereval['images'])
-                return pereval
+            if not pereval:
+                return None
+            pereval['raw_data'] = self.parse_json_field(pereval['raw_data'])
+            pereval['images'] = self.parse_json_field(pereval['images'])
+            return pereval
         except Exception as e:
             logger.error(f"Ошибка получения перевала {pereval_id}: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
 
-    # ----------------- Обновление перевала -----------------
-    def update_pereval(self, pereval_id, data):
-        conn = None
+    # ----------------- Версия перевала для условного GET -----------------
+    @instrumented
+    def get_pereval_version(self, pereval_id):
+        """
+        ETag и Last-Modified перевала без чтения raw_data/images. ETag — "<id>-<version>":
+        версия (миграция 0010) растёт при любом UPDATE, по ней же PATCH проверяет If-Match.
+        """
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cur:
-                cur.execute("SELECT status, raw_data, images FROM pereval_added WHERE id = %s", (pereval_id,))
-                record = cur.fetchone()
-                if not record:
-                    return False, "Запись не найдена"
-
-                if record['status'] != 'new':
-                    return False, "Редактирование запрещено: статус не 'new'"
-
-                raw_data = self.parse_json_field(record['raw_data'])
-                new_raw_data = data.get("raw_data", raw_data)
-
-                for field in ["fio", "email", "phone"]:
-                    if field in new_raw_data and new_raw_data[field] != raw_data.get(field):
-                        return False, f"Поле '{field}' редактировать нельзя"
-
-                updated_raw = json.dumps(new_raw_data, ensure_ascii=False)
-                updated_images = data.get("images", self.parse_json_field(record['images']))
-                if isinstance(updated_images, (dict, list)):
-                    updated_images = json.dumps(updated_images, ensure_ascii=False)
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id || '-' || version AS etag, COALESCE(date_updated, date_added) AS last_modified
+                    FROM pereval_added WHERE id = %s
+                """, (pereval_id,))
+                return cur.fetchone()
+        except Exception as e:
+            logger.error(f"Ошибка получения версии перевала {pereval_id}: {e}")
+            raise
 
+    @instrumented
+    def get_pereval_with_version(self, pereval_id):
+        """
+        Перевал и его версия (как в get_pereval_version) одним запросом: тело и ETag
+        относятся к одной и той же строке. Возвращает (pereval, version) или (None, None).
+        """
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
                 cur.execute("""
-                    UPDATE pereval_added
-                    SET raw_data = %s,
-                        images = %s,
-                        date_updated = NOW()
-                    WHERE id = %s
-                """, (updated_raw, updated_images, pereval_id))
+                    SELECT id, raw_data, images, status, date_added, date_updated,
+                           id || '-' || version AS etag, COALESCE(date_updated, date_added) AS last_modified
+                    FROM pereval_added WHERE id = %s
+                """, (pereval_id,))
+                pereval = cur.fetchone()
+            if not pereval:
+                return None, None
+            version = {'etag': pereval.pop('etag'), 'last_modified': pereval.pop('last_modified')}
+            pereval['raw_data'] = self.parse_json_field(pereval['raw_data'])
+            pereval['images'] = self.parse_json_field(pereval['images'])
+            return pereval, version
+        except Exception as e:
+            logger.error(f"Ошибка получения перевала {pereval_id}: {e}")
+            raise
+
+    # ----------------- Обновление перевала -----------------
+    @instrumented
+    def patch_pereval(self, pereval_id, patch, versions=None):
+        """
+        Применить JSON merge-patch (RFC 7396) к перевалу одним условным UPDATE: raw_data
+        сливается в БД, images заменяется целиком. versions — допустимые версии из If-Match
+        (None — без проверки). Возвращает (outcome, version, message); outcome — updated,
+        not_found, not_new, protected или version_mismatch.
+        """
+        if not isinstance(patch, dict):
+            raise ValueError("Тело PATCH должно быть JSON-объектом")
+        for key in patch:
+            if key not in PATCHABLE_FIELDS:
+                raise ValueError(f"Поле '{key}' нельзя изменить через PATCH")
+        raw_patch = validate_raw_data(patch["raw_data"]) if "raw_data" in patch else {}
+        images = validate_images(patch.get("images"))
+        params = {
+            "id": pereval_id, "raw_data": dumps_text(raw_patch), "set_images": "images" in patch,
+            "images": dumps_text(images), "versions": list(versions) if versions is not None else None,
+            "protected": list(PROTECTED_FIELDS),
+        }
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute(PATCH_SQL, params)
+                row = cur.fetchone()
                 conn.commit()
-                return True, "Запись успешно обновлена"
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"Ошибка обновления перевала {pereval_id}: {e}")
+            raise
+        if row is None:
+            return "not_found", None, PATCH_MESSAGES["not_found"]
+        if row['new_version'] is not None:
+            self._changed(pereval_id)
+            return "updated", row['new_version'], PATCH_MESSAGES["updated"]
+        if row['status'] != 'new':
+            return "not_new", row['version'], PATCH_MESSAGES["not_new"]
+        if row['protected_field']:
+            return "protected", row['version'], f"Поле '{row['protected_field']}' редактировать нельзя"
+        return "version_mismatch", row['version'], PATCH_MESSAGES["version_mismatch"]
+
+    def update_pereval(self, pereval_id, data):
+        """patch_pereval без проверки версии; возвращает (успех, сообщение)."""
+        try:
+            outcome, _, message = self.patch_pereval(pereval_id, data)
+            return outcome == "updated", message
+        except Exception as e:
             return False, str(e)
-        finally:
-            if conn:
-                conn.close()
 
     # ----------------- Получение перевалов по email -----------------
-    def get_perevals_by_email(self, email):
-        query = "SELECT id, raw_data, images, status, date_added, date_updated FROM pereval_added WHERE (raw_data->'user'->>'email') = %s"
-        conn = None
+    @instrumented
+    def get_perevals_by_email(self, email, raw_json=False):
+        """raw_json=True — строки JSON из БД (см. PEREVAL_JSON) вместо словарей."""
+        columns = PEREVAL_JSON if raw_json else PEREVAL_COLUMNS
+        query = f"SELECT {columns} FROM pereval_added WHERE (raw_data->'user'->>'email') = %s"
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cur:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
                 cur.execute(query, (email,))
                 results = cur.fetchall()
-                for r in results:
-                    r['raw_data'] = self.parse_json_field(r['raw_data'])
-                    r['images'] = self.parse_json_field(r['images'])
-                return results
+            if raw_json:
+                return [r['json'] for r in results]
+            for r in results:
+                r['raw_data'] = self.parse_json_field(r['raw_data'])
+                r['images'] = self.parse_json_field(r['images'])
+            return results
         except Exception as e:
             logger.error(f"Ошибка получения перевалов по email {email}: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
+
+    @instrumented
+    def get_perevals_by_email_version(self, email):
+        """ETag списка перевалов пользователя: число строк и хеш их (id, version)."""
+        try:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT count(*) || '-' || COALESCE(md5(string_agg(id || '-' || version, ',' ORDER BY id)), '')
+                        AS etag
+                    FROM pereval_added WHERE (raw_data->'user'->>'email') = %s
+                """, (email,))
+                return cur.fetchone()['etag']
+        except Exception as e:
+            logger.error(f"Ошибка получения версии перевалов по email {email}: {e}")
+            raise
 
     # ----------------- Добавление изображения -----------------
+    @instrumented
     def add_image(self, img_bytes):
         query = "INSERT INTO pereval_images (img, date_added) VALUES (%s, NOW()) RETURNING id"
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cur:
+            with self.connection() as conn, conn.cursor() as cur:
                 cur.execute(query, (psycopg2.Binary(img_bytes),))
                 image_id = cur.fetchone()['id']
                 conn.commit()
-                return image_id
+            return image_id
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"Ошибка добавления изображения: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
 
     # ----------------- Получение изображения по ID -----------------
+    @instrumented
     def get_image_by_id(self, image_id):
         query = "SELECT img FROM pereval_images WHERE id = %s"
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cur:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
                 cur.execute(query, (image_id,))
                 record = cur.fetchone()
-                return record['img'] if record else None
+            return record['img'] if record else None
         except Exception as e:
             logger.error(f"Ошибка получения изображения {image_id}: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
+
+    # ----------------- Изображения в хранилище блобов -----------------
+    @instrumented
+    def add_image_blob(self, blob):
+        query = """
+        INSERT INTO pereval_images (sha256, mimetype, size, date_added)
+        VALUES (%s, %s, %s, NOW())
+        RETURNING id
+        """
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute(query, (blob.key, blob.mimetype, blob.size))
+                image_id = cur.fetchone()['id']
+                conn.commit()
+            return image_id
+        except Exception as e:
+            logger.error(f"Ошибка добавления изображения: {e}")
+            raise
+
+    @instrumented
+    def add_pereval_images(self, pereval_id, blobs, titles=None):
+        """
+        Сохранить метаданные нескольких изображений и дописать их в images перевала
+        одной транзакцией. Возвращает список добавленных элементов или None, если перевала нет.
+        """
+        titles = titles or []
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute("SELECT id FROM pereval_added WHERE id = %s FOR UPDATE", (pereval_id,))
+                if not cur.fetchone():
+                    return None
+                items = []
+                for n, blob in enumerate(blobs):
+                    cur.execute("""
+                        INSERT INTO pereval_images (sha256, mimetype, size, date_added)
+                        VALUES (%s, %s, %s, NOW())
+                        RETURNING id
+                    """, (blob.key, blob.mimetype, blob.size))
+                    image_id = cur.fetchone()['id']
+                    item = {"id": image_id, "url": f"/images/{image_id}"}
+                    if n < len(titles) and titles[n]:
+                        item["title"] = titles[n]
+                    items.append(item)
+                cur.execute("""
+                    UPDATE pereval_added
+                    SET images = COALESCE(images, '[]'::jsonb) || %s::jsonb,
+                        date_updated = NOW()
+                    WHERE id = %s
+                """, (dumps_text(items), pereval_id))
+                conn.commit()
+            self._changed(pereval_id)
+            return items
+        except Exception as e:
+            logger.error(f"Ошибка добавления изображений к перевалу {pereval_id}: {e}")
+            raise
+
+    @instrumented
+    def get_image_meta(self, image_id):
+        """Метаданные изображения без загрузки содержимого; has_bytea — байты ещё лежат в img."""
+        query = """
+        SELECT id, sha256, mimetype, size, date_added, img IS NOT NULL AS has_bytea
+        FROM pereval_images WHERE id = %s
+        """
+        try:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute(query, (image_id,))
+                return cur.fetchone()
+        except Exception as e:
+            logger.error(f"Ошибка получения метаданных изображения {image_id}: {e}")
+            raise
+
+    @instrumented
+    def get_legacy_image_ids(self, after_id=0, limit=100):
+        query = "SELECT id FROM pereval_images WHERE sha256 IS NULL AND id > %s ORDER BY id LIMIT %s"
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute(query, (after_id, limit))
+                return [r['id'] for r in cur.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка выборки изображений для переноса: {e}")
+            raise
+
+    @instrumented
+    def set_image_blob(self, image_id, blob, keep_bytea=False):
+        query = f"""
+        UPDATE pereval_images
+        SET sha256 = %s, mimetype = %s, size = %s{'' if keep_bytea else ', img = NULL'}
+        WHERE id = %s
+        """
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute(query, (blob.key, blob.mimetype, blob.size, image_id))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка переноса изображения {image_id}: {e}")
+            raise
 
     # ----------------- Получение всех областей -----------------
+    @instrumented
     def get_all_areas(self):
         query = "SELECT id, id_parent, title FROM pereval_areas ORDER BY id"
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cur:
+            with self.connection() as conn, conn.cursor() as cur:
                 cur.execute(query)
                 return cur.fetchall()
         except Exception as e:
             logger.error(f"Ошибка получения областей: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
 
     # ----------------- Получение всех типов активности -----------------
+    @instrumented
     def get_activities_types(self):
         query = "SELECT id, title FROM spr_activities_types ORDER BY id"
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cur:
+            with self.connection() as conn, conn.cursor() as cur:
                 cur.execute(query)
                 return cur.fetchall()
         except Exception as e:
             logger.error(f"Ошибка получения типов активностей: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
+
+    # ----------------- Очередь модерации -----------------
+    @instrumented
+    def claim_perevals(self, moderator, limit, lease_seconds=MODERATION_LEASE):
+        """
+        Захватить до limit заявок: статус 'pending', claimed_by = moderator на lease_seconds.
+        Заявки, аренда которых истекла, снова попадают в очередь.
+        """
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute(CLAIM_SQL, {"moderator": moderator, "limit": limit, "lease": lease_seconds})
+                rows = cur.fetchall()
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка захвата заявок модератором {moderator}: {e}")
+            raise
+        rows.sort(key=lambda r: (r['date_added'], r['id']))
+        for row in rows:
+            row['raw_data'] = self.parse_json_field(row['raw_data'])
+            row['images'] = self.parse_json_field(row['images'])
+            self._changed(row['id'])
+        return rows
+
+    @instrumented
+    def transition_perevals(self, moderator, ids, status):
+        """
+        Принять или отклонить заявки одним UPDATE. Меняются новые заявки, заявки этого
+        модератора и заявки с истёкшей арендой; возвращает список изменённых id.
+        """
+        if status not in MODERATION_DECISIONS:
+            raise ValueError(f"status должен быть одним из {', '.join(MODERATION_DECISIONS)}")
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE pereval_added
+                    SET status = %(status)s, claimed_by = NULL, claimed_until = NULL
+                    WHERE id = ANY(%(ids)s)
+                      AND (status = 'new' OR status = 'pending' AND (
+                          claimed_by = %(moderator)s OR claimed_until IS NULL OR claimed_until < NOW()))
+                    RETURNING id
+                """, {"status": status, "ids": list(ids), "moderator": moderator})
+                updated = sorted(r['id'] for r in cur.fetchall())
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка смены статуса заявок модератором {moderator}: {e}")
+            raise
+        for pereval_id in updated:
+            self._changed(pereval_id)
+        return updated
+
+    @instrumented
+    def release_perevals(self, moderator, ids):
+        """Вернуть в очередь (статус 'new') заявки, захваченные этим модератором."""
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE pereval_added
+                    SET status = 'new', claimed_by = NULL, claimed_until = NULL
+                    WHERE id = ANY(%s) AND status = 'pending' AND claimed_by = %s
+                    RETURNING id
+                """, (list(ids), moderator))
+                released = sorted(r['id'] for r in cur.fetchall())
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка возврата заявок модератором {moderator}: {e}")
+            raise
+        for pereval_id in released:
+            self._changed(pereval_id)
+        return released
+
+    @instrumented
+    def get_moderation_stats(self):
+        """Длина очереди, заявки в работе и с истёкшей арендой, возраст самой старой новой заявки, с."""
+        try:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT count(*) FILTER (WHERE status = 'new') AS new,
+                           count(*) FILTER (WHERE status = 'pending' AND claimed_until >= NOW()) AS claimed,
+                           count(*) FILTER (WHERE status = 'pending'
+                                            AND (claimed_until IS NULL OR claimed_until < NOW())) AS expired,
+                           COALESCE(EXTRACT(EPOCH FROM NOW() - min(date_added) FILTER (WHERE status = 'new')),
+                                    0)::float8 AS oldest_new_age
+                    FROM pereval_added WHERE status IN ('new', 'pending')
+                """)
+                return cur.fetchone()
+        except Exception as e:
+            logger.error(f"Ошибка получения состояния очереди модерации: {e}")
+            raise
+
+    # ----------------- Синхронизация офлайн-клиентов -----------------
+    def _sync_query(self, email, base):
+        """
+        Изменения всех источников одним запросом: по каждому — записи об удалении (чётный
+        ранг) и изменённые строки (нечётный) по индексу (change_xid, id). Удаление идёт
+        раньше вставки той же транзакции. Первая строка всегда есть — в ней снимок запроса.
+        """
+        parts = []
+        for n, (name, table, json_column, scope_condition) in enumerate(SYNC_SOURCES):
+            if scope_condition and email is None:
+                continue
+            visible = "AND NOT pg_visible_in_snapshot(change_xid, %(base)s::pg_snapshot)" if base else ""
+            scope = scope_condition or "true"
+            parts.append(f"""(
+                SELECT {2 * n} AS rank, change_xid, id, NULL::text AS json FROM sync_tombstones
+                WHERE table_name = '{table}' AND scope = {"%(scope)s" if scope_condition else "''"}
+                  AND (change_xid, id) > (%(xid_{2 * n})s::xid8, %(id_{2 * n})s) {visible}
+                ORDER BY change_xid, id LIMIT %(limit)s
+            ) UNION ALL (
+                SELECT {2 * n + 1}, change_xid, id, {json_column} FROM {table}
+                WHERE {scope} AND (change_xid, id) > (%(xid_{2 * n + 1})s::xid8, %(id_{2 * n + 1})s) {visible}
+                ORDER BY change_xid, id LIMIT %(limit)s
+            )""")
+        return f"""
+            WITH snap AS (SELECT pg_current_snapshot()::text AS snapshot)
+            SELECT snap.snapshot, c.change_xid::text AS xid, c.rank, c.id, c.json
+            FROM snap LEFT JOIN ({" UNION ALL ".join(parts)}) c ON true
+            ORDER BY c.change_xid, c.rank, c.id
+            LIMIT %(limit)s
+        """
+
+    @instrumented
+    def get_sync_changes(self, email=None, cursor=None, limit=None):
+        """
+        Что изменилось в перевалах пользователя email и справочниках после курсора.
+        Без курсора — всё, с reset=True; курсор старше SYNC_RETENTION_DAYS тоже даёт
+        полную синхронизацию. Возвращает словарь: changes — {источник: {"upserted":
+        [JSON-текст строки], "deleted": [id]}} только с изменившимися источниками,
+        cursor — курсор следующего вызова, has_more — есть ли следующая страница.
+        Клиент применяет сначала deleted, затем upserted.
+        """
+        limit = clamp_limit(limit)
+        base, base_at, target, target_at, position = decode_sync_cursor(cursor) if cursor else (None,) * 5
+        reset = base is None and target is None
+        if base is not None and base_at < time.time() - SYNC_RETENTION_DAYS * 86400:
+            # Записи об удалении за это время могли быть очищены
+            base, base_at, target, target_at, position, reset = None, None, None, None, None, True
+        if position is None:
+            position = (int(base.split(":")[0]) if base else 0, -1, -1)
+        params = {"scope": email, "base": base, "limit": limit + 1}
+        for rank in range(2 * len(SYNC_SOURCES)):
+            xid, row_id = sync_lower_bound(rank, position)
+            params[f"xid_{rank}"], params[f"id_{rank}"] = str(xid), row_id
+        try:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute(self._sync_query(email, base), params)
+                rows = cur.fetchall()
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка получения изменений для синхронизации: {e}")
+            raise
+        if target is None:
+            target, target_at = rows[0]['snapshot'], time.time()
+        changes = [r for r in rows if r['rank'] is not None]
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        result = {}
+        for row in changes:
+            name = SYNC_SOURCES[row['rank'] // 2][0]
+            entry = result.setdefault(name, {"upserted": [], "deleted": []})
+            if row['rank'] % 2:
+                entry["upserted"].append(row['json'])
+            else:
+                entry["deleted"].append(row['id'])
+        if has_more:
+            last = changes[-1]
+            next_cursor = encode_sync_cursor(base, base_at, target, target_at,
+                                             (int(last['xid']), last['rank'], last['id']))
+        else:
+            # Строки, закоммиченные после снимка первой страницы, придут ещё раз — повтор безопасен
+            next_cursor = encode_sync_cursor(target, target_at)
+        return {"changes": result, "cursor": next_cursor, "has_more": has_more, "reset": reset}
+
+    @instrumented
+    def prune_sync_tombstones(self, days=SYNC_RETENTION_DAYS):
+        """
+        Удалить записи об удалении старше days дней. Курсоры старше этого срока
+        get_sync_changes не принимает, поэтому такие записи уже не нужны; метод стоит
+        вызывать периодически. Возвращает число удалённых записей.
+        """
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute("DELETE FROM sync_tombstones WHERE deleted_at < NOW() - make_interval(days => %s)",
+                            (days,))
+                conn.commit()
+                return cur.rowcount
+        except Exception as e:
+            logger.error(f"Ошибка очистки записей об удалении: {e}")
+            raise
+
+    # ----------------- Статистика -----------------
+    @instrumented
+    def get_pereval_stats(self, dimensions=None):
+        """
+        Число перевалов по разрезам STATS_DIMENSIONS (по умолчанию — по всем) из счётчиков,
+        которые триггеры обновляют при каждом изменении: время не зависит от размера таблицы.
+        Возвращает {"total": n, "status": {"new": n, ...}, "level": {"summer": {...}, ...}, ...};
+        ключ "" — значение не указано.
+        """
+        dimensions = list(STATS_DIMENSIONS) if dimensions is None else list(dimensions)
+        for name in dimensions:
+            if name not in STATS_DIMENSIONS:
+                raise ValueError(f"Неизвестный разрез: {name}")
+        counters = ["total"] + [c for name in dimensions for c in STATS_DIMENSIONS[name]]
+        try:
+            with self.connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute(STATS_SQL, {"dimensions": counters})
+                rows = cur.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики перевалов: {e}")
+            raise
+        stats = {"total": 0}
+        for name in dimensions:
+            stats[name] = {c.split(".")[1]: {} for c in STATS_DIMENSIONS[name]} if name == "level" else {}
+        # Числовые ключи (область, высота) — по значению, остальные — по алфавиту
+        rows.sort(key=lambda r: (r['dimension'], (0, int(r['key']), "") if r['key'].isdigit() else (1, 0, r['key'])))
+        for row in rows:
+            if row['dimension'] == "total":
+                stats["total"] = int(row['count'])
+                continue
+            target = stats
+            for part in row['dimension'].split("."):
+                target = target[part]
+            target[row['key']] = int(row['count'])
+        return stats
 
     # ----------------- Удаление перевала -----------------
+    @instrumented
     def delete_pereval(self, pereval_id):
         query = "DELETE FROM pereval_added WHERE id = %s"
-        conn = None
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cur:
+            with self.connection() as conn, conn.cursor() as cur:
                 cur.execute(query, (pereval_id,))
                 conn.commit()
-                logger.info(f"Перевал {pereval_id} удалён")
-                return True
+            self._changed(pereval_id)
+            logger.info(f"Перевал {pereval_id} удалён")
+            return True
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"Ошибка удаления перевала {pereval_id}: {e}")
             return False
-        finally:
-            if conn:
-                conn.close()
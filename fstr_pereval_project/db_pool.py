@@ -0,0 +1,208 @@
+import os
+import time
+import logging
+import threading
+
+from psycopg2 import extensions
+
+# ----------------- Логирование -----------------
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведённое время."""
+
+
+# ----------------- Пул соединений -----------------
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений PostgreSQL с ограничением min/max.
+
+    Соединения создаются через ``connect_factory`` и переиспользуются между
+    запросами. После fork (воркеры gunicorn) пул сбрасывается: унаследованные
+    сокеты родителя не закрываются и не используются повторно.
+    """
+
+    def __init__(self, connect_factory, min_size=1, max_size=10, timeout=30.0,
+                 max_idle=300.0, max_lifetime=3600.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Некорректные границы пула: min_size=%s, max_size=%s" % (min_size, max_size))
+        self.connect_factory = connect_factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []          # [(conn, created_at, returned_at)]
+        self._created = {}       # id(conn) -> created_at
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_recycled": 0,
+        }
+
+    # ----------------- Вспомогательные методы -----------------
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Соединения родителя не закрываем: close() отправит Terminate по общему сокету
+            logger.info("Обнаружен fork, пул соединений пересоздан (pid %s)", os.getpid())
+            self._reset_state()
+
+    def _new_connection(self):
+        conn = self.connect_factory()
+        self._created[id(conn)] = time.monotonic()
+        self._stats["connections_created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, created_at, returned_at):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if self.max_idle and now - returned_at > self.max_idle:
+            # Долго простаивавшее соединение могло быть закрыто сервером или балансировщиком
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    # ----------------- Выдача и возврат соединений -----------------
+    def getconn(self):
+        self._check_fork()
+        started = time.monotonic()
+        waited = False
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError("Пул соединений закрыт")
+                    if self._idle:
+                        conn, created_at, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    waited = True
+                    remaining = self.timeout - (time.monotonic() - started)
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        if not self._idle and self._size >= self.max_size:
+                            self._stats["timeouts"] += 1
+                            raise PoolTimeoutError(
+                                "Нет свободных соединений в пуле за %.1f с (max_size=%s)" % (self.timeout, self.max_size))
+            if conn is None:
+                break
+            # Проверка вне блокировки: SELECT 1 по полуоткрытому соединению может ждать таймаута
+            # сокета, и остальные потоки не должны ждать вместе с ним
+            if self._is_usable(conn, created_at, returned_at):
+                with self._cond:
+                    self._record_checkout(started, waited)
+                return conn
+            self._discard(conn)
+            with self._cond:
+                self._stats["connections_recycled"] += 1
+                self._size -= 1
+                self._cond.notify()
+
+        # Подключаемся вне блокировки, чтобы не задерживать остальные потоки
+        try:
+            conn = self._new_connection()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._record_checkout(started, waited)
+        return conn
+
+    def _record_checkout(self, started, waited):
+        self._stats["checkouts"] += 1
+        if waited:
+            elapsed = time.monotonic() - started
+            self._stats["waits"] += 1
+            self._stats["wait_time_total"] += elapsed
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], elapsed)
+
+    def putconn(self, conn, discard=False):
+        if self._pid != os.getpid():
+            # Соединение выдано в другом процессе — просто забываем о нём
+            return
+        if not discard and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    discard = True
+        with self._cond:
+            if discard or conn.closed or self._closed:
+                self._size -= 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, self._created.get(id(conn), time.monotonic()), time.monotonic()))
+            self._cond.notify()
+
+    def prefill(self):
+        """Открыть min_size соединений заранее."""
+        self._check_fork()
+        with self._cond:
+            missing = self.min_size - self._size
+            self._size += max(missing, 0)
+        for _ in range(max(missing, 0)):
+            try:
+                conn = self._new_connection()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic(), time.monotonic()))
+                self._cond.notify()
+
+    def closeall(self):
+        self._check_fork()
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._size -= 1
+                self._discard(conn)
+            self._cond.notify_all()
+
+    # ----------------- Статистика -----------------
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            })
+        return stats
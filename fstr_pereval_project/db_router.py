@@ -0,0 +1,248 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import psycopg2
+
+from metrics import DB_REPLICA_FAILOVERS, DB_REPLICA_LAG, DB_TARGET_CHECKOUTS
+
+# ----------------- Логирование -----------------
+logger = logging.getLogger(__name__)
+
+# Состояние текущего HTTP-запроса: минимальный LSN для чтения (read-your-writes) и сервер,
+# выбранный первым чтением, — остальные чтения запроса идут туда же
+_request_scope = contextvars.ContextVar("fstr_db_request_scope", default=None)
+
+REPLICA_STATUS_SQL = """
+SELECT pg_is_in_recovery() AS standby, pg_last_wal_replay_lsn()::text AS replay_lsn,
+       CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+       END::float8 AS lag_seconds
+"""
+
+
+def is_connection_error(error, conn=None):
+    """
+    Ошибка соединения или сервера, а не запроса: разрыв, класс SQLSTATE 08 или остановка
+    сервера (57P01–57P03). Таймаут запроса, конфликт с восстановлением на реплике,
+    взаимоблокировка — тоже OperationalError, но реплика из-за них не исключается.
+    """
+    if isinstance(error, psycopg2.InterfaceError) or (conn is not None and conn.closed):
+        return True
+    code = getattr(error, "pgcode", None)
+    if code is None:
+        # Ошибки libpq без ответа сервера (соединение потеряно) приходят без SQLSTATE
+        return isinstance(error, psycopg2.OperationalError)
+    return code.startswith("08") or code in ("57P01", "57P02", "57P03")
+
+
+def parse_lsn(text):
+    """LSN PostgreSQL ('16/B374D848') как число; ValueError для некорректной строки."""
+    high, low = text.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+def format_lsn(value):
+    return f"{value >> 32:X}/{value & 0xFFFFFFFF:X}"
+
+
+# ----------------- Сервер БД -----------------
+class Target:
+    """Основной сервер или реплика: пул соединений и результат последней проверки."""
+
+    def __init__(self, name, pool, primary=False):
+        self.name = name
+        self.pool = pool
+        self.primary = primary
+        self.checkouts = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self.standby = None
+        self.replay_lsn = None
+        self.lag_seconds = None
+        self.lag_bytes = None
+        self.checked_at = None
+        self.error = None
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "available": self.primary or time.monotonic() >= self.down_until,
+            "checkouts": self.checkouts,
+            "failures": self.failures,
+            "standby": self.standby,
+            "replay_lsn": format_lsn(self.replay_lsn) if self.replay_lsn is not None else None,
+            "lag_seconds": self.lag_seconds,
+            "lag_bytes": self.lag_bytes,
+            "error": self.error,
+            "pool": self.pool.stats(),
+        }
+
+
+# ----------------- Маршрутизация чтения -----------------
+class ReplicaRouter:
+    """
+    Выбор сервера для запроса: запись и чтение без реплик — на основной, остальное чтение —
+    по кругу на реплики, которые отвечают и отстают не больше max_lag секунд. Недоступная
+    реплика исключается на retry_after секунд. Фоновый поток раз в check_interval секунд
+    проверяет отставание реплик (LSN воспроизведения) — по нему же проверяется read-your-writes.
+    """
+
+    def __init__(self, primary_pool, replica_pools=(), max_lag=None, check_interval=None, retry_after=None):
+        self.primary = Target("primary", primary_pool, primary=True)
+        self.replicas = [Target(name, pool) for name, pool in replica_pools]
+        self.max_lag = float(max_lag if max_lag is not None else os.getenv("FSTR_DB_REPLICA_MAX_LAG", 5))
+        self.check_interval = float(check_interval if check_interval is not None
+                                    else os.getenv("FSTR_DB_REPLICA_CHECK_INTERVAL", 1))
+        self.retry_after = float(retry_after if retry_after is not None else os.getenv("FSTR_DB_REPLICA_RETRY", 10))
+        self.primary_lsn = None
+        self._next = 0
+        self._lock = threading.Lock()
+        self._checker_pid = None
+        self._stop = threading.Event()
+
+    @property
+    def targets(self):
+        return [self.primary] + self.replicas
+
+    # ----------------- Запрос -----------------
+    @contextmanager
+    def request_scope(self, read_after=None):
+        """
+        Границы HTTP-запроса. read_after — LSN записи клиента: читать можно только с реплики,
+        которая его уже воспроизвела, иначе с основного сервера.
+        """
+        token = _request_scope.set({"read_after": read_after, "target": None})
+        try:
+            yield
+        finally:
+            _request_scope.reset(token)
+
+    def _usable(self, replica, read_after, now):
+        if now < replica.down_until or replica.checked_at is None:
+            return False
+        if replica.lag_seconds is None or replica.lag_seconds > self.max_lag:
+            return False
+        if read_after is not None:
+            return replica.standby and replica.replay_lsn is not None and replica.replay_lsn >= read_after
+        return True
+
+    def choose(self, read_only=False):
+        if not read_only or not self.replicas:
+            return self.primary
+        self.ensure_checker()
+        scope = _request_scope.get()
+        now = time.monotonic()
+        read_after = scope["read_after"] if scope else None
+        if scope and scope["target"] is not None:
+            pinned = scope["target"]
+            if pinned.primary or self._usable(pinned, read_after, now):
+                return pinned
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        target = self.primary
+        for n in range(len(self.replicas)):
+            replica = self.replicas[(start + n) % len(self.replicas)]
+            if self._usable(replica, read_after, now):
+                target = replica
+                break
+        if scope is not None:
+            scope["target"] = target
+        return target
+
+    def checked_out(self, target):
+        target.checkouts += 1
+        DB_TARGET_CHECKOUTS.labels(target.name).inc()
+
+    def mark_failed(self, target, error):
+        """Реплика не отвечает: не выбирать её retry_after секунд; запрос уходит дальше по кругу."""
+        if target.primary:
+            return
+        target.failures += 1
+        target.down_until = time.monotonic() + self.retry_after
+        target.error = str(error)
+        DB_REPLICA_FAILOVERS.labels(target.name).inc()
+        scope = _request_scope.get()
+        if scope is not None and scope["target"] is target:
+            scope["target"] = None
+        logger.error(f"Реплика {target.name} недоступна, исключена на {self.retry_after:.0f} с: {error}")
+
+    # ----------------- Проверка реплик -----------------
+    def check(self):
+        """Один проход проверки: LSN основного сервера, затем состояние и отставание реплик."""
+        try:
+            self.primary_lsn = parse_lsn(self._query(self.primary, "SELECT pg_current_wal_lsn()::text AS lsn")["lsn"])
+        except Exception as e:
+            logger.error(f"Ошибка получения LSN основного сервера: {e}")
+            self.primary_lsn = None
+        for replica in self.replicas:
+            if time.monotonic() < replica.down_until:
+                continue
+            try:
+                row = self._query(replica, REPLICA_STATUS_SQL)
+            except Exception as e:
+                self.mark_failed(replica, e)
+                continue
+            replica.standby = row["standby"]
+            replica.replay_lsn = parse_lsn(row["replay_lsn"]) if row["replay_lsn"] else None
+            replica.lag_seconds = row["lag_seconds"]
+            replica.lag_bytes = (max(self.primary_lsn - replica.replay_lsn, 0)
+                                 if self.primary_lsn is not None and replica.replay_lsn is not None else None)
+            replica.checked_at = time.monotonic()
+            replica.error = None
+            DB_REPLICA_LAG.labels(replica.name).set(replica.lag_seconds)
+
+    @staticmethod
+    def _query(target, sql):
+        conn = target.pool.getconn()
+        discard = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                row = cur.fetchone()
+            conn.rollback()
+            discard = False
+            return row
+        finally:
+            target.pool.putconn(conn, discard=discard)
+
+    def ensure_checker(self):
+        if not self.replicas or self._checker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._checker_pid == os.getpid():
+                return
+            # Поток запускается в каждом воркере отдельно, после fork. Запрос его не ждёт: пока
+            # первая проверка не прошла, реплики считаются непроверенными и чтение идёт на основной
+            self._checker_pid = os.getpid()
+            threading.Thread(target=self._check_forever, name="db-replica-checker", daemon=True).start()
+
+    def _check_forever(self):
+        for replica in self.replicas:
+            try:
+                replica.pool.prefill()
+            except Exception as e:
+                self.mark_failed(replica, e)
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Ошибка проверки реплик: {e}")
+            if self._stop.wait(self.check_interval):
+                return
+
+    def stats(self):
+        return {
+            "primary_lsn": format_lsn(self.primary_lsn) if self.primary_lsn is not None else None,
+            "max_lag": self.max_lag,
+            "targets": [t.stats() for t in self.targets],
+        }
+
+    def close(self):
+        self._stop.set()
+        for target in self.targets:
+            target.pool.closeall()
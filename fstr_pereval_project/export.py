@@ -0,0 +1,84 @@
+import csv
+import io
+from datetime import datetime
+
+from serialization import dumps, dumps_text
+
+# ----------------- Колонки CSV -----------------
+# Вложенные объекты raw_data разворачиваются в плоские колонки вида coords_latitude
+CSV_COLUMNS = [
+    "id", "status", "date_added", "date_updated",
+    "beautyTitle", "title", "other_titles", "connect", "add_time",
+    "coords_latitude", "coords_longitude", "coords_height",
+    "user_email", "user_phone", "user_fam", "user_name", "user_otc",
+    "level_winter", "level_summer", "level_autumn", "level_spring",
+    "images",
+]
+RAW_FIELDS = ["beautyTitle", "title", "other_titles", "connect", "add_time"]
+NESTED_FIELDS = {
+    "coords": ["latitude", "longitude", "height"],
+    "user": ["email", "phone", "fam", "name", "otc"],
+    "level": ["winter", "summer", "autumn", "spring"],
+}
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _iso_dates(row):
+    """
+    В выгрузке даты в ISO 8601, а не в формате HTTP, как в ответах API: файл читают
+    скрипты и табличные редакторы. Остальные типы сериализует общий кодек (serialization.py).
+    """
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in row.items()}
+
+
+def flatten_pereval(row):
+    raw_data = row.get("raw_data") or {}
+    if not isinstance(raw_data, dict):
+        raw_data = {}
+    flat = {
+        "id": row["id"],
+        "status": row.get("status"),
+        "date_added": row["date_added"].isoformat() if row.get("date_added") else "",
+        "date_updated": row["date_updated"].isoformat() if row.get("date_updated") else "",
+        "images": dumps_text(row.get("images") or []),
+    }
+    for field in RAW_FIELDS:
+        flat[field] = raw_data.get(field, "")
+    for group, fields in NESTED_FIELDS.items():
+        nested = raw_data.get(group) or {}
+        if not isinstance(nested, dict):
+            nested = {}
+        for field in fields:
+            flat[f"{group}_{field}"] = nested.get(field, "")
+    return flat
+
+
+# ----------------- Потоковые сериализаторы -----------------
+def iter_ndjson(rows):
+    for row in rows:
+        yield dumps(_iso_dates(row)) + b"\n"
+
+
+def iter_csv(rows):
+    # Один буфер на всю выгрузку: после каждой строки он очищается
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(flatten_pereval(row))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    tail = buffer.getvalue()
+    if tail:
+        yield tail
+
+
+def serialize_export(rows, fmt):
+    if fmt == "csv":
+        return iter_csv(rows)
+    return iter_ndjson(rows)
@@ -0,0 +1,139 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Половина окружности Земли: больший радиус уже ничего не добавляет
+MAX_RADIUS_KM = math.pi * EARTH_RADIUS_KM
+# Знаков после запятой в координатах GeoJSON: 1e-5° ≈ 1 м, для карты перевалов достаточно
+COORD_PRECISION = 5
+
+
+# ----------------- Геометрия -----------------
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Расстояние по дуге большого круга, км."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(lat, lon, radius_km):
+    """
+    Прямоугольник (min_lon, min_lat, max_lon, max_lat), заведомо содержащий круг.
+    Если круг задевает полюс или линию перемены дат, долгота берётся целиком.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        return -180.0, max(min_lat, -90.0), 180.0, min(max_lat, 90.0)
+    dlon = math.degrees(math.asin(min(1.0, math.sin(math.radians(dlat)) / math.cos(math.radians(lat)))))
+    if lon - dlon < -180 or lon + dlon > 180:
+        return -180.0, min_lat, 180.0, max_lat
+    return lon - dlon, min_lat, lon + dlon, max_lat
+
+
+def tile_bbox(z, x, y):
+    """Границы тайла z/x/y веб-меркатора (min_lon, min_lat, max_lon, max_lat)."""
+    n = 2 ** z
+    if not (0 <= z <= 22 and 0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Некорректный тайл {z}/{x}/{y}")
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+
+def parse_bbox(value):
+    """
+    Строка "min_lon,min_lat,max_lon,max_lat" в кортеж чисел. min_lon > max_lon
+    означает прямоугольник через линию перемены дат.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(","))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox: ожидается min_lon,min_lat,max_lon,max_lat")
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise ValueError("bbox: координаты вне допустимого диапазона")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def split_bbox(min_lon, min_lat, max_lon, max_lat):
+    """Прямоугольник через линию перемены дат — двумя обычными."""
+    if min_lon <= max_lon:
+        return [(min_lon, min_lat, max_lon, max_lat)]
+    return [(min_lon, min_lat, 180.0, max_lat), (-180.0, min_lat, max_lon, max_lat)]
+
+
+def check_point(lat, lon):
+    if lat is None or lon is None:
+        raise ValueError("Укажите lat и lon")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat/lon вне допустимого диапазона")
+    return lat, lon
+
+
+# ----------------- GeoJSON -----------------
+def to_feature(row):
+    properties = {"title": row.get("title"), "status": row.get("status")}
+    if row.get("distance_km") is not None:
+        properties["distance_km"] = round(row["distance_km"], 3)
+    return {
+        "type": "Feature",
+        "id": row["id"],
+        "geometry": {"type": "Point",
+                     "coordinates": [round(row["lon"], COORD_PRECISION), round(row["lat"], COORD_PRECISION)]},
+        "properties": properties,
+    }
+
+
+def feature_collection(rows, **extra):
+    """
+    Компактный FeatureCollection. extra — дополнительные члены верхнего уровня,
+    например next — курсор следующей страницы.
+    """
+    collection = {"type": "FeatureCollection", "features": [to_feature(r) for r in rows]}
+    collection.update(extra)
+    return collection
+
+
+# ----------------- Сетка в памяти -----------------
+class GeoGrid:
+    """
+    Равномерная сетка ячеек cell_deg × cell_deg с точками перевалов для частых
+    запросов тайлов карты. Запрос прямоугольника просматривает только
+    пересекающиеся ячейки, поэтому не зависит от общего числа точек.
+    """
+
+    def __init__(self, rows, cell_deg=1.0):
+        self.cell_deg = cell_deg
+        self.cells = {}
+        self.size = 0
+        for row in rows:
+            if row['lat'] is None or row['lon'] is None:
+                continue
+            self.cells.setdefault(self._cell(row['lat'], row['lon']), []).append(row)
+            self.size += 1
+        # Внутри ячейки порядок по id — стабильная выдача при обрезке по limit
+        for points in self.cells.values():
+            points.sort(key=lambda r: r['id'])
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def query_bbox(self, min_lon, min_lat, max_lon, max_lat, limit=None):
+        """Точки в прямоугольнике по возрастанию id; не больше limit."""
+        result = []
+        for box in split_bbox(min_lon, min_lat, max_lon, max_lat):
+            result.extend(self._scan(*box))
+        result.sort(key=lambda r: r['id'])
+        return result[:limit] if limit is not None else result
+
+    def _scan(self, min_lon, min_lat, max_lon, max_lat):
+        lat_from, lon_from = self._cell(min_lat, min_lon)
+        lat_to, lon_to = self._cell(max_lat, max_lon)
+        for cell_lat in range(lat_from, lat_to + 1):
+            for cell_lon in range(lon_from, lon_to + 1):
+                for row in self.cells.get((cell_lat, cell_lon), ()):
+                    if min_lat <= row['lat'] <= max_lat and min_lon <= row['lon'] <= max_lon:
+                        yield row
@@ -0,0 +1,194 @@
+import os
+import shutil
+import logging
+import tempfile
+import threading
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Pillow импортируется только в процессах пула, где изображения и уменьшаются;
+# без Pillow отдаём только оригиналы
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+# ----------------- Логирование -----------------
+logger = logging.getLogger(__name__)
+
+# Наибольшая сторона производного изображения, px
+DERIVATIVE_SIZES = {"thumb": 160, "medium": 800}
+DERIVATIVE_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+PIL_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+JPEG_QUALITY = 82
+# Больше пикселей не декодируем: распакованное изображение-«бомба» убило бы процесс пула
+MAX_IMAGE_PIXELS = int(os.getenv("FSTR_IMAGE_MAX_PIXELS", 50_000_000))
+
+
+def negotiate_format(accept_header):
+    """WebP, если клиент его принимает, иначе JPEG."""
+    accept = (accept_header or "").lower()
+    return "webp" if "image/webp" in accept else "jpeg"
+
+
+def render_derivative(source_path, dest_path, max_px, fmt):
+    """Уменьшить изображение. Выполняется в отдельном процессе пула."""
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    with Image.open(source_path) as img:
+        # Размер известен из заголовка, до декодирования пикселей
+        if img.width * img.height > MAX_IMAGE_PIXELS:
+            raise ValueError(f"Изображение {img.width}x{img.height} больше {MAX_IMAGE_PIXELS} пикселей")
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_px, max_px))
+        if img.mode not in ("RGB", "L") and fmt == "jpeg":
+            img = img.convert("RGB")
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, PIL_FORMATS[fmt], quality=JPEG_QUALITY)
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    return dest_path
+
+
+# ----------------- Хранилище производных -----------------
+class DerivativeStore:
+    """
+    Миниатюры и изображения среднего размера. Создаются в пуле процессов
+    сразу после загрузки или лениво при первом запросе; число одновременных
+    декодирований ограничено, чтобы не отнимать ресурсы у воркеров запросов.
+    """
+
+    def __init__(self, root, blob_storage, workers=2, decode_wait=5.0):
+        self.root = os.path.abspath(root)
+        self.blob_storage = blob_storage
+        self.workers = workers
+        self.decode_wait = decode_wait
+        self.enabled = PILLOW_AVAILABLE
+        self._pid = None
+        self._executor = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        # Запросы сверх лимита ждут не дольше decode_wait, затем получают оригинал
+        self._slots = threading.BoundedSemaphore(workers * 2)
+
+    def path(self, key, size, fmt):
+        return os.path.join(self.root, key[:2], key, f"{size}.{fmt}")
+
+    def _get_executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            # После fork пул родителя непригоден, создаём свой
+            self._pid = os.getpid()
+            self._inflight = {}
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"))
+        return self._executor
+
+    def _discard_executor(self, executor):
+        """
+        Процесс пула умер (нехватка памяти, сбой в Pillow): пул больше не принимает задачи,
+        а его ожидающие задачи уже завершены с BrokenProcessPool и оставшиеся процессы
+        остановлены. Забываем его, следующая задача создаст новый. Вызывается под self._lock.
+        """
+        if self._executor is executor:
+            logger.error("Пул процессов обработки изображений сломан, создаётся заново")
+            self._executor = None
+            self._inflight = {}
+
+    def _source_path(self, key):
+        """Путь к оригиналу на диске и признак временной копии."""
+        path = self.blob_storage.local_path(key)
+        if path:
+            return path, False
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        with os.fdopen(fd, "wb") as dst, self.blob_storage.open(key) as src:
+            shutil.copyfileobj(src, dst)
+        return tmp_path, True
+
+    def _submit(self, key, size, fmt):
+        dest = self.path(key, size, fmt)
+        with self._lock:
+            executor = self._get_executor()
+            future = self._inflight.get(dest)
+            if future is not None:
+                return future
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            source, temporary = self._source_path(key)
+            try:
+                try:
+                    future = executor.submit(render_derivative, source, dest, DERIVATIVE_SIZES[size], fmt)
+                except BrokenProcessPool:
+                    # Пул сломался на прошлой задаче — пересоздаём один раз
+                    self._discard_executor(executor)
+                    executor = self._get_executor()
+                    future = executor.submit(render_derivative, source, dest, DERIVATIVE_SIZES[size], fmt)
+            except BaseException:
+                if temporary:
+                    os.unlink(source)
+                raise
+            self._inflight[dest] = future
+
+        def done(f):
+            with self._lock:
+                if self._inflight.get(dest) is f:
+                    del self._inflight[dest]
+                if isinstance(f.exception(), BrokenProcessPool):
+                    self._discard_executor(executor)
+            if temporary:
+                os.unlink(source)
+            if f.exception() is not None:
+                logger.error(f"Ошибка создания {size}.{fmt} для {key}: {f.exception()}")
+
+        future.add_done_callback(done)
+        return future
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def schedule(self, key):
+        """Поставить в фон создание всех производных для нового файла."""
+        if not self.enabled:
+            return
+        for size in DERIVATIVE_SIZES:
+            for fmt in DERIVATIVE_FORMATS:
+                if not os.path.exists(self.path(key, size, fmt)):
+                    try:
+                        self._submit(key, size, fmt)
+                    except Exception as e:
+                        logger.error(f"Не удалось запланировать {size}.{fmt} для {key}: {e}")
+
+    def get_or_create(self, key, size, fmt):
+        """
+        Путь к готовой производной. Отсутствующая создаётся сразу; если все
+        слоты заняты или создание не удалось, возвращается None.
+        """
+        dest = self.path(key, size, fmt)
+        if os.path.exists(dest):
+            return dest
+        if not self.enabled or not self._slots.acquire(timeout=self.decode_wait):
+            return None
+        try:
+            self._submit(key, size, fmt).result(timeout=self.decode_wait)
+            return dest
+        except Exception as e:
+            logger.error(f"Производная {size}.{fmt} для {key} недоступна: {e}")
+            return None
+        finally:
+            self._slots.release()
+
+
+def get_derivative_store(blob_storage):
+    root = os.getenv("FSTR_DERIVATIVES_ROOT",
+                     os.path.join(os.path.dirname(os.path.abspath(__file__)), "blobs", "derivatives"))
+    return DerivativeStore(
+        root, blob_storage,
+        workers=int(os.getenv("FSTR_IMAGE_WORKERS", 2)),
+        decode_wait=float(os.getenv("FSTR_IMAGE_DECODE_WAIT", 5)),
+    )
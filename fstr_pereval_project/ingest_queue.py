@@ -0,0 +1,226 @@
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+import serialization
+
+# ----------------- Логирование -----------------
+logger = logging.getLogger(__name__)
+
+QUEUE_DDL = """
+CREATE TABLE IF NOT EXISTS ingest_queue (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tracking_id TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    pereval_id INTEGER,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ingest_queue_pending_idx ON ingest_queue (status, seq);
+"""
+
+
+# ----------------- Очередь приёма заявок -----------------
+class IngestQueue:
+    """
+    Надёжная локальная очередь для асинхронного приёма перевалов. Заявка
+    сначала записывается в журнал SQLite (WAL, synchronous=FULL) и только
+    потом подтверждается клиенту; фоновый поток переносит накопленные заявки
+    в pereval_added пачками, одной транзакцией на пачку. Незавершённые заявки
+    подхватываются после перезапуска. Повторная вставка после сбоя исключена
+    уникальным pereval_added.ingest_id.
+    """
+
+    def __init__(self, path, db_handler, batch_size=200, flush_interval=0.2,
+                 lease=30.0, max_attempts=5, retention=7 * 24 * 3600):
+        self.path = path
+        self.db_handler = db_handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+        self._conn().executescript(QUEUE_DDL)
+
+    # ----------------- Журнал SQLite -----------------
+    def _conn(self):
+        # Соединение SQLite своё у каждого потока и процесса
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._conn())
+
+    def enqueue(self, raw_data, images):
+        """Записать заявку в журнал и вернуть tracking_id."""
+        tracking_id = uuid.uuid4().hex
+        payload = serialization.dumps_text({"raw_data": raw_data, "images": images})
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO ingest_queue (tracking_id, payload, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (tracking_id, payload, now, now))
+        self._ensure_flusher()
+        self._wakeup.set()
+        return tracking_id
+
+    def get_status(self, tracking_id):
+        row = self._conn().execute(
+            "SELECT tracking_id, status, pereval_id, error, attempts, created_at, updated_at"
+            " FROM ingest_queue WHERE tracking_id = ?", (tracking_id,)).fetchone()
+        return dict(row) if row else None
+
+    def stats(self):
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM ingest_queue GROUP BY status").fetchall()
+            oldest = conn.execute("SELECT MIN(created_at) FROM ingest_queue WHERE status = 'queued'").fetchone()[0]
+        stats = {"queued": 0, "done": 0, "failed": 0}
+        stats.update({row['status']: row['n'] for row in rows})
+        stats["oldest_queued_age"] = round(time.time() - oldest, 3) if oldest else 0.0
+        return stats
+
+    # ----------------- Перенос в PostgreSQL -----------------
+    def _claim(self):
+        """Забрать пачку заявок; аренда не даёт другим воркерам взять те же записи."""
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT seq, tracking_id, payload, attempts FROM ingest_queue"
+                " WHERE status = 'queued' AND claimed_until < ? ORDER BY seq LIMIT ?",
+                (now, self.batch_size)).fetchall()
+            if rows:
+                conn.executemany("UPDATE ingest_queue SET claimed_until = ? WHERE seq = ?",
+                                 [(now + self.lease, row['seq']) for row in rows])
+        return rows
+
+    def _finish(self, results):
+        """results: [(seq, status, pereval_id, error)]"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE ingest_queue SET status = ?, pereval_id = ?, error = ?, updated_at = ?,"
+                " attempts = attempts + 1, claimed_until = 0 WHERE seq = ?",
+                [(status, pereval_id, error, now, seq) for seq, status, pereval_id, error in results])
+
+    def _release(self, rows):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE ingest_queue SET attempts = attempts + 1, claimed_until = 0, updated_at = ? WHERE seq = ?",
+                [(now, row['seq']) for row in rows])
+
+    def _insert(self, rows):
+        items = []
+        for row in rows:
+            payload = serialization.loads(row['payload'])
+            items.append((row['tracking_id'], payload['raw_data'], payload['images']))
+        return self.db_handler.add_perevals_ingested(items)
+
+    def flush_once(self):
+        """Перенести одну пачку. Возвращает число обработанных заявок."""
+        rows = self._claim()
+        if not rows:
+            return 0
+        try:
+            ids = self._insert(rows)
+            self._finish([(row['seq'], 'done', ids[row['tracking_id']], None) for row in rows])
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Ошибка переноса пачки из очереди ({len(rows)} заявок): {e}")
+            if max(row['attempts'] for row in rows) + 1 < self.max_attempts:
+                self._release(rows)
+                raise
+        # Пачка не проходит несколько раз подряд — вставляем по одной, чтобы найти виноватую заявку
+        results = []
+        for row in rows:
+            try:
+                ids = self._insert([row])
+                results.append((row['seq'], 'done', ids[row['tracking_id']], None))
+            except Exception as e:
+                results.append((row['seq'], 'failed', None, str(e)))
+        self._finish(results)
+        return len(rows)
+
+    def purge(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM ingest_queue WHERE status = 'done' AND updated_at < ?",
+                         (time.time() - self.retention,))
+
+    def _ensure_flusher(self):
+        if self._flusher_pid == os.getpid():
+            return
+        with self._flusher_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            # Поток запускается в каждом воркере отдельно, после fork
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_forever, name="ingest-queue-flusher", daemon=True).start()
+
+    def _flush_forever(self):
+        backoff = 1.0
+        last_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                if self.flush_once() < self.batch_size and self._wakeup.wait(5.0):
+                    # Пришла новая заявка: даём накопиться пачке (групповой коммит)
+                    self._wakeup.clear()
+                    self._stop.wait(self.flush_interval)
+                backoff = 1.0
+                if time.time() - last_purge > 3600:
+                    self.purge()
+                    last_purge = time.time()
+            except Exception:
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    def start(self):
+        """Запустить перенос сразу, не дожидаясь первой заявки (повтор после перезапуска)."""
+        self._ensure_flusher()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+
+class _Transaction:
+    """Контекстный менеджер BEGIN IMMEDIATE/COMMIT над соединением SQLite в autocommit-режиме."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def get_ingest_queue(db_handler):
+    path = os.getenv("FSTR_INGEST_QUEUE_PATH",
+                     os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_queue.sqlite3"))
+    return IngestQueue(
+        path, db_handler,
+        batch_size=int(os.getenv("FSTR_INGEST_BATCH_SIZE", 200)),
+        flush_interval=float(os.getenv("FSTR_INGEST_FLUSH_INTERVAL", 0.2)),
+    )
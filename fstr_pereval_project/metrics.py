@@ -0,0 +1,132 @@
+import os
+import time
+import logging
+import threading
+from functools import wraps
+
+from psycopg2.extras import RealDictCursor
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest)
+from prometheus_client import multiprocess
+
+import serialization
+
+# ----------------- Логирование -----------------
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("fstr.slow_query")
+
+# Порог журнала медленных запросов; 0 — журнал выключен
+SLOW_QUERY_SECONDS = float(os.getenv("FSTR_SLOW_QUERY_MS", 500)) / 1000
+SLOW_QUERY_MAX_SQL = 1000
+
+# Интервалы гистограмм: от долей миллисекунды (кэш, индекс) до десятков секунд (выгрузка)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# ----------------- Метрики -----------------
+REQUEST_DURATION = Histogram(
+    "fstr_http_request_duration_seconds", "Время обработки HTTP-запроса",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS)
+DB_METHOD_DURATION = Histogram(
+    "fstr_db_method_duration_seconds", "Время метода DatabaseHandler целиком, включая ожидание пула",
+    ["method"], buckets=LATENCY_BUCKETS)
+DB_METHOD_ERRORS = Counter(
+    "fstr_db_method_errors_total", "Исключения в методах DatabaseHandler", ["method"])
+DB_QUERY_DURATION = Histogram(
+    "fstr_db_query_duration_seconds", "Время выполнения SQL-запроса (execute)",
+    ["method"], buckets=LATENCY_BUCKETS)
+DB_ROWS = Counter(
+    "fstr_db_rows_total", "Строк возвращено или изменено SQL-запросами", ["method"])
+DB_SLOW_QUERIES = Counter(
+    "fstr_db_slow_queries_total", "SQL-запросы дольше FSTR_SLOW_QUERY_MS", ["method"])
+POOL_ACQUIRE_DURATION = Histogram(
+    "fstr_db_pool_acquire_seconds", "Ожидание соединения из пула", buckets=LATENCY_BUCKETS)
+JSON_DECODE_SECONDS = Counter(
+    "fstr_json_decode_seconds_total", "Время разбора json/jsonb из ответов БД", ["method"])
+TEMPLATE_RENDER_DURATION = Histogram(
+    "fstr_template_render_seconds", "Время рендеринга шаблона", ["template"], buckets=LATENCY_BUCKETS)
+OBJECT_CACHE_EVENTS = Counter(
+    "fstr_object_cache_events_total", "События кэша объектов: hit, shared_hit, miss, eviction, invalidation",
+    ["cache", "event"])
+DB_TARGET_CHECKOUTS = Counter(
+    "fstr_db_target_checkouts_total", "Соединения, выданные основным сервером и репликами", ["target"])
+DB_REPLICA_FAILOVERS = Counter(
+    "fstr_db_replica_failovers_total", "Реплика не ответила и исключена из выбора", ["replica"])
+# В режиме нескольких процессов — наибольшее значение по воркерам
+DB_REPLICA_LAG = Gauge(
+    "fstr_db_replica_lag_seconds", "Отставание реплики по последней проверке", ["replica"],
+    multiprocess_mode="max")
+
+# Метод DatabaseHandler, выполняющийся в текущем потоке: им помечаются SQL-запросы
+_current = threading.local()
+
+
+def current_method():
+    return getattr(_current, "method", None) or "other"
+
+
+# ----------------- Методы DatabaseHandler -----------------
+def instrumented(func):
+    """Замерить метод DatabaseHandler и пометить его именем все SQL-запросы внутри."""
+    name = func.__name__
+    duration = DB_METHOD_DURATION.labels(name)
+    errors = DB_METHOD_ERRORS.labels(name)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_current, "method", None)
+        _current.method = name
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            duration.observe(time.perf_counter() - started)
+            _current.method = outer
+
+    return wrapper
+
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor, который замеряет каждый execute и пишет медленные запросы в журнал."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            method = current_method()
+            DB_QUERY_DURATION.labels(method).observe(elapsed)
+            if self.rowcount > 0:
+                DB_ROWS.labels(method).inc(self.rowcount)
+            if SLOW_QUERY_SECONDS and elapsed >= SLOW_QUERY_SECONDS:
+                DB_SLOW_QUERIES.labels(method).inc()
+                sql = self.query.decode("utf-8", "replace") if self.query else str(query)
+                slow_query_logger.warning(
+                    f"Медленный запрос в {method}: {elapsed * 1000:.1f} мс, строк {self.rowcount}: "
+                    f"{' '.join(sql.split())[:SLOW_QUERY_MAX_SQL]}")
+
+
+def timed_json_loads(value):
+    """Разбор json/jsonb из psycopg2 выбранным кодеком с учётом затраченного времени."""
+    started = time.perf_counter()
+    try:
+        return serialization.loads(value)
+    finally:
+        JSON_DECODE_SECONDS.labels(current_method()).inc(time.perf_counter() - started)
+
+
+# ----------------- Выдача в формате Prometheus -----------------
+def render():
+    """
+    Текст метрик и Content-Type. Если задан PROMETHEUS_MULTIPROC_DIR (несколько
+    воркеров gunicorn), метрики всех воркеров суммируются из общего каталога.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
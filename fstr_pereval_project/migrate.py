@@ -0,0 +1,151 @@
+import os
+import re
+import sys
+import logging
+import argparse
+
+from dotenv import load_dotenv
+
+from database_handler import DatabaseHandler
+
+# ----------------- Логирование -----------------
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE_RE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+# Миграции с этой пометкой (например, CREATE INDEX CONCURRENTLY) выполняются вне транзакции
+NO_TRANSACTION_MARK = "-- migrate: no-transaction"
+# Ключ advisory-блокировки, чтобы два процесса не накатывали миграции одновременно
+ADVISORY_LOCK_KEY = 7452301
+
+SCHEMA_MIGRATIONS_DDL = """
+CREATE TABLE IF NOT EXISTS "public"."schema_migrations" (
+    "version" int4 NOT NULL,
+    "name" text NOT NULL,
+    "applied_at" timestamp NOT NULL DEFAULT now(),
+    PRIMARY KEY ("version")
+)
+"""
+
+
+# ----------------- Поиск миграций -----------------
+def discover_migrations(directory=MIGRATIONS_DIR):
+    """Список (version, name, path), отсортированный по номеру версии."""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE_RE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort()
+    versions = [m[0] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Номера миграций повторяются")
+    return migrations
+
+
+def applied_versions(conn):
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_MIGRATIONS_DDL)
+        cur.execute('SELECT "version" FROM "public"."schema_migrations"')
+        versions = {row['version'] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+# ----------------- Применение миграций -----------------
+def split_statements(sql):
+    """Разбить скрипт на операторы по ';' в конце строки (без поддержки $$-блоков)."""
+    statements = re.split(r";\s*$", sql, flags=re.MULTILINE)
+    result = []
+    for statement in statements:
+        code = "\n".join(line for line in statement.splitlines() if not line.strip().startswith("--")).strip()
+        if code:
+            result.append(code)
+    return result
+
+
+def _record(cur, version, name):
+    cur.execute('INSERT INTO "public"."schema_migrations" ("version", "name") VALUES (%s, %s)', (version, name))
+
+
+def apply_migration(conn, version, name, path):
+    with open(path, encoding="utf-8") as f:
+        sql = f.read()
+    if NO_TRANSACTION_MARK in sql:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                # Каждый оператор отдельным запросом: иначе PostgreSQL выполнит их одной неявной транзакцией
+                for statement in split_statements(sql):
+                    cur.execute(statement)
+                _record(cur, version, name)
+        finally:
+            conn.autocommit = False
+    else:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            _record(cur, version, name)
+        conn.commit()
+    logger.info(f"Миграция {version:04d}_{name} применена")
+
+
+def migrate(handler=None, target=None, directory=MIGRATIONS_DIR):
+    """Применить все ещё не применённые миграции до target включительно."""
+    handler = handler or DatabaseHandler()
+    conn = handler.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+        conn.commit()
+        done = applied_versions(conn)
+        applied = []
+        for version, name, path in discover_migrations(directory):
+            if version in done or (target is not None and version > target):
+                continue
+            try:
+                apply_migration(conn, version, name, path)
+            except Exception as e:
+                if not conn.closed:
+                    conn.rollback()
+                logger.error(f"Ошибка применения миграции {version:04d}_{name}: {e}")
+                raise
+            applied.append(version)
+        return applied
+    finally:
+        if not conn.closed:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_KEY,))
+            conn.commit()
+            conn.close()
+
+
+def status(handler=None, directory=MIGRATIONS_DIR):
+    handler = handler or DatabaseHandler()
+    conn = handler.get_connection()
+    try:
+        done = applied_versions(conn)
+    finally:
+        conn.close()
+    return [(version, name, version in done) for version, name, _ in discover_migrations(directory)]
+
+
+# ----------------- Запуск из командной строки -----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Версионные миграции схемы БД перевалов")
+    parser.add_argument("--list", action="store_true", help="показать миграции и их состояние")
+    parser.add_argument("--target", type=int, help="применить миграции только до этой версии")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if args.list:
+        for version, name, is_applied in status():
+            print(f"{'[x]' if is_applied else '[ ]'} {version:04d}_{name}")
+        return 0
+    applied = migrate(target=args.target)
+    print(f"Применено миграций: {len(applied)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
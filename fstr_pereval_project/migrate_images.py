@@ -0,0 +1,60 @@
+import sys
+import logging
+import argparse
+from io import BytesIO
+
+from dotenv import load_dotenv
+
+from database_handler import DatabaseHandler
+from blob_storage import get_blob_storage
+
+# ----------------- Логирование -----------------
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def migrate_images(handler, storage, batch_size=100, keep_bytea=False):
+    """
+    Перенести содержимое pereval_images.img в хранилище блобов.
+    Изображения читаются по одному, чтобы не держать в памяти всю пачку.
+    """
+    moved = 0
+    last_id = 0
+    while True:
+        ids = handler.get_legacy_image_ids(after_id=last_id, limit=batch_size)
+        if not ids:
+            break
+        for image_id in ids:
+            img = handler.get_image_by_id(image_id)
+            if img is None:
+                continue
+            # Старые записи не проверялись при загрузке; не-изображение отдаётся как application/octet-stream
+            blob = storage.put(BytesIO(bytes(img)), require_image=False)
+            handler.set_image_blob(image_id, blob, keep_bytea=keep_bytea)
+            moved += 1
+        last_id = ids[-1]
+        logger.info(f"Перенесено изображений: {moved}")
+    return moved
+
+
+# ----------------- Запуск из командной строки -----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перенос изображений из bytea в хранилище блобов")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--keep-bytea", action="store_true", help="не очищать колонку img после переноса")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    handler = DatabaseHandler()
+    try:
+        # Бэкенду pg_large_object нужен пул соединений DatabaseHandler, как в init_resources приложения
+        moved = migrate_images(handler, get_blob_storage(db_handler=handler), batch_size=args.batch_size,
+                               keep_bytea=args.keep_bytea)
+    finally:
+        handler.close()
+    print(f"Перенесено изображений: {moved}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
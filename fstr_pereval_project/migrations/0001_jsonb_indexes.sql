@@ -0,0 +1,26 @@
+-- -------------------------------------------------------------
+-- 0001: raw_data/images -> jsonb, индексы для поиска по email и статусу
+-- -------------------------------------------------------------
+
+-- Колонка, которую уже пишет update_pereval, но которой не было в pereval.sql
+ALTER TABLE "public"."pereval_added" ADD COLUMN IF NOT EXISTS "date_updated" timestamp;
+
+-- json -> jsonb: документ парсится один раз при записи, а не при каждом чтении
+ALTER TABLE "public"."pereval_added"
+    ALTER COLUMN "raw_data" TYPE jsonb USING "raw_data"::jsonb,
+    ALTER COLUMN "images" TYPE jsonb USING "images"::jsonb;
+
+-- Поиск по email пользователя (get_perevals_by_email)
+CREATE INDEX IF NOT EXISTS "pereval_added_user_email_idx"
+    ON "public"."pereval_added" (("raw_data"->'user'->>'email'));
+
+-- Фильтрация по статусу модерации
+CREATE INDEX IF NOT EXISTS "pereval_added_status_idx"
+    ON "public"."pereval_added" ("status");
+
+-- Keyset-пагинация списка перевалов
+CREATE INDEX IF NOT EXISTS "pereval_added_date_added_id_idx"
+    ON "public"."pereval_added" ("date_added" DESC, "id" DESC);
+
+-- Начальные данные вставлены с явным id, сдвигаем последовательность за них
+SELECT setval('pereval_id_seq', GREATEST((SELECT MAX("id") FROM "public"."pereval_added"), 1));
@@ -0,0 +1,18 @@
+-- -------------------------------------------------------------
+-- 0002: метаданные изображений для хранилища блобов
+-- -------------------------------------------------------------
+
+-- Содержимое файла хранится вне БД по ключу SHA-256, в таблице остаются только метаданные
+ALTER TABLE "public"."pereval_images"
+    ADD COLUMN IF NOT EXISTS "sha256" char(64),
+    ADD COLUMN IF NOT EXISTS "mimetype" varchar(100),
+    ADD COLUMN IF NOT EXISTS "size" int8;
+
+-- Старые записи ещё хранят байты в img, новые — только ссылку на блоб
+ALTER TABLE "public"."pereval_images" ALTER COLUMN "img" DROP NOT NULL;
+
+ALTER TABLE "public"."pereval_images" DROP CONSTRAINT IF EXISTS "pereval_images_content_check";
+ALTER TABLE "public"."pereval_images"
+    ADD CONSTRAINT "pereval_images_content_check" CHECK ("img" IS NOT NULL OR "sha256" IS NOT NULL);
+
+CREATE INDEX IF NOT EXISTS "pereval_images_sha256_idx" ON "public"."pereval_images" ("sha256");
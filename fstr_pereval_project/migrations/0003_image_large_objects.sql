@@ -0,0 +1,12 @@
+-- -------------------------------------------------------------
+-- 0003: хранилище изображений в large objects PostgreSQL
+-- -------------------------------------------------------------
+
+-- Соответствие SHA-256 содержимого и large object (бэкенд FSTR_BLOB_BACKEND=pg_large_object)
+CREATE TABLE IF NOT EXISTS "public"."image_large_objects" (
+    "sha256" char(64) NOT NULL,
+    "oid" oid NOT NULL,
+    "size" int8 NOT NULL,
+    "date_added" timestamp NOT NULL DEFAULT now(),
+    PRIMARY KEY ("sha256")
+);
@@ -0,0 +1,20 @@
+-- -------------------------------------------------------------
+-- 0004: уведомления об изменении справочников для сброса кэша
+-- -------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION "public"."notify_reference_change"() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('reference_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "pereval_areas_notify" ON "public"."pereval_areas";
+CREATE TRIGGER "pereval_areas_notify"
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "public"."pereval_areas"
+    FOR EACH STATEMENT EXECUTE FUNCTION "public"."notify_reference_change"();
+
+DROP TRIGGER IF EXISTS "spr_activities_types_notify" ON "public"."spr_activities_types";
+CREATE TRIGGER "spr_activities_types_notify"
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "public"."spr_activities_types"
+    FOR EACH STATEMENT EXECUTE FUNCTION "public"."notify_reference_change"();
@@ -0,0 +1,53 @@
+-- -------------------------------------------------------------
+-- 0005: привязка перевала к области и таблица замыкания иерархии областей
+-- -------------------------------------------------------------
+
+-- Область перевала берётся из raw_data.area_id и пересчитывается при каждом INSERT/UPDATE
+ALTER TABLE "public"."pereval_added"
+    ADD COLUMN IF NOT EXISTS "area_id" int8 GENERATED ALWAYS AS (
+        CASE WHEN "raw_data"->>'area_id' ~ '^[0-9]{1,18}$' THEN ("raw_data"->>'area_id')::int8 END
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS "pereval_added_area_id_idx"
+    ON "public"."pereval_added" ("area_id", "date_added" DESC, "id" DESC);
+
+-- Все пары (предок, потомок), включая сам узел с depth = 0
+CREATE TABLE IF NOT EXISTS "public"."pereval_area_closure" (
+    "ancestor_id" int8 NOT NULL,
+    "descendant_id" int8 NOT NULL,
+    "depth" int4 NOT NULL,
+    PRIMARY KEY ("ancestor_id", "descendant_id")
+);
+
+CREATE OR REPLACE FUNCTION "public"."refresh_area_closure"() RETURNS void AS $$
+BEGIN
+    -- Справочник небольшой, поэтому при любом изменении замыкание пересчитывается целиком
+    DELETE FROM "public"."pereval_area_closure";
+    INSERT INTO "public"."pereval_area_closure" ("ancestor_id", "descendant_id", "depth")
+    WITH RECURSIVE closure ("ancestor_id", "descendant_id", "depth") AS (
+        SELECT "id", "id", 0 FROM "public"."pereval_areas"
+        UNION ALL
+        SELECT c."ancestor_id", a."id", c."depth" + 1
+        FROM closure c
+        JOIN "public"."pereval_areas" a ON a."id_parent" = c."descendant_id" AND a."id" <> a."id_parent"
+        WHERE c."depth" < 64
+    )
+    SELECT DISTINCT ON ("ancestor_id", "descendant_id") "ancestor_id", "descendant_id", "depth"
+    FROM closure
+    ORDER BY "ancestor_id", "descendant_id", "depth";
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION "public"."rebuild_area_closure"() RETURNS trigger AS $$
+BEGIN
+    PERFORM "public"."refresh_area_closure"();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "pereval_areas_closure" ON "public"."pereval_areas";
+CREATE TRIGGER "pereval_areas_closure"
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "public"."pereval_areas"
+    FOR EACH STATEMENT EXECUTE FUNCTION "public"."rebuild_area_closure"();
+
+SELECT "public"."refresh_area_closure"();
@@ -0,0 +1,9 @@
+-- -------------------------------------------------------------
+-- 0006: идентификатор заявки из очереди асинхронного приёма
+-- -------------------------------------------------------------
+
+-- Повторный перенос той же заявки после сбоя не создаёт дубликат
+ALTER TABLE "public"."pereval_added" ADD COLUMN IF NOT EXISTS "ingest_id" text;
+
+CREATE UNIQUE INDEX IF NOT EXISTS "pereval_added_ingest_id_key"
+    ON "public"."pereval_added" ("ingest_id");
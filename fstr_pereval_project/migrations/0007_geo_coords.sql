@@ -0,0 +1,22 @@
+-- -------------------------------------------------------------
+-- 0007: числовые координаты перевала и пространственный индекс
+-- -------------------------------------------------------------
+
+-- Координаты берутся из raw_data.coords; нечисловые и вне диапазона значения дают NULL
+ALTER TABLE "public"."pereval_added"
+    ADD COLUMN IF NOT EXISTS "lat" float8 GENERATED ALWAYS AS (
+        CASE WHEN "raw_data"->'coords'->>'latitude' ~ '^\s*-?[0-9]{1,3}(\.[0-9]+)?\s*$'
+                  AND abs(("raw_data"->'coords'->>'latitude')::float8) <= 90
+             THEN ("raw_data"->'coords'->>'latitude')::float8 END
+    ) STORED,
+    ADD COLUMN IF NOT EXISTS "lon" float8 GENERATED ALWAYS AS (
+        CASE WHEN "raw_data"->'coords'->>'longitude' ~ '^\s*-?[0-9]{1,3}(\.[0-9]+)?\s*$'
+                  AND abs(("raw_data"->'coords'->>'longitude')::float8) <= 180
+             THEN ("raw_data"->'coords'->>'longitude')::float8 END
+    ) STORED;
+
+-- GiST по point(lon, lat) из ядра PostgreSQL (без PostGIS): поиск в прямоугольнике
+-- оператором <@ и ближайшие точки через ORDER BY <-> (KNN-обход индекса)
+CREATE INDEX IF NOT EXISTS "pereval_added_geo_idx"
+    ON "public"."pereval_added" USING gist (point("lon", "lat"))
+    WHERE "lat" IS NOT NULL AND "lon" IS NOT NULL;
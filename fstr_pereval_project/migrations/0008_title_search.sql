@@ -0,0 +1,65 @@
+-- -------------------------------------------------------------
+-- 0008: полнотекстовый и нечёткий поиск по названиям перевала
+-- -------------------------------------------------------------
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Названия из raw_data (beautyTitle, title, other_titles) в нижнем регистре и с «ё» → «е»:
+-- пользователи часто пишут «е». Столбцы вычисляемые, поэтому актуальны после любого INSERT/UPDATE
+ALTER TABLE "public"."pereval_added"
+    ADD COLUMN IF NOT EXISTS "search_title" text GENERATED ALWAYS AS (
+        translate(lower(
+            coalesce("raw_data"->>'beautyTitle', '') || ' ' || coalesce("raw_data"->>'title', '') || ' '
+            || coalesce("raw_data"->>'other_titles', '')), 'ё', 'е')
+    ) STORED,
+    -- Русская морфология (перевала → перевал) плюс слова как есть для поиска по префиксу
+    ADD COLUMN IF NOT EXISTS "search_tsv" tsvector GENERATED ALWAYS AS (
+        to_tsvector('russian'::regconfig, translate(lower(
+            coalesce("raw_data"->>'beautyTitle', '') || ' ' || coalesce("raw_data"->>'title', '') || ' '
+            || coalesce("raw_data"->>'other_titles', '')), 'ё', 'е'))
+        || to_tsvector('simple'::regconfig, translate(lower(
+            coalesce("raw_data"->>'beautyTitle', '') || ' ' || coalesce("raw_data"->>'title', '') || ' '
+            || coalesce("raw_data"->>'other_titles', '')), 'ё', 'е'))
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS "pereval_added_search_tsv_idx"
+    ON "public"."pereval_added" USING gin ("search_tsv");
+
+-- Словарь различных слов из названий. Опечатки исправляются триграммами по нему, а не по
+-- строкам перевалов: слов на порядки меньше, и время поиска не зависит от размера таблицы
+CREATE TABLE IF NOT EXISTS "public"."pereval_title_words" (
+    "word" text PRIMARY KEY
+);
+
+CREATE INDEX IF NOT EXISTS "pereval_title_words_trgm_idx"
+    ON "public"."pereval_title_words" USING gin ("word" gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION "public"."collect_title_words"() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO "public"."pereval_title_words" ("word")
+    SELECT DISTINCT w
+    FROM changed, regexp_split_to_table(changed."search_title", '[^[:alnum:]]+') AS w
+    WHERE length(w) >= 3
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- На оператор, а не на строку: пакетная вставка execute_values пополняет словарь одним запросом
+DROP TRIGGER IF EXISTS "pereval_added_title_words_insert" ON "public"."pereval_added";
+CREATE TRIGGER "pereval_added_title_words_insert"
+    AFTER INSERT ON "public"."pereval_added"
+    REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION "public"."collect_title_words"();
+
+DROP TRIGGER IF EXISTS "pereval_added_title_words_update" ON "public"."pereval_added";
+CREATE TRIGGER "pereval_added_title_words_update"
+    AFTER UPDATE ON "public"."pereval_added"
+    REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION "public"."collect_title_words"();
+
+INSERT INTO "public"."pereval_title_words" ("word")
+SELECT DISTINCT w
+FROM "public"."pereval_added", regexp_split_to_table("search_title", '[^[:alnum:]]+') AS w
+WHERE length(w) >= 3
+ON CONFLICT DO NOTHING;
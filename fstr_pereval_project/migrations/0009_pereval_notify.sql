@@ -0,0 +1,17 @@
+-- -------------------------------------------------------------
+-- 0009: уведомления об изменении и удалении перевала для сброса кэша объектов
+-- -------------------------------------------------------------
+
+-- В payload — id перевала; уведомление уходит при COMMIT, так что воркеры сбрасывают
+-- запись уже после того, как новые данные видны. Ловит и изменения статуса прямо в SQL
+CREATE OR REPLACE FUNCTION "public"."notify_pereval_change"() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('pereval_changed', OLD."id"::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "pereval_added_notify" ON "public"."pereval_added";
+CREATE TRIGGER "pereval_added_notify"
+    AFTER UPDATE OR DELETE ON "public"."pereval_added"
+    FOR EACH ROW EXECUTE FUNCTION "public"."notify_pereval_change"();
@@ -0,0 +1,43 @@
+-- -------------------------------------------------------------
+-- 0010: номер версии перевала и JSON merge-patch (RFC 7396) на стороне БД
+-- -------------------------------------------------------------
+
+-- Значение по умолчанию без перезаписи таблицы (PostgreSQL 11+)
+ALTER TABLE "public"."pereval_added"
+    ADD COLUMN IF NOT EXISTS "version" integer NOT NULL DEFAULT 1;
+
+-- Версия растёт при любом UPDATE, в том числе в обход API (смена статуса модератором),
+-- поэтому по ней строится ETag и проверяется If-Match
+CREATE OR REPLACE FUNCTION "public"."bump_pereval_version"() RETURNS trigger AS $$
+BEGIN
+    NEW."version" := OLD."version" + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "pereval_added_version" ON "public"."pereval_added";
+CREATE TRIGGER "pereval_added_version"
+    BEFORE UPDATE ON "public"."pereval_added"
+    FOR EACH ROW EXECUTE FUNCTION "public"."bump_pereval_version"();
+
+-- RFC 7396: объекты сливаются рекурсивно, null удаляет ключ, остальные значения
+-- (в том числе массивы) заменяются целиком
+CREATE OR REPLACE FUNCTION "public"."jsonb_merge_patch"(target jsonb, patch jsonb) RETURNS jsonb AS $$
+DECLARE
+    result jsonb;
+    item record;
+BEGIN
+    IF jsonb_typeof(patch) IS DISTINCT FROM 'object' THEN
+        RETURN patch;
+    END IF;
+    result := CASE WHEN jsonb_typeof(target) = 'object' THEN target ELSE '{}'::jsonb END;
+    FOR item IN SELECT key, value FROM jsonb_each(patch) LOOP
+        IF jsonb_typeof(item.value) = 'null' THEN
+            result := result - item.key;
+        ELSE
+            result := result || jsonb_build_object(item.key, "public"."jsonb_merge_patch"(result -> item.key, item.value));
+        END IF;
+    END LOOP;
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
@@ -0,0 +1,19 @@
+-- migrate: no-transaction
+-- -------------------------------------------------------------
+-- 0011: очередь модерации — захват заявок с арендой и частичные индексы по статусу
+-- -------------------------------------------------------------
+
+-- Кто из модераторов взял заявку в работу (status = 'pending') и до какого момента
+ALTER TABLE "public"."pereval_added"
+    ADD COLUMN IF NOT EXISTS "claimed_by" text,
+    ADD COLUMN IF NOT EXISTS "claimed_until" timestamptz;
+
+-- Только новые заявки в порядке поступления: следующие N берутся из начала индекса,
+-- а размер индекса равен длине очереди, а не всей таблицы. CONCURRENTLY — без блокировки записи
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "pereval_added_new_queue_idx"
+    ON "public"."pereval_added" ("date_added", "id") WHERE "status" = 'new';
+
+-- Заявки в работе по сроку аренды: просроченные и взятые без аренды (NULL) возвращаются
+-- в очередь первыми
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "pereval_added_pending_lease_idx"
+    ON "public"."pereval_added" ("claimed_until" NULLS FIRST) WHERE "status" = 'pending';
@@ -0,0 +1,91 @@
+-- -------------------------------------------------------------
+-- 0012: журнал изменений для синхронизации офлайн-клиентов — номер транзакции
+-- последнего изменения строки и записи об удалённых строках
+-- -------------------------------------------------------------
+
+-- Номер транзакции (xid8, PostgreSQL 13+), которая последней вставила или изменила строку.
+-- Обычная последовательность не годится: номера выдаются до COMMIT, и строка с меньшим
+-- номером может стать видна позже строки с большим — клиент, запомнивший больший номер,
+-- её пропустит. Транзакции, не видные в снимке прошлой синхронизации, находятся точно
+-- (pg_visible_in_snapshot). Существующие строки получают 0 без перезаписи таблицы
+-- и попадают только в полную синхронизацию
+ALTER TABLE "public"."pereval_added"
+    ADD COLUMN IF NOT EXISTS "change_xid" xid8 NOT NULL DEFAULT '0';
+ALTER TABLE "public"."pereval_added" ALTER COLUMN "change_xid" SET DEFAULT pg_current_xact_id();
+
+ALTER TABLE "public"."pereval_areas"
+    ADD COLUMN IF NOT EXISTS "change_xid" xid8 NOT NULL DEFAULT '0';
+ALTER TABLE "public"."pereval_areas" ALTER COLUMN "change_xid" SET DEFAULT pg_current_xact_id();
+
+ALTER TABLE "public"."spr_activities_types"
+    ADD COLUMN IF NOT EXISTS "change_xid" xid8 NOT NULL DEFAULT '0';
+ALTER TABLE "public"."spr_activities_types" ALTER COLUMN "change_xid" SET DEFAULT pg_current_xact_id();
+
+-- Удалённые строки: id, таблица и область видимости (email автора перевала, '' для справочников).
+-- При повторном удалении того же id запись обновляется
+CREATE TABLE IF NOT EXISTS "public"."sync_tombstones" (
+    "table_name" text NOT NULL,
+    "id" int8 NOT NULL,
+    "scope" text NOT NULL DEFAULT '',
+    "change_xid" xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    "deleted_at" timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY ("table_name", "id")
+);
+
+-- Вставка получает номер из DEFAULT, изменение — из триггера
+CREATE OR REPLACE FUNCTION "public"."sync_mark_change"() RETURNS trigger AS $$
+BEGIN
+    NEW."change_xid" := pg_current_xact_id();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION "public"."sync_record_delete"() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO "public"."sync_tombstones" ("table_name", "id", "scope")
+    VALUES (TG_TABLE_NAME, OLD."id", COALESCE(to_jsonb(OLD)->'raw_data'->'user'->>'email', ''))
+    ON CONFLICT ("table_name", "id") DO UPDATE
+        SET "scope" = EXCLUDED."scope", "change_xid" = EXCLUDED."change_xid", "deleted_at" = EXCLUDED."deleted_at";
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "pereval_added_sync" ON "public"."pereval_added";
+CREATE TRIGGER "pereval_added_sync"
+    BEFORE UPDATE ON "public"."pereval_added"
+    FOR EACH ROW EXECUTE FUNCTION "public"."sync_mark_change"();
+DROP TRIGGER IF EXISTS "pereval_added_sync_delete" ON "public"."pereval_added";
+CREATE TRIGGER "pereval_added_sync_delete"
+    AFTER DELETE ON "public"."pereval_added"
+    FOR EACH ROW EXECUTE FUNCTION "public"."sync_record_delete"();
+
+DROP TRIGGER IF EXISTS "pereval_areas_sync" ON "public"."pereval_areas";
+CREATE TRIGGER "pereval_areas_sync"
+    BEFORE UPDATE ON "public"."pereval_areas"
+    FOR EACH ROW EXECUTE FUNCTION "public"."sync_mark_change"();
+DROP TRIGGER IF EXISTS "pereval_areas_sync_delete" ON "public"."pereval_areas";
+CREATE TRIGGER "pereval_areas_sync_delete"
+    AFTER DELETE ON "public"."pereval_areas"
+    FOR EACH ROW EXECUTE FUNCTION "public"."sync_record_delete"();
+
+DROP TRIGGER IF EXISTS "spr_activities_types_sync" ON "public"."spr_activities_types";
+CREATE TRIGGER "spr_activities_types_sync"
+    BEFORE UPDATE ON "public"."spr_activities_types"
+    FOR EACH ROW EXECUTE FUNCTION "public"."sync_mark_change"();
+DROP TRIGGER IF EXISTS "spr_activities_types_sync_delete" ON "public"."spr_activities_types";
+CREATE TRIGGER "spr_activities_types_sync_delete"
+    AFTER DELETE ON "public"."spr_activities_types"
+    FOR EACH ROW EXECUTE FUNCTION "public"."sync_record_delete"();
+
+-- Синхронизация без изменений — по одному пустому диапазону в каждом индексе
+CREATE INDEX IF NOT EXISTS "pereval_added_user_email_change_idx"
+    ON "public"."pereval_added" (("raw_data"->'user'->>'email'), "change_xid", "id");
+CREATE INDEX IF NOT EXISTS "pereval_areas_change_idx"
+    ON "public"."pereval_areas" ("change_xid", "id");
+CREATE INDEX IF NOT EXISTS "spr_activities_types_change_idx"
+    ON "public"."spr_activities_types" ("change_xid", "id");
+CREATE INDEX IF NOT EXISTS "sync_tombstones_change_idx"
+    ON "public"."sync_tombstones" ("table_name", "scope", "change_xid", "id");
+-- Очистка старых записей об удалении (prune_sync_tombstones)
+CREATE INDEX IF NOT EXISTS "sync_tombstones_deleted_at_idx"
+    ON "public"."sync_tombstones" ("deleted_at");
@@ -0,0 +1,81 @@
+-- -------------------------------------------------------------
+-- 0013: счётчики перевалов по области, статусу, категории трудности, высоте и месяцу,
+-- обновляемые триггерами при каждом изменении
+-- -------------------------------------------------------------
+
+-- Ключ '' — значение не указано. shard разносит обновления одного счётчика из разных
+-- соединений по разным строкам: вставки не ждут друг друга на блокировке строки 'status'/'new'.
+-- Значение счётчика — сумма по всем shard
+CREATE TABLE IF NOT EXISTS "public"."pereval_stats" (
+    "dimension" text NOT NULL,
+    "key" text NOT NULL,
+    "shard" int2 NOT NULL,
+    "count" int8 NOT NULL,
+    PRIMARY KEY ("dimension", "key", "shard")
+);
+
+-- Ключи счётчиков, в которые входит перевал. Высота — нижняя граница интервала в 500 м.
+-- STABLE, а не IMMUTABLE: to_char(timestamp) зависит от настроек сеанса
+CREATE OR REPLACE FUNCTION "public"."pereval_stats_keys"(p "public"."pereval_added")
+RETURNS TABLE ("dimension" text, "key" text) AS $$
+    SELECT * FROM (VALUES
+        ('total', ''),
+        ('area', COALESCE(p."area_id"::text, '')),
+        ('status', COALESCE(p."status", '')),
+        ('level.summer', COALESCE(btrim(p."raw_data"->'level'->>'summer'), '')),
+        ('level.winter', COALESCE(btrim(p."raw_data"->'level'->>'winter'), '')),
+        ('level.autumn', COALESCE(btrim(p."raw_data"->'level'->>'autumn'), '')),
+        ('level.spring', COALESCE(btrim(p."raw_data"->'level'->>'spring'), '')),
+        ('height', CASE WHEN p."raw_data"->'coords'->>'height' ~ '^\s*[0-9]{1,5}(\.[0-9]+)?\s*$'
+                        THEN (floor((p."raw_data"->'coords'->>'height')::numeric / 500) * 500)::int::text
+                        ELSE '' END),
+        ('month', COALESCE(to_char(p."date_added", 'YYYY-MM'), ''))
+    ) AS k ("dimension", "key")
+$$ LANGUAGE sql STABLE;
+
+-- На оператор: пакетная вставка меняет каждый счётчик одним UPSERT. При UPDATE старые и новые
+-- значения взаимно сокращаются, и строки пишутся только для изменившихся ключей (смена статуса —
+-- два счётчика). Ключи по порядку — одновременные операторы не ловят взаимную блокировку
+CREATE OR REPLACE FUNCTION "public"."apply_pereval_stats"() RETURNS trigger AS $$
+DECLARE
+    added text := 'SELECT k.*, 1 AS delta FROM new_rows n, "public"."pereval_stats_keys"(n) k';
+    removed text := 'SELECT k.*, -1 AS delta FROM old_rows o, "public"."pereval_stats_keys"(o) k';
+BEGIN
+    EXECUTE format($sql$
+        INSERT INTO "public"."pereval_stats" ("dimension", "key", "shard", "count")
+        SELECT c."dimension", c."key", pg_backend_pid() %% 16, sum(c.delta)
+        FROM (%s) c
+        GROUP BY c."dimension", c."key"
+        HAVING sum(c.delta) <> 0
+        ORDER BY c."dimension", c."key"
+        ON CONFLICT ("dimension", "key", "shard") DO UPDATE
+            SET "count" = "pereval_stats"."count" + EXCLUDED."count"
+    $sql$, CASE TG_OP WHEN 'INSERT' THEN added WHEN 'DELETE' THEN removed
+                      ELSE added || ' UNION ALL ' || removed END);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "pereval_added_stats_insert" ON "public"."pereval_added";
+CREATE TRIGGER "pereval_added_stats_insert"
+    AFTER INSERT ON "public"."pereval_added"
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION "public"."apply_pereval_stats"();
+DROP TRIGGER IF EXISTS "pereval_added_stats_update" ON "public"."pereval_added";
+CREATE TRIGGER "pereval_added_stats_update"
+    AFTER UPDATE ON "public"."pereval_added"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION "public"."apply_pereval_stats"();
+DROP TRIGGER IF EXISTS "pereval_added_stats_delete" ON "public"."pereval_added";
+CREATE TRIGGER "pereval_added_stats_delete"
+    AFTER DELETE ON "public"."pereval_added"
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION "public"."apply_pereval_stats"();
+
+-- Начальные значения. Блокировка не даёт записи пройти между подсчётом и включением триггеров
+LOCK TABLE "public"."pereval_added" IN SHARE MODE;
+DELETE FROM "public"."pereval_stats";
+INSERT INTO "public"."pereval_stats" ("dimension", "key", "shard", "count")
+SELECT k."dimension", k."key", 0, count(*)
+FROM "public"."pereval_added" p, "public"."pereval_stats_keys"(p) k
+GROUP BY k."dimension", k."key";
@@ -0,0 +1,7 @@
+-- -------------------------------------------------------------
+-- 0014: pereval_stats_keys из миграции 0013 была объявлена IMMUTABLE, хотя
+-- вызывает to_char(timestamp) — она STABLE (зависит от настроек сеанса).
+-- Для баз, где 0013 уже применена; в самой 0013 исправлено
+-- -------------------------------------------------------------
+
+ALTER FUNCTION "public"."pereval_stats_keys"("public"."pereval_added") STABLE;
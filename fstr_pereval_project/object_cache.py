@@ -0,0 +1,233 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from metrics import OBJECT_CACHE_EVENTS
+
+# ----------------- Логирование -----------------
+logger = logging.getLogger(__name__)
+
+# Канал, в который триггер миграции 0009 пишет id изменённого или удалённого перевала
+PEREVAL_NOTIFY_CHANNEL = "pereval_changed"
+
+
+class CachedPereval:
+    """Готовый JSON-ответ перевала и его версия для условного GET."""
+
+    def __init__(self, body, etag, last_modified):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def dump(self):
+        """Байты для общего хранилища: две строки заголовка и тело."""
+        return f"{self.etag}\n{self.last_modified.isoformat()}\n".encode() + self.body
+
+    @classmethod
+    def load(cls, data):
+        etag, last_modified, body = data.split(b"\n", 2)
+        return cls(body, etag.decode(), datetime.fromisoformat(last_modified.decode()))
+
+
+# ----------------- Общее хранилище -----------------
+class LocalSharedStore:
+    """
+    Заменитель общего хранилища в памяти процесса — для разработки и тестов.
+    Интерфейс тот же, что у RedisSharedStore, но воркеры его не разделяют.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                return None
+            return value
+
+    def generation(self, key):
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def set(self, key, value, ttl, generation):
+        """Записать value, только если поколение key не менялось с generation."""
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return False
+            self._data[key] = (value, time.monotonic() + ttl)
+            return True
+
+    def delete(self, key, ttl):
+        """Удалить значение и сменить поколение key: начатые до этого записи отклоняются."""
+        with self._lock:
+            self._data.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+
+class RedisSharedStore:
+    """
+    Общее для всех воркеров и хостов хранилище в Redis (нужен пакет redis).
+    Поколение ключа хранится рядом, в <key>:gen; запись сверяет его атомарно скриптом Lua.
+    """
+
+    # KEYS[1] — значение, KEYS[2] — поколение; ARGV — ожидаемое поколение, значение, ttl
+    SET_IF_GENERATION = """
+        if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[1]) then
+            return 0
+        end
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        return 1
+    """
+
+    def __init__(self, url, prefix="fstr:"):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._set_if_generation = self._client.register_script(self.SET_IF_GENERATION)
+
+    def get(self, key):
+        return self._client.get(self._prefix + key)
+
+    def generation(self, key):
+        return int(self._client.get(self._prefix + key + ":gen") or 0)
+
+    def set(self, key, value, ttl, generation):
+        keys = [self._prefix + key, self._prefix + key + ":gen"]
+        return bool(self._set_if_generation(keys=keys, args=[generation, value, max(1, int(ttl))]))
+
+    def delete(self, key, ttl):
+        # Поколение живёт дольше записи: если бы оно истекло посреди загрузки, счёт начался
+        # бы заново и мог совпасть с прочитанным до сброса
+        pipe = self._client.pipeline(transaction=True)
+        pipe.delete(self._prefix + key)
+        pipe.incr(self._prefix + key + ":gen")
+        pipe.expire(self._prefix + key + ":gen", max(1, int(ttl)) * 2)
+        pipe.execute()
+
+
+# ----------------- Кэш объектов -----------------
+class ObjectCache:
+    """
+    Кэш со сквозным чтением: LRU на max_entries записей в памяти процесса и, если
+    задано, общее хранилище shared (Redis или заменитель). Запись живёт не дольше
+    ttl секунд; invalidate(key) сбрасывает её во всех уровнях. Если сброс пришёл,
+    пока значение загружалось, загруженное значение не кэшируется — оно могло устареть.
+    В общем хранилище это отслеживает поколение ключа: оно читается до загрузки, а запись
+    проходит, только если с тех пор сброса не было — в том числе из другого воркера.
+    """
+
+    def __init__(self, name, loader, max_entries=10000, ttl=300.0, shared=None, dump=None, load=None):
+        self.name = name
+        self.loader = loader
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self.dump = dump
+        self.load = load
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(("hit", "shared_hit", "miss", "eviction", "invalidation"), 0)
+        self._counters = {event: OBJECT_CACHE_EVENTS.labels(name, event) for event in self._counts}
+
+    def _count(self, event):
+        # Вызывается под self._lock
+        self._counts[event] += 1
+        self._counters[event].inc()
+
+    def get(self, key):
+        """Значение из кэша или loader(key); None от загрузчика не кэшируется."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and time.monotonic() < item[1]:
+                self._entries.move_to_end(key)
+                self._count("hit")
+                return item[0]
+            token = object()
+            self._loading[key] = token
+
+        value = None
+        generation = None
+        if self.shared is not None:
+            try:
+                generation = self.shared.generation(self._shared_key(key))
+                data = self.shared.get(self._shared_key(key))
+                value = self.load(data) if data is not None else None
+            except Exception as e:
+                logger.error(f"Ошибка чтения общего кэша {self.name}: {e}")
+        from_shared = value is not None
+        if not from_shared:
+            value = self.loader(key)
+            if value is None:
+                with self._lock:
+                    self._count("miss")
+                    if self._loading.get(key) is token:
+                        del self._loading[key]
+                return None
+
+        with self._lock:
+            self._count("shared_hit" if from_shared else "miss")
+            if self._loading.get(key) is not token:
+                return value
+            del self._loading[key]
+            self._store(key, value)
+        if generation is not None and not from_shared:
+            try:
+                self.shared.set(self._shared_key(key), self.dump(value), self.ttl, generation)
+            except Exception as e:
+                logger.error(f"Ошибка записи в общий кэш {self.name}: {e}")
+        return value
+
+    def _store(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._count("eviction")
+
+    def _shared_key(self, key):
+        return f"{self.name}:{key}"
+
+    def invalidate(self, key=None):
+        """
+        Сбросить запись key во всех уровнях; key=None — весь кэш процесса (общее
+        хранилище тогда полагается на ttl).
+        """
+        with self._lock:
+            self._count("invalidation")
+            if key is None:
+                self._entries.clear()
+                self._loading.clear()
+                return
+            self._entries.pop(key, None)
+            self._loading.pop(key, None)
+        if self.shared is not None:
+            try:
+                self.shared.delete(self._shared_key(key), self.ttl)
+            except Exception as e:
+                logger.error(f"Ошибка сброса общего кэша {self.name}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "max_entries": self.max_entries, **self._counts}
+
+
+def get_shared_store():
+    """Общее хранилище по FSTR_OBJECT_CACHE_SHARED: пусто — нет, local — заменитель, redis://… — Redis."""
+    target = os.getenv("FSTR_OBJECT_CACHE_SHARED", "")
+    if not target:
+        return None
+    if target == "local":
+        return LocalSharedStore()
+    return RedisSharedStore(target)
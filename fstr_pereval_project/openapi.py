@@ -0,0 +1,59 @@
+"""
+Сборка спецификации OpenAPI (Swagger 2.0) из docstring маршрутов в static/openapi.json.
+
+Flasgger разбирает docstring всех маршрутов — при запуске приложения это заметная часть
+холодного старта, поэтому спецификация собирается заранее (при сборке или вместе с
+изменением маршрутов) и отдаётся файлом:
+
+    python openapi.py          # пересобрать static/openapi.json
+    python openapi.py --check  # код 1, если файл устарел
+"""
+import os
+import sys
+import json
+
+SPEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "openapi.json")
+
+
+def build_spec():
+    from flasgger import Swagger
+    from app import create_app
+
+    flask_app = create_app()
+    swagger = Swagger(flask_app)
+    with flask_app.test_request_context():
+        return swagger.get_apispecs()
+
+
+def dumps_spec(spec):
+    # Ключи по порядку и отступы: изменение маршрута даёт читаемый diff
+    return json.dumps(spec, ensure_ascii=False, indent=1, sort_keys=True) + "\n"
+
+
+def main(argv=None):
+    import argparse  # модуль импортирует и приложение ради SPEC_PATH — не замедляем его старт
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="только проверить, что файл актуален")
+    args = parser.parse_args(argv)
+
+    text = dumps_spec(build_spec())
+    if args.check:
+        try:
+            with open(SPEC_PATH, encoding="utf-8") as f:
+                current = f.read()
+        except FileNotFoundError:
+            current = None
+        if current != text:
+            print(f"{SPEC_PATH} устарел: запустите python openapi.py")
+            return 1
+        return 0
+    os.makedirs(os.path.dirname(SPEC_PATH), exist_ok=True)
+    with open(SPEC_PATH, "w", encoding="utf-8") as f:
+        f.write(text)
+    print(f"Спецификация записана в {SPEC_PATH}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import os
+import time
+import select
+import hashlib
+import logging
+import threading
+
+import serialization
+
+# ----------------- Логирование -----------------
+logger = logging.getLogger(__name__)
+
+# Канал, в который триггеры миграции 0004 пишут имя изменённой таблицы
+NOTIFY_CHANNEL = "reference_data_changed"
+
+
+class CacheEntry:
+    def __init__(self, data, loaded_at, serialize=None):
+        self.data = data
+        self.loaded_at = loaded_at
+        # Ответ сериализуется один раз при загрузке, а не на каждый запрос
+        payload = serialize(data) if serialize else data
+        self.body = serialization.dumps(payload)
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+
+
+# ----------------- Кэш справочников -----------------
+class ReferenceCache:
+    """
+    Кэш редко меняющихся справочников (области, типы активности) в памяти процесса.
+    Запись живёт не дольше ttl секунд и сбрасывается раньше по LISTEN/NOTIFY,
+    когда меняется исходная таблица, — так все воркеры gunicorn видят изменения
+    без опроса БД.
+    """
+
+    def __init__(self, ttl=300.0, connect_factory=None):
+        self.ttl = ttl
+        self.connect_factory = connect_factory
+        self._loaders = {}
+        self._serializers = {}
+        self._tables = {}
+        self._entries = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._listener_pid = None
+        self._stop = threading.Event()
+        self._subscribers = {}
+
+    def register(self, name, loader, tables, serialize=None):
+        """
+        loader() возвращает данные справочника; tables — таблицы, от которых он зависит;
+        serialize(data) — JSON-представление, если данные не сериализуются напрямую.
+        """
+        self._loaders[name] = loader
+        self._serializers[name] = serialize
+        self._load_locks[name] = threading.Lock()
+        for table in tables:
+            self._tables.setdefault(table, set()).add(name)
+
+    def subscribe(self, channel, callback):
+        """
+        Передавать уведомления ещё одного канала NOTIFY в callback(payload) через то же
+        соединение. После переподключения вызывается callback(None): уведомления могли
+        потеряться. Подписываться нужно до первого обращения к кэшу.
+        """
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    # ----------------- Чтение и сброс -----------------
+    def get(self, name):
+        self.ensure_listener()
+        entry = self._entries.get(name)
+        if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+            return entry
+        # Один поток загружает данные, остальные ждут его результат
+        with self._load_locks[name]:
+            entry = self._entries.get(name)
+            if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+                return entry
+            version = self._versions.get(name, 0)
+            entry = CacheEntry(self._loaders[name](), time.monotonic(), self._serializers[name])
+            with self._lock:
+                # Сброс во время загрузки означает, что данные могли устареть — не кэшируем их
+                if self._versions.get(name, 0) == version:
+                    self._entries[name] = entry
+            return entry
+
+    def invalidate(self, name=None):
+        with self._lock:
+            names = list(self._loaders) if name is None else [name]
+            for n in names:
+                self._entries.pop(n, None)
+                self._versions[n] = self._versions.get(n, 0) + 1
+
+    def invalidate_table(self, table):
+        for name in self._tables.get(table, ()):
+            self.invalidate(name)
+        logger.info(f"Кэш справочников сброшен: изменилась таблица {table}")
+
+    # ----------------- LISTEN/NOTIFY -----------------
+    def ensure_listener(self):
+        if self.connect_factory is None or self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            # Поток запускается в каждом воркере отдельно, после fork
+            self._listener_pid = os.getpid()
+            threading.Thread(target=self._listen_forever, name="reference-cache-listener", daemon=True).start()
+
+    def _listen_forever(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self.connect_factory()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    for channel in (NOTIFY_CHANNEL, *self._subscribers):
+                        cur.execute(f"LISTEN {channel}")
+                # Пока соединения не было, уведомления могли потеряться
+                self.invalidate()
+                self._publish_reset()
+                backoff = 1.0
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._dispatch(notify.channel, notify.payload)
+            except Exception as e:
+                logger.error(f"Ошибка подписки на изменения справочников: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _dispatch(self, channel, payload):
+        if channel == NOTIFY_CHANNEL:
+            self.invalidate_table(payload)
+            return
+        for callback in self._subscribers.get(channel, ()):
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.error(f"Ошибка обработки уведомления {channel}: {e}")
+
+    def _publish_reset(self):
+        for channel in self._subscribers:
+            self._dispatch(channel, None)
+
+    def stop(self):
+        self._stop.set()
+
+
+class AsyncReferenceCache(ReferenceCache):
+    """
+    Тот же кэш для ASGI-приложения: загрузчики — корутины, а уведомления
+    NOTIFY принимает соединение asyncpg в цикле событий, без отдельного потока.
+    """
+
+    def __init__(self, ttl=300.0):
+        super().__init__(ttl=ttl)
+        self._listen_conn = None
+
+    def register(self, name, loader, tables, serialize=None):
+        super().register(name, loader, tables, serialize)
+        import asyncio  # только для ASGI-приложения: Flask-воркеру он не нужен
+
+        self._load_locks[name] = asyncio.Lock()
+
+    async def get(self, name):
+        entry = self._entries.get(name)
+        if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+            return entry
+        async with self._load_locks[name]:
+            entry = self._entries.get(name)
+            if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+                return entry
+            version = self._versions.get(name, 0)
+            entry = CacheEntry(await self._loaders[name](), time.monotonic(), self._serializers[name])
+            with self._lock:
+                if self._versions.get(name, 0) == version:
+                    self._entries[name] = entry
+            return entry
+
+    async def listen(self, conn):
+        """Подписаться на изменения справочников через отдельное соединение asyncpg."""
+        await conn.add_listener(NOTIFY_CHANNEL, lambda _conn, _pid, _channel, table: self.invalidate_table(table))
+        conn.add_termination_listener(self._listener_lost)
+        self._listen_conn = conn
+        self.invalidate()
+
+    def _listener_lost(self, conn):
+        # Дальше записи сбрасываются только по TTL
+        logger.error("Подписка на изменения справочников потеряна")
+        self.invalidate()
+
+    async def stop(self):
+        self._stop.set()
+        if self._listen_conn is not None:
+            self._listen_conn.remove_termination_listener(self._listener_lost)
+            await self._listen_conn.close()
+            self._listen_conn = None
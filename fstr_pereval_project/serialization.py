@@ -0,0 +1,66 @@
+import os
+import json
+import uuid
+import decimal
+from datetime import date
+
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # orjson не установлен — работает стандартный json
+    orjson = None
+
+# json или orjson; по умолчанию orjson, если он установлен
+JSON_CODEC = os.getenv("FSTR_JSON_CODEC", "orjson" if orjson else "json")
+if JSON_CODEC == "orjson" and orjson is None:
+    JSON_CODEC = "json"
+
+
+# ----------------- JSON-ответы API -----------------
+def json_default(value):
+    """Типы из строк БД. Даты — в формате HTTP, как их всегда отдавал jsonify Flask."""
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+if JSON_CODEC == "orjson":
+    # Даты передаются в json_default, чтобы формат не зависел от выбранного кодека
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(data):
+        """Тело JSON-ответа в байтах; одинаково для WSGI- и ASGI-приложения."""
+        return orjson.dumps(data, default=json_default, option=_ORJSON_OPTIONS)
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    def dumps(data):
+        """Тело JSON-ответа в байтах; одинаково для WSGI- и ASGI-приложения."""
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=json_default).encode("utf-8")
+
+    def loads(data):
+        return json.loads(data)
+
+
+def dumps_text(data):
+    """JSON строкой — для параметров запросов к БД."""
+    return dumps(data).decode("utf-8")
+
+
+# ----------------- Готовый JSON из БД -----------------
+def json_array(items):
+    """
+    Склеить JSON-массив из уже сериализованных элементов (текст json из БД)
+    без разбора и повторной сериализации.
+    """
+    parts = [b"["]
+    for n, item in enumerate(items):
+        if n:
+            parts.append(b",")
+        parts.append(item.encode("utf-8") if isinstance(item, str) else item)
+    parts.append(b"]")
+    return b"".join(parts)
@@ -0,0 +1,37 @@
+from area_tree import AreaTree
+
+ROWS = [
+    {"id": 0, "id_parent": 0, "title": "Планета Земля"},
+    {"id": 65, "id_parent": 0, "title": "Алтай"},
+    {"id": 66, "id_parent": 65, "title": "Северо-Чуйский хребет"},
+    {"id": 88, "id_parent": 65, "title": "Южно-Чуйский хребет"},
+    {"id": 375, "id_parent": 0, "title": "Тавр"},
+    {"id": 367, "id_parent": 375, "title": "Аладаглар"},
+]
+
+
+# ----------------- Тесты AreaTree -----------------
+def test_descendants_and_membership():
+    tree = AreaTree(ROWS)
+    assert tree.descendants(65) == [65, 66, 88]
+    assert tree.descendants(65, include_self=False) == [66, 88]
+    assert tree.is_descendant(367, 0)
+    assert not tree.is_descendant(367, 65)
+
+
+def test_path_from_root():
+    tree = AreaTree(ROWS)
+    assert [a['id'] for a in tree.path(367)] == [0, 375, 367]
+
+
+def test_nested_tree():
+    tree = AreaTree(ROWS)
+    (root,) = tree.nested()
+    assert root['id'] == 0
+    assert [c['id'] for c in root['children']] == [65, 375]
+    assert [c['id'] for c in tree.nested(65)[0]['children']] == [66, 88]
+
+
+def test_cycle_does_not_hang():
+    tree = AreaTree([{"id": 1, "id_parent": 2, "title": "a"}, {"id": 2, "id_parent": 1, "title": "b"}])
+    assert 1 not in tree
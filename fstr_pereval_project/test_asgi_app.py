@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip("starlette")
+pytest.importorskip("asyncpg")
+
+from starlette.testclient import TestClient
+
+import asgi_app
+from app import app as flask_app
+from database_handler import DatabaseHandler
+
+db_handler = DatabaseHandler()
+
+
+# ----------------- Настройка тестового клиента -----------------
+@pytest.fixture
+def client():
+    with TestClient(asgi_app.app) as client:
+        yield client
+
+
+@pytest.fixture
+def new_pereval():
+    raw_data = {"title": "ASGI", "user": {"email": "asgi@example.com"}}
+    pereval_id = db_handler.add_pereval(raw_data, [{"url": "asgi.jpg"}])
+    yield pereval_id
+    db_handler.delete_pereval(pereval_id)
+
+
+# ----------------- Тесты ASGI-приложения -----------------
+def test_submit_and_get(client):
+    response = client.post('/submitData', json={"raw_data": {"title": "Через ASGI"}, "images": []})
+    assert response.status_code == 201
+    pereval_id = response.json()['pereval_id']
+    try:
+        pereval = client.get(f'/submitData/{pereval_id}').json()
+        assert pereval['raw_data'] == {"title": "Через ASGI"}
+        assert pereval['status'] == 'new'
+    finally:
+        db_handler.delete_pereval(pereval_id)
+
+
+def test_submit_validation_shared_with_flask(client):
+    response = client.post('/submitData', json={"raw_data": "не объект"})
+    assert response.status_code == 400
+    assert response.json()['error'] == "raw_data должен быть объектом"
+
+
+def test_same_json_as_flask(client, new_pereval):
+    asgi_data = client.get(f'/submitData/{new_pereval}').json()
+    flask_data = flask_app.test_client().get(f'/submitData/{new_pereval}').get_json()
+    # В том числе даты в одном формате
+    assert asgi_data == flask_data
+    assert client.get('/userPerevals?user__email=asgi@example.com').json()[0]['id'] == new_pereval
+
+
+def test_reference_etag_and_304(client):
+    response = client.get('/activities')
+    assert response.status_code == 200
+    etag = response.headers['etag']
+    assert client.get('/activities', headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_legacy_image(client):
+    image_id = db_handler.add_image(b"\x89PNG\r\n\x1a\n" + b"0" * 32)
+    response = client.get(f'/images/{image_id}')
+    assert response.status_code == 200
+    assert response.headers['content-type'] == "image/png"
+    assert response.headers['x-content-type-options'] == "nosniff"
+    assert client.get(f'/images/{image_id}', headers={"If-None-Match": response.headers['etag']}).status_code == 304
+    assert client.get('/images/999999999').status_code == 404
+
+
+def test_stored_non_image_not_served_as_html(client):
+    image_id = db_handler.add_image(b"<html><script>alert(1)</script></html>")
+    response = client.get(f'/images/{image_id}')
+    assert response.headers['content-type'] == "application/octet-stream"
+    assert response.headers['content-disposition'] == "attachment"
+    assert response.headers['x-content-type-options'] == "nosniff"
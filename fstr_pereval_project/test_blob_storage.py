@@ -0,0 +1,63 @@
+import hashlib
+from io import BytesIO
+import pytest
+from blob_storage import (BlobTooLargeError, LocalBlobStorage, UnsupportedImageError, image_response_headers,
+                          sniff_mimetype)
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalBlobStorage(str(tmp_path))
+
+
+# ----------------- Тесты LocalBlobStorage -----------------
+def test_put_is_content_addressed(storage):
+    blob = storage.put(BytesIO(PNG_BYTES), chunk_size=7)
+    assert blob.key == hashlib.sha256(PNG_BYTES).hexdigest()
+    assert blob.size == len(PNG_BYTES)
+    assert blob.mimetype == "image/png"
+    with storage.open(blob.key) as f:
+        assert f.read() == PNG_BYTES
+
+
+def test_identical_uploads_deduplicated(storage, tmp_path):
+    first = storage.put(BytesIO(PNG_BYTES))
+    second = storage.put(BytesIO(PNG_BYTES))
+    assert first.key == second.key
+    assert not list((tmp_path / "tmp").iterdir())
+
+
+def test_invalid_key_rejected(storage):
+    with pytest.raises(ValueError):
+        storage.local_path("../../etc/passwd")
+
+
+def test_sniff_mimetype():
+    assert sniff_mimetype(b"\xff\xd8\xff\xe0") == "image/jpeg"
+    assert sniff_mimetype(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert sniff_mimetype(b"plain text") == "application/octet-stream"
+
+
+def test_writer_enforces_max_size_while_streaming(storage, tmp_path):
+    writer = storage.open_writer(max_size=10)
+    writer.write(b"12345")
+    with pytest.raises(BlobTooLargeError):
+        writer.write(b"678901")
+    assert not list((tmp_path / "tmp").iterdir())
+
+
+def test_non_image_rejected_unless_allowed(storage, tmp_path):
+    with pytest.raises(UnsupportedImageError):
+        storage.put(BytesIO(b"<html></html>"))
+    assert not list((tmp_path / "tmp").iterdir())
+    assert storage.put(BytesIO(b"<html></html>"), require_image=False).mimetype == "application/octet-stream"
+
+
+def test_image_response_headers():
+    assert image_response_headers("image/png") == ("image/png", {"X-Content-Type-Options": "nosniff",
+                                                                 "Content-Disposition": "inline"})
+    mimetype, headers = image_response_headers("text/html")
+    assert mimetype == "application/octet-stream"
+    assert headers["Content-Disposition"] == "attachment"
@@ -0,0 +1,51 @@
+import gzip
+
+import pytest
+from werkzeug.http import parse_accept_header
+from werkzeug.wrappers import Response
+
+import compression
+
+
+def test_negotiate_prefers_brotli_unless_lower_quality():
+    if compression.brotli is None:
+        pytest.skip("Brotli не установлен")
+    assert compression.negotiate(parse_accept_header("gzip, br")) == "br"
+    assert compression.negotiate(parse_accept_header("gzip;q=1, br;q=0.5")) == "gzip"
+    assert compression.negotiate(parse_accept_header("identity")) is None
+    assert compression.negotiate(None) is None
+
+
+def test_encoded_etag_roundtrip():
+    assert compression.encoded_etag("12-345", "gzip") == "12-345-gzip"
+    assert compression.encoded_etag("12-345", None) == "12-345"
+    assert compression.base_etag("12-345-gzip") == "12-345"
+    assert compression.base_etag("12-345") == "12-345"
+
+
+def test_small_and_binary_responses_untouched():
+    small = Response(b"{}", mimetype="application/json")
+    assert compression.compress_response(small, "gzip") is False
+    image = Response(b"\xff\xd8" * 4096, mimetype="image/jpeg")
+    assert compression.compress_response(image, "gzip") is False
+    assert "Content-Encoding" not in image.headers
+    assert compression.will_compress(small, "gzip") is False
+
+
+def test_json_compressed():
+    body = b'{"title":"' + "Перевал ".encode() * 500 + b'"}'
+    response = Response(body, mimetype="application/json")
+    assert compression.compress_response(response, "gzip") is True
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert int(response.headers["Content-Length"]) < len(body)
+    assert gzip.decompress(response.get_data()) == body
+
+
+def test_stream_compressed_incrementally():
+    chunks = [f"<tr><td>{n}</td></tr>" for n in range(200)]
+    response = Response(iter(chunks), mimetype="text/html")
+    assert compression.compress_response(response, "gzip") is True
+    parts = list(response.response)
+    # Каждая часть выдаётся сразу (Z_SYNC_FLUSH), а не одним куском в конце
+    assert len(parts) == len(chunks) + 1
+    assert gzip.decompress(b"".join(parts)).decode() == "".join(chunks)
@@ -0,0 +1,110 @@
+import os
+import pytest
+from psycopg2 import extensions
+from db_pool import ConnectionPool, PoolTimeoutError
+
+
+# ----------------- Заглушка соединения -----------------
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def pool():
+    return ConnectionPool(FakeConnection, min_size=0, max_size=2, timeout=0.05)
+
+
+# ----------------- Тесты ConnectionPool -----------------
+def test_connection_is_reused(pool):
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert pool.stats()["connections_created"] == 1
+    assert pool.stats()["checkouts"] == 2
+
+
+def test_pool_is_bounded(pool):
+    pool.getconn()
+    pool.getconn()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats["timeouts"] == 1
+    assert stats["in_use"] == 2
+
+
+def test_open_transaction_is_rolled_back(pool):
+    conn = pool.getconn()
+    conn.status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.stats()["idle"] == 1
+
+
+def test_closed_connection_is_recycled(pool):
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.closed = 1
+    assert pool.getconn() is not conn
+    assert pool.stats()["connections_recycled"] == 1
+
+
+def test_pool_resets_after_fork(pool, monkeypatch):
+    conn = pool.getconn()
+    pool.putconn(conn)
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+    assert pool.getconn() is not conn
+    assert not conn.closed
+
+
+def test_prefill_opens_min_size(pool):
+    pool.min_size = 2
+    pool.prefill()
+    stats = pool.stats()
+    assert stats["idle"] == 2
+    assert stats["connections_created"] == 2
+
+
+class ProbedConnection(FakeConnection):
+    """Соединение, проверка которого (SELECT 1) видит, свободна ли блокировка пула."""
+    pool = None
+    probed_unlocked = None
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                conn.probed_unlocked = conn.pool._cond.acquire(blocking=False)
+                if conn.probed_unlocked:
+                    conn.pool._cond.release()
+
+        return Cursor()
+
+
+def test_idle_check_runs_outside_lock():
+    pool = ConnectionPool(ProbedConnection, min_size=0, max_size=1, max_idle=1e-9)
+    conn = pool.getconn()
+    conn.pool = pool
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert conn.probed_unlocked is True
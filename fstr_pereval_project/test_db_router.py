@@ -0,0 +1,169 @@
+import os
+import time
+import threading
+import psycopg2
+import pytest
+from db_router import ReplicaRouter, format_lsn, is_connection_error, parse_lsn
+
+
+# ----------------- Заглушки пула и соединения -----------------
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.pool.queries += 1
+
+    def fetchone(self):
+        return dict(self.pool.row)
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self):
+        return FakeCursor(self.pool)
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    """Пул одного сервера: row — ответ на проверку состояния, down — сервер не отвечает."""
+
+    def __init__(self, row):
+        self.row = row
+        self.down = False
+        self.queries = 0
+        self.ready = threading.Event()
+        self.ready.set()
+
+    def getconn(self):
+        self.ready.wait()
+        if self.down:
+            raise psycopg2.OperationalError("connection refused")
+        return FakeConnection(self)
+
+    def putconn(self, conn, discard=False):
+        pass
+
+    def prefill(self):
+        pass
+
+    def stats(self):
+        return {}
+
+    def closeall(self):
+        pass
+
+
+def replica_row(lsn="0/100", lag=0.0):
+    return {"standby": True, "replay_lsn": lsn, "lag_seconds": lag}
+
+
+@pytest.fixture
+def router():
+    primary = FakePool({"lsn": "0/200"})
+    router = ReplicaRouter(primary, [("replica1", FakePool(replica_row())), ("replica2", FakePool(replica_row()))],
+                           max_lag=5, check_interval=3600, retry_after=60)
+    # Проверка вызывается явно, фоновый поток в тестах не нужен
+    router._checker_pid = os.getpid()
+    router.check()
+    yield router
+    router.close()
+
+
+def names(router, n, read_only=True):
+    return [router.choose(read_only).name for _ in range(n)]
+
+
+# ----------------- Тесты ReplicaRouter -----------------
+def test_lsn_round_trip():
+    assert parse_lsn("16/B374D848") == 0x16B374D848
+    assert format_lsn(parse_lsn("16/B374D848")) == "16/B374D848"
+    with pytest.raises(ValueError):
+        parse_lsn("garbage")
+
+
+def test_reads_round_robin_writes_go_to_primary(router):
+    assert names(router, 4) == ["replica1", "replica2", "replica1", "replica2"]
+    assert names(router, 2, read_only=False) == ["primary", "primary"]
+
+
+def test_lag_is_reported(router):
+    replica = router.replicas[0]
+    assert replica.lag_bytes == 0x100
+    assert router.stats()["primary_lsn"] == "0/200"
+    assert router.stats()["targets"][1]["replay_lsn"] == "0/100"
+
+
+def test_lagging_replica_is_skipped(router):
+    router.replicas[0].pool.row = replica_row(lag=30.0)
+    router.check()
+    assert names(router, 3) == ["replica2"] * 3
+    router.replicas[1].pool.row = replica_row(lag=30.0)
+    router.check()
+    assert names(router, 2) == ["primary"] * 2
+
+
+def test_failed_replica_is_excluded(router):
+    replica = router.replicas[0]
+    router.mark_failed(replica, psycopg2.OperationalError("server closed the connection"))
+    assert names(router, 3) == ["replica2"] * 3
+    assert replica.stats()["available"] is False
+    assert replica.failures == 1
+
+
+def test_unreachable_replica_fails_on_check(router):
+    router.replicas[1].pool.down = True
+    router.check()
+    assert router.replicas[1].failures == 1
+    assert names(router, 3) == ["replica1"] * 3
+
+
+def test_read_after_waits_for_replay(router):
+    router.replicas[1].pool.row = replica_row(lsn="0/300")
+    router.check()
+    with router.request_scope(read_after=parse_lsn("0/200")):
+        assert router.choose(True).name == "replica2"
+    with router.request_scope(read_after=parse_lsn("0/400")):
+        assert router.choose(True).name == "primary"
+
+
+def test_request_is_pinned_to_one_target(router):
+    with router.request_scope():
+        assert names(router, 3) == ["replica1"] * 3
+        router.mark_failed(router.replicas[0], psycopg2.OperationalError("terminating connection"))
+        assert names(router, 2) == ["replica2"] * 2
+    # Вне запроса закрепления нет, а упавшая реплика исключена до retry_after
+    assert names(router, 2) == ["replica2"] * 2
+
+
+def test_first_check_does_not_block_requests():
+    slow = FakePool(replica_row())
+    slow.ready.clear()
+    router = ReplicaRouter(FakePool({"lsn": "0/200"}), [("replica1", slow)], max_lag=5, check_interval=3600)
+    try:
+        # Реплика ещё не ответила на проверку — чтение сразу идёт на основной сервер
+        assert router.choose(True).name == "primary"
+        slow.ready.set()
+        for _ in range(100):
+            if router.replicas[0].checked_at is not None:
+                break
+            time.sleep(0.01)
+        assert router.choose(True).name == "replica1"
+    finally:
+        router.close()
+
+
+def test_connection_errors_classified():
+    assert is_connection_error(psycopg2.OperationalError("server closed the connection unexpectedly"))
+    assert is_connection_error(psycopg2.InterfaceError("connection already closed"))
+    assert not is_connection_error(ValueError("не ошибка БД"))
@@ -1,6 +1,19 @@
+import os
 import pytest
 import json
+import time
+import gzip
+import app as app_module
+import database_handler
+import psycopg2
+from io import BytesIO
+from datetime import datetime
 from app import app, db_handler
+from blob_storage import LargeObjectBlobStorage, LocalBlobStorage
+import image_derivatives
+from image_derivatives import DerivativeStore
+from migrate_images import main as migrate_images_main, migrate_images
+from ingest_queue import IngestQueue
 
 # ----------------- Настройка тестового клиента -----------------
 @pytest.fixture
@@ -80,9 +93,811 @@ def test_patch_pereval_api(client, new_pereval):
     updated = db_handler.get_pereval_by_id(new_pereval)
     assert updated['raw_data']['title'] == "API PATCH Test"
 
+def test_patch_merges_raw_data(client, new_pereval):
+    response = client.patch(f'/submitData/{new_pereval}', content_type="application/merge-patch+json",
+                            data=json.dumps({"raw_data": {"title": "Слияние", "beautyTitle": None,
+                                                          "coords": {"height": "1200"}},
+                                             "images": [{"url": "new.jpg"}]}))
+    assert response.status_code == 200
+    updated = db_handler.get_pereval_by_id(new_pereval)
+    assert updated['raw_data']['title'] == "Слияние"
+    assert "beautyTitle" not in updated['raw_data']
+    assert updated['raw_data']['coords'] == {"latitude": "45.0", "longitude": "7.0", "height": "1200"}
+    assert updated['raw_data']['user']['email'] == "testuser@example.com"
+    assert updated['images'] == [{"url": "new.jpg"}]
+
+def test_patch_protected_fields_checked_in_sql(client, new_pereval):
+    same = client.patch(f'/submitData/{new_pereval}',
+                        json={"raw_data": {"user": {"email": "testuser@example.com"}, "title": "Тот же email"}})
+    assert same.status_code == 200
+    for patch in ({"user": {"email": "other@example.com"}}, {"user": {"phone": None}}, {"fio": "Новое ФИО"}):
+        response = client.patch(f'/submitData/{new_pereval}', json={"raw_data": patch})
+        assert response.status_code == 400
+        assert "редактировать нельзя" in response.get_json()['message']
+    assert db_handler.get_pereval_by_id(new_pereval)['raw_data']['user']['phone'] == "+79000000000"
+    assert client.patch(f'/submitData/{new_pereval}', json={"status": "accepted"}).status_code == 400
+
+def test_patch_checks_fields_like_post(client, new_pereval):
+    before = db_handler.get_pereval_by_id(new_pereval)
+    for patch in ({"images": ["x.jpg"]}, {"images": "x.jpg"}, {"raw_data": []}, {"raw_data": ""}, {"raw_data": None}):
+        response = client.patch(f'/submitData/{new_pereval}', json=patch)
+        assert response.status_code == 400, patch
+    assert db_handler.get_pereval_by_id(new_pereval) == before
+
+def test_patch_if_match(client, new_pereval):
+    etag = client.get(f'/submitData/{new_pereval}').headers['ETag']
+    first = client.patch(f'/submitData/{new_pereval}', json={"raw_data": {"title": "Первый"}},
+                         headers={"If-Match": etag})
+    assert first.status_code == 200
+    assert first.headers['ETag'] != etag
+    stale = client.patch(f'/submitData/{new_pereval}', json={"raw_data": {"title": "Второй"}},
+                         headers={"If-Match": etag})
+    assert stale.status_code == 412
+    assert client.patch(f'/submitData/{new_pereval}', json={"raw_data": {"title": "Чужой"}},
+                        headers={"If-Match": '"1-1"'}).status_code == 412
+    assert client.get(f'/submitData/{new_pereval}').get_json()['raw_data']['title'] == "Первый"
+    assert client.get(f'/submitData/{new_pereval}').headers['ETag'] == first.headers['ETag']
+    assert client.patch(f'/submitData/{new_pereval}', json={"raw_data": {"title": "Любая версия"}},
+                        headers={"If-Match": "*"}).status_code == 200
+
+def test_patch_rejected_when_not_new_or_missing(client, new_pereval):
+    with db_handler.connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE pereval_added SET status = 'accepted' WHERE id = %s", (new_pereval,))
+        conn.commit()
+    response = client.patch(f'/submitData/{new_pereval}', json={"raw_data": {"title": "Поздно"}})
+    assert response.status_code == 400
+    assert "статус не 'new'" in response.get_json()['message']
+    assert client.patch('/submitData/999999999', json={"raw_data": {"title": "Нет"}}).status_code == 404
+
 def test_get_perevals_by_email_api(client, new_pereval):
     test_email = "testuser@example.com"
     response = client.get(f'/userPerevals?user__email={test_email}')
     assert response.status_code == 200
     data = response.get_json()
     assert any(p['id'] == new_pereval for p in data)
+
+# ----------------- Тесты постраничной выборки -----------------
+def test_perevals_page_cursor(new_pereval):
+    second_id = db_handler.add_pereval({"title": "Вторая страница"}, [])
+    try:
+        first_page, next_cursor = db_handler.get_perevals_page(limit=1)
+        assert first_page[0]['id'] == second_id
+        assert next_cursor
+        second_page, _ = db_handler.get_perevals_page(limit=1, after=next_cursor)
+        assert second_page[0]['id'] == new_pereval
+    finally:
+        db_handler.delete_pereval(second_id)
+
+def test_perevals_json_api(client, new_pereval):
+    response = client.get('/perevals.json?limit=1')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['items'][0]['id'] == new_pereval
+    assert client.get('/perevals.json?after=bad').status_code == 400
+
+def test_perevals_html_streamed(client, new_pereval):
+    response = client.get('/perevals?limit=1')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert f"<td>{new_pereval}</td>" in response.get_data(as_text=True)
+
+# ----------------- Тесты выгрузки -----------------
+def test_export_ndjson(client, new_pereval):
+    response = client.get('/export?status=new')
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    exported = next(p for p in lines if p['id'] == new_pereval)
+    # Даты в выгрузке — ISO 8601, а не формат HTTP, как в ответах API
+    assert datetime.fromisoformat(exported['date_added'])
+
+def test_export_csv_flattened(client, new_pereval):
+    response = client.get('/export?format=csv&date_from=2000-01-01')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert text.splitlines()[0].startswith("id,status,date_added")
+    assert "testuser@example.com" in text
+    assert client.get('/export?status=unknown').status_code == 400
+
+# ----------------- Тесты хранилища изображений -----------------
+JPEG_BYTES = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 4
+
+@pytest.fixture
+def blob_storage(tmp_path, monkeypatch):
+    storage = LocalBlobStorage(str(tmp_path))
+    monkeypatch.setattr(app_module, "blob_storage", storage)
+    return storage
+
+def test_upload_and_get_image(client, blob_storage):
+    response = client.post('/uploadImage', data={"image": (BytesIO(JPEG_BYTES), "photo.jpg")})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['mimetype'] == "image/jpeg"
+    assert blob_storage.exists(data['sha256'])
+
+    response = client.get(f"/images/{data['image_id']}")
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    assert response.headers['X-Content-Type-Options'] == "nosniff"
+    assert response.headers['Content-Disposition'] == "inline"
+    assert response.get_data() == JPEG_BYTES
+    etag = response.headers['ETag']
+    assert etag == f'"{data["sha256"]}"'
+
+    assert client.get(f"/images/{data['image_id']}", headers={"If-None-Match": etag}).status_code == 304
+    partial = client.get(f"/images/{data['image_id']}", headers={"Range": "bytes=0-3"})
+    assert partial.status_code == 206
+    assert partial.get_data() == JPEG_BYTES[:4]
+
+def test_migrate_legacy_images(blob_storage):
+    image_id = db_handler.add_image(JPEG_BYTES)
+    assert migrate_images(db_handler, blob_storage) >= 1
+    meta = db_handler.get_image_meta(image_id)
+    assert meta['mimetype'] == "image/jpeg"
+    assert meta['has_bytea'] is False
+    assert blob_storage.exists(meta['sha256'])
+
+def test_migrate_cli_to_large_objects(monkeypatch):
+    image_id = db_handler.add_image(JPEG_BYTES + b"lo")
+    monkeypatch.setenv("FSTR_BLOB_BACKEND", "pg_large_object")
+    assert migrate_images_main([]) == 0
+    meta = db_handler.get_image_meta(image_id)
+    assert meta['has_bytea'] is False
+    with LargeObjectBlobStorage(db_handler.pool).open(meta['sha256']) as f:
+        assert f.read() == JPEG_BYTES + b"lo"
+
+# ----------------- Тесты потоковой загрузки -----------------
+def test_upload_too_large_rejected(client, blob_storage, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, "MAX_IMAGE_SIZE", 100)
+    response = client.post('/uploadImage', data={"image": (BytesIO(JPEG_BYTES), "photo.jpg")})
+    assert response.status_code == 413
+    assert not list((tmp_path / "tmp").iterdir())
+
+def test_upload_raw_body(client, blob_storage):
+    response = client.post('/uploadImage', data=JPEG_BYTES, content_type="image/jpeg")
+    assert response.status_code == 200
+    assert response.get_json()['size'] == len(JPEG_BYTES)
+
+def test_upload_non_image_rejected(client, blob_storage, tmp_path):
+    html = b"<html><script>alert(1)</script></html>"
+    response = client.post('/uploadImage', data={"image": (BytesIO(html), "x.html", "text/html")})
+    assert response.status_code == 415
+    assert client.post('/uploadImage', data=b"<svg onload=alert(1)/>", content_type="image/svg+xml").status_code == 415
+    assert not [f for f in tmp_path.rglob("*") if f.is_file()]
+
+def test_upload_multiple_pereval_images(client, blob_storage, new_pereval):
+    files = [(BytesIO(JPEG_BYTES), "a.jpg"), (BytesIO(JPEG_BYTES + b"2"), "b.jpg")]
+    response = client.post(f'/submitData/{new_pereval}/images', data={"images": files, "titles": ["Седловина", "Подъём"]})
+    assert response.status_code == 201
+    items = response.get_json()['images']
+    assert [i['title'] for i in items] == ["Седловина", "Подъём"]
+    pereval = db_handler.get_pereval_by_id(new_pereval)
+    assert pereval['images'][-1]['id'] == items[-1]['id']
+    missing = client.post('/submitData/999999/images', data={"images": [(BytesIO(JPEG_BYTES), "a.jpg")]})
+    assert missing.status_code == 404
+
+# ----------------- Тесты миниатюр -----------------
+@pytest.fixture
+def derivatives(tmp_path, blob_storage, monkeypatch):
+    store = DerivativeStore(str(tmp_path / "derivatives"), blob_storage, workers=1)
+    monkeypatch.setattr(app_module, "derivatives", store)
+    yield store
+    store.shutdown()
+
+def make_jpeg(width=1200, height=900):
+    from PIL import Image
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), (120, 80, 40)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+def test_thumbnail_negotiated_and_cached(client, derivatives):
+    pytest.importorskip("PIL")
+    image_id = client.post('/uploadImage', data=make_jpeg(), content_type="image/jpeg").get_json()['image_id']
+
+    webp = client.get(f'/images/{image_id}?size=thumb', headers={"Accept": "image/webp,*/*"})
+    assert webp.status_code == 200
+    assert webp.mimetype == "image/webp"
+    assert "Accept" in webp.headers['Vary']
+    assert "max-age=31536000" in webp.headers['Cache-Control']
+
+    from PIL import Image
+    jpeg = client.get(f'/images/{image_id}?size=thumb')
+    assert jpeg.mimetype == "image/jpeg"
+    assert max(Image.open(BytesIO(jpeg.get_data())).size) == 160
+    assert client.get(f'/images/{image_id}?size=huge').status_code == 400
+
+def test_broken_pool_is_recreated(client, derivatives):
+    pytest.importorskip("PIL")
+    image_id = client.post('/uploadImage', data=make_jpeg(), content_type="image/jpeg").get_json()['image_id']
+    key = db_handler.get_image_meta(image_id)['sha256']
+    # Воркер пула убит, как при нехватке памяти
+    executor = derivatives._get_executor()
+    executor.submit(os.getpid).result()
+    for process in list(executor._processes.values()):
+        process.kill()
+    with pytest.raises(Exception):
+        executor.submit(os.getpid).result(timeout=10)
+    dest = derivatives.path(key, "medium", "jpeg")
+    if os.path.exists(dest):
+        os.unlink(dest)
+    assert derivatives.get_or_create(key, "medium", "jpeg") == dest
+    assert os.path.exists(dest)
+    assert derivatives._executor is not executor
+
+@pytest.mark.filterwarnings("ignore:Image size")
+def test_oversized_image_not_decoded(client, derivatives, monkeypatch):
+    pytest.importorskip("PIL")
+    monkeypatch.setattr(image_derivatives, "MAX_IMAGE_PIXELS", 1000)
+    src = derivatives.root + ".jpg"
+    with open(src, "wb") as f:
+        f.write(make_jpeg(40, 40))
+    with pytest.raises(ValueError):
+        image_derivatives.render_derivative(src, src + ".out", 160, "jpeg")
+
+# ----------------- Тесты кэша справочников -----------------
+def test_activities_etag_and_304(client):
+    response = client.get('/activities')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert any(a['title'] == "пешком" for a in response.get_json())
+    assert client.get('/activities', headers={"If-None-Match": etag}).status_code == 304
+
+def test_reference_cache_invalidated_by_notify(client):
+    import time
+    etag = client.get('/areas').headers['ETag']
+    time.sleep(0.5)  # слушатель успевает выполнить LISTEN
+    with db_handler.connection() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO pereval_areas (id, id_parent, title) VALUES (9999, 0, 'Тестовая область')")
+        conn.commit()
+    try:
+        for _ in range(50):
+            if client.get('/areas').headers['ETag'] != etag:
+                break
+            time.sleep(0.1)
+        assert any(a['id'] == 9999 for a in client.get('/areas').get_json())
+    finally:
+        with db_handler.connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM pereval_areas WHERE id = 9999")
+            conn.commit()
+
+# ----------------- Тесты иерархии областей -----------------
+def test_area_tree_and_path(client):
+    tree = client.get('/areas/tree').get_json()
+    altai = next(c for c in tree[0]['children'] if c['id'] == 65)
+    assert any(c['id'] == 66 for c in altai['children'])
+    path = client.get('/areas/367/path').get_json()
+    assert [a['id'] for a in path] == [0, 375, 367]
+    assert client.get('/areas/123456/path').status_code == 404
+
+def test_perevals_by_area_subtree(client):
+    pereval_id = db_handler.add_pereval({"title": "Алтайский", "area_id": 66}, [])
+    try:
+        items = client.get('/areas/65/perevals').get_json()['items']
+        assert [p['id'] for p in items] == [pereval_id]
+        assert client.get('/areas/375/perevals').get_json()['items'] == []
+    finally:
+        db_handler.delete_pereval(pereval_id)
+
+# ----------------- Тесты пакетной загрузки -----------------
+def test_batch_submit_returns_ids_in_order(client):
+    payload = [{"raw_data": {"title": f"Пакет {n}"}, "images": []} for n in range(3)]
+    response = client.post('/submitData/batch', json=payload)
+    assert response.status_code == 201
+    ids = response.get_json()['pereval_ids']
+    try:
+        assert [db_handler.get_pereval_by_id(i)['raw_data']['title'] for i in ids] == ["Пакет 0", "Пакет 1", "Пакет 2"]
+    finally:
+        for pereval_id in ids:
+            db_handler.delete_pereval(pereval_id)
+
+def test_batch_submit_all_or_nothing(client):
+    payload = [{"raw_data": {"title": "OK"}}, {"raw_data": "не объект"}]
+    response = client.post('/submitData/batch', json=payload)
+    assert response.status_code == 400
+    assert response.get_json()['errors'][0]['index'] == 1
+
+def test_batch_submit_partial_ndjson(client):
+    body = '{"raw_data": {"title": "NDJSON"}}\nне json\n{"images": []}\n'
+    response = client.post('/submitData/batch?partial=true', data=body, content_type="application/x-ndjson")
+    assert response.status_code == 207
+    data = response.get_json()
+    assert data['pereval_ids'][1:] == [None, None]
+    assert [e['index'] for e in data['errors']] == [1, 2]
+    db_handler.delete_pereval(data['pereval_ids'][0])
+
+# ----------------- Тесты асинхронного приёма -----------------
+@pytest.fixture
+def ingest_queue(tmp_path, monkeypatch):
+    queue = IngestQueue(str(tmp_path / "queue.sqlite3"), db_handler)
+    # Фоновый поток не запускаем: перенос вызывается в тесте явно
+    queue._flusher_pid = os.getpid()
+    monkeypatch.setattr(app_module, "ingest_queue", queue)
+    return queue
+
+def test_async_submit_queued_then_flushed(client, ingest_queue):
+    response = client.post('/submitData', json={"raw_data": {"title": "Очередь"}},
+                           headers={"Prefer": "respond-async"})
+    assert response.status_code == 202
+    status_url = response.headers['Location']
+    assert client.get(status_url).get_json()['status'] == 'queued'
+    assert client.get('/submitData/queue').get_json()['queued'] == 1
+
+    assert ingest_queue.flush_once() == 1
+    status = client.get(status_url).get_json()
+    try:
+        assert status['status'] == 'done'
+        assert db_handler.get_pereval_by_id(status['pereval_id'])['raw_data']['title'] == "Очередь"
+        # Повторный перенос той же заявки не создаёт дубликат
+        tracking_id = status['tracking_id']
+        assert db_handler.add_perevals_ingested([(tracking_id, {"title": "Очередь"}, [])]) == {tracking_id: status['pereval_id']}
+    finally:
+        db_handler.delete_pereval(status['pereval_id'])
+
+def test_async_submit_validates_before_queueing(client, ingest_queue):
+    response = client.post('/submitData', json={"images": []}, headers={"Prefer": "respond-async"})
+    assert response.status_code == 400
+    assert ingest_queue.stats()['queued'] == 0
+
+# ----------------- Тесты метрик -----------------
+def test_metrics_endpoint(client, new_pereval):
+    client.get(f'/submitData/{new_pereval}')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'fstr_http_request_duration_seconds_count{method="GET",route="/submitData/<int:pereval_id>",status="200"}' in body
+    assert 'fstr_db_query_duration_seconds_count{method="get_pereval_by_id"}' in body
+    assert 'fstr_db_rows_total{method="get_pereval_by_id"}' in body
+    assert 'fstr_db_pool_acquire_seconds_count' in body
+
+def test_slow_query_logged(monkeypatch, caplog, new_pereval):
+    monkeypatch.setattr(app_module.metrics, "SLOW_QUERY_SECONDS", 1e-9)
+    with caplog.at_level("WARNING", logger="fstr.slow_query"):
+        db_handler.get_pereval_by_id(new_pereval)
+    assert any("Медленный запрос в get_pereval_by_id" in r.getMessage() and "FROM pereval_added" in r.getMessage()
+               for r in caplog.records)
+
+# ----------------- Тесты передачи JSON из БД -----------------
+@pytest.mark.parametrize("url", ['/perevals.json?limit=5', '/userPerevals?user__email=testuser@example.com'])
+def test_json_passthrough_matches_decoded(client, new_pereval, monkeypatch, url):
+    db_handler.update_pereval(new_pereval, {"raw_data": {"title": "Изменён", "user": {"email": "testuser@example.com"}}})
+    passthrough = client.get(url).get_json()
+    monkeypatch.setattr(app_module, "JSON_PASSTHROUGH", False)
+    decoded = client.get(url).get_json()
+    # В том числе формат date_added/date_updated, собранный в SQL
+    assert passthrough == decoded
+    assert any(p['id'] == new_pereval and p['date_updated'] for p in (decoded['items'] if 'items' in decoded else decoded))
+
+# ----------------- Тесты поиска по координатам -----------------
+@pytest.fixture
+def geo_perevals():
+    # Точки у линии перемены дат, вдали от остальных тестовых данных
+    coords = [(-60.0, 179.9), (-60.0, -179.9), (-60.5, 179.0)]
+    ids = [db_handler.add_pereval({"title": f"Гео {n}", "user": {"email": "geo@example.com"},
+                                   "coords": {"latitude": str(lat), "longitude": str(lon), "height": "0"}}, [])
+           for n, (lat, lon) in enumerate(coords)]
+    yield ids
+    for pereval_id in ids:
+        db_handler.delete_pereval(pereval_id)
+
+def test_bbox_across_antimeridian(client, geo_perevals):
+    response = client.get('/perevals/bbox?bbox=179.5,-60.2,-179.5,-59.8')
+    assert response.status_code == 200
+    assert response.mimetype == "application/geo+json"
+    data = response.get_json()
+    assert [f['id'] for f in data['features']] == geo_perevals[:2]
+    assert data['features'][1]['geometry'] == {"type": "Point", "coordinates": [-179.9, -60.0]}
+    assert client.get('/perevals/bbox?bbox=1,2,3').status_code == 400
+
+def test_near_paginated_by_distance(client, geo_perevals):
+    url = '/perevals/near?lat=-60&lon=179.95&radius_km=50&limit=1'
+    first = client.get(url).get_json()
+    second = client.get(f"{url}&after={first['next']}").get_json()
+    assert [f['id'] for f in first['features'] + second['features']] == geo_perevals[:2]
+    assert second['next'] is None
+    assert first['features'][0]['properties']['distance_km'] < 5
+
+def test_nearest_exact_order(client, geo_perevals):
+    data = client.get('/perevals/nearest?lat=-60.4&lon=179.1&k=2').get_json()
+    assert [f['id'] for f in data['features']] == [geo_perevals[2], geo_perevals[0]]
+
+def test_tile_from_grid(client, geo_perevals):
+    app_module.geo_cache.invalidate()
+    response = client.get('/perevals/tiles/0/0/0')
+    ids = {f['id'] for f in response.get_json()['features']}
+    assert set(geo_perevals) <= ids
+    assert client.get('/perevals/tiles/0/0/0', headers={"If-None-Match": response.headers['ETag']}).status_code == 304
+    assert client.get('/perevals/tiles/1/5/0').status_code == 400
+
+# ----------------- Тесты поиска по названию -----------------
+@pytest.fixture
+def titled_perevals():
+    titles = [("пер.", "Зюраткульский", "Тёплый"), ("пер.", "Зюраткуль Северный", ""), ("пик", "Кудрявый", "")]
+    ids = [db_handler.add_pereval({"beautyTitle": b, "title": t, "other_titles": o,
+                                   "user": {"email": "search@example.com"}}, [])
+           for b, t, o in titles]
+    yield ids
+    for pereval_id in ids:
+        db_handler.delete_pereval(pereval_id)
+
+@pytest.mark.parametrize("q", ["Зюраткульского", "зюрат", "Зюраткулский", "теплый"])
+def test_search_morphology_prefix_typo(client, titled_perevals, q):
+    response = client.get(f'/perevals/search?q={q}')
+    assert response.status_code == 200
+    ids = [item['id'] for item in response.get_json()['items']]
+    assert titled_perevals[0] in ids
+    assert titled_perevals[2] not in ids
+
+def test_search_paginated_and_current_after_update(client, titled_perevals):
+    first = client.get('/perevals/search?q=зюраткуль&limit=1').get_json()
+    second = client.get(f"/perevals/search?q=зюраткуль&limit=1&after={first['next']}").get_json()
+    found = [item['id'] for item in first['items'] + second['items']]
+    assert sorted(found) == sorted(titled_perevals[:2])
+    assert first['items'][0]['score'] >= second['items'][0]['score']
+
+    db_handler.update_pereval(titled_perevals[2], {"raw_data": {"title": "Курчавый",
+                                                                "user": {"email": "search@example.com"}}})
+    ids = [item['id'] for item in client.get('/perevals/search?q=курчавый').get_json()['items']]
+    assert titled_perevals[2] in ids
+    assert client.get('/perevals/search?q=%20!').status_code == 400
+
+def test_search_candidates_are_newest_matches(client, titled_perevals, monkeypatch):
+    monkeypatch.setattr(database_handler, "SEARCH_CANDIDATES", 1)
+    # Из двух совпадений ранжируется только новейшее, каким бы ни был физический порядок строк
+    ids = [item['id'] for item in client.get('/perevals/search?q=зюраткуль').get_json()['items']]
+    assert ids == [titled_perevals[1]]
+
+def test_title_words_collected_and_pruned():
+    def word_count():
+        with db_handler.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT count(*) AS n FROM pereval_title_words WHERE word = 'шхельдинский'")
+            return cur.fetchone()['n']
+
+    pereval_id = db_handler.add_pereval({"title": "Шхельдинский", "user": {"email": "search@example.com"}}, [])
+    assert word_count() == 1
+    db_handler.delete_pereval(pereval_id)
+    db_handler.prune_title_words()
+    assert word_count() == 0
+
+# ----------------- Тесты условных запросов и сжатия -----------------
+def test_pereval_etag_304_and_change(client, new_pereval):
+    first = client.get(f'/submitData/{new_pereval}')
+    etag = first.headers['ETag']
+    assert first.headers['Last-Modified']
+    assert client.get(f'/submitData/{new_pereval}', headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f'/submitData/{new_pereval}',
+                      headers={"If-Modified-Since": first.headers['Last-Modified']}).status_code == 304
+    db_handler.update_pereval(new_pereval, {"raw_data": {"title": "Изменён",
+                                                         "user": {"email": "testuser@example.com"}}})
+    changed = client.get(f'/submitData/{new_pereval}', headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+def test_user_perevals_etag_tracks_deletion(client, new_pereval):
+    url = '/userPerevals?user__email=testuser@example.com'
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    extra = db_handler.add_pereval({"title": "Ещё", "user": {"email": "testuser@example.com"}}, [])
+    db_handler.delete_pereval(extra)
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    db_handler.delete_pereval(new_pereval)
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+def test_compressed_response_revalidates(client):
+    payload = {"raw_data": {"title": "Сжатие " * 300, "user": {"email": "gzip@example.com"}}, "images": []}
+    pereval_id = client.post('/submitData', json=payload).get_json()['pereval_id']
+    try:
+        response = client.get(f'/submitData/{pereval_id}', headers={"Accept-Encoding": "gzip"})
+        assert response.headers['Content-Encoding'] == "gzip"
+        assert "Accept-Encoding" in response.headers['Vary']
+        assert json.loads(gzip.decompress(response.data))['id'] == pereval_id
+        assert response.headers['ETag'].endswith('-gzip"')
+        cached = client.get(f'/submitData/{pereval_id}',
+                            headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers['ETag']})
+        assert cached.status_code == 304
+        assert cached.headers['ETag'] == response.headers['ETag']
+    finally:
+        db_handler.delete_pereval(pereval_id)
+
+def test_small_response_etag_has_no_encoding_suffix(client, new_pereval):
+    response = client.get(f'/submitData/{new_pereval}', headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert not response.headers['ETag'].endswith('-gzip"')
+    cached = client.get(f'/submitData/{new_pereval}',
+                        headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers['ETag']})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == response.headers['ETag']
+
+def test_images_not_compressed(client, blob_storage):
+    image_id = client.post('/uploadImage', data={"image": (BytesIO(make_jpeg()), "a.jpg")}).get_json()['image_id']
+    response = client.get(f'/images/{image_id}', headers={"Accept-Encoding": "gzip, br"})
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+
+# ----------------- Тесты кэша перевалов -----------------
+def test_pereval_cache_hit_skips_db(client, new_pereval, monkeypatch):
+    first = client.get(f'/submitData/{new_pereval}')
+    monkeypatch.setattr(db_handler, "get_pereval_with_version", lambda pereval_id: pytest.fail("запрос к БД"))
+    cached = client.get(f'/submitData/{new_pereval}')
+    assert cached.get_json() == first.get_json()
+    assert cached.headers['ETag'] == first.headers['ETag']
+    assert client.get('/cacheStats').get_json()['pereval']['hit'] >= 1
+
+def test_pereval_body_and_etag_from_one_row(new_pereval):
+    pereval, version = db_handler.get_pereval_with_version(new_pereval)
+    assert pereval == db_handler.get_pereval_by_id(new_pereval)
+    assert version == db_handler.get_pereval_version(new_pereval)
+    assert db_handler.get_pereval_with_version(-1) == (None, None)
+
+def test_pereval_cache_invalidated_by_update(client, new_pereval):
+    client.get(f'/submitData/{new_pereval}')
+    db_handler.update_pereval(new_pereval, {"raw_data": {"title": "Изменён",
+                                                         "user": {"email": "testuser@example.com"}}})
+    assert client.get(f'/submitData/{new_pereval}').get_json()['raw_data']['title'] == "Изменён"
+    db_handler.delete_pereval(new_pereval)
+    assert client.get(f'/submitData/{new_pereval}').status_code == 404
+
+def test_pereval_cache_invalidated_by_notify(client, new_pereval):
+    import time
+    client.get(f'/submitData/{new_pereval}')
+    time.sleep(0.5)  # слушатель успевает выполнить LISTEN
+    with db_handler.connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE pereval_added SET status = 'accepted' WHERE id = %s", (new_pereval,))
+        conn.commit()
+    for _ in range(50):
+        if client.get(f'/submitData/{new_pereval}').get_json()['status'] == "accepted":
+            break
+        time.sleep(0.1)
+    assert client.get(f'/submitData/{new_pereval}').get_json()['status'] == "accepted"
+
+# ----------------- Тесты очереди модерации -----------------
+@pytest.fixture
+def queued_perevals():
+    """Четыре новые заявки старше всех остальных — очередь выдаёт их первыми."""
+    ids = [db_handler.add_pereval({"title": f"Очередь {n}", "user": {"email": "queue@example.com"}}, [])
+           for n in range(4)]
+    with db_handler.connection() as conn, conn.cursor() as cur:
+        for n, pereval_id in enumerate(ids):
+            cur.execute("UPDATE pereval_added SET date_added = %s WHERE id = %s", (f"2000-01-0{n + 1}", pereval_id))
+        conn.commit()
+    yield ids
+    for pereval_id in ids:
+        db_handler.delete_pereval(pereval_id)
+
+def claim(client, moderator, limit, **extra):
+    response = client.post('/moderation/claim', json={"moderator": moderator, "limit": limit, **extra})
+    assert response.status_code == 200
+    return [item['id'] for item in response.get_json()['items']]
+
+def test_moderation_claims_do_not_overlap(client, queued_perevals):
+    # Первая заявка заблокирована другой транзакцией — её пропускают, а не ждут
+    with db_handler.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id FROM pereval_added WHERE id = %s FOR UPDATE", (queued_perevals[0],))
+        assert claim(client, "anna", 2) == queued_perevals[1:3]
+        conn.rollback()
+    assert claim(client, "boris", 2) == [queued_perevals[0], queued_perevals[3]]
+    assert db_handler.get_pereval_by_id(queued_perevals[1])['status'] == "pending"
+    assert client.get('/moderation/queue').get_json()['claimed'] >= 4
+
+def test_moderation_expired_lease_is_reclaimed(client, queued_perevals):
+    mine = claim(client, "anna", 1)
+    with db_handler.connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE pereval_added SET claimed_until = NOW() - interval '1 second' WHERE id = %s", (mine[0],))
+        conn.commit()
+    assert client.get('/moderation/queue').get_json()['expired'] >= 1
+    assert claim(client, "boris", 1) == mine
+
+def test_moderation_lease_validated(client, queued_perevals, monkeypatch):
+    monkeypatch.setattr(db_handler, "claim_perevals", lambda *args: pytest.fail("запрос к БД"))
+    for lease in (None, 0, 10**12, "60", 1.5, True):
+        response = client.post('/moderation/claim', json={"moderator": "anna", "lease_seconds": lease})
+        assert response.status_code == 400, lease
+        assert "lease_seconds" in response.get_json()['error']
+
+def test_moderation_bulk_decision(client, queued_perevals):
+    anna = claim(client, "anna", 2)
+    boris = claim(client, "boris", 1)
+    response = client.post('/moderation/decision',
+                           json={"moderator": "anna", "ids": anna + boris + [queued_perevals[3]], "status": "accepted"})
+    assert response.status_code == 200
+    assert response.get_json() == {"updated": sorted(anna + [queued_perevals[3]]), "skipped": boris}
+    assert [db_handler.get_pereval_by_id(i)['status'] for i in queued_perevals] == \
+        ["accepted", "accepted", "pending", "accepted"]
+    released = client.post('/moderation/release', json={"moderator": "boris", "ids": boris + anna}).get_json()
+    assert released == {"released": boris}
+    assert db_handler.get_pereval_by_id(boris[0])['status'] == "new"
+
+def test_moderation_validation(client):
+    assert client.post('/moderation/claim', json={"limit": 5}).status_code == 400
+    assert client.post('/moderation/decision',
+                       json={"moderator": "anna", "ids": [1], "status": "pending"}).status_code == 400
+    assert client.post('/moderation/decision',
+                       json={"moderator": "anna", "ids": "1,2", "status": "accepted"}).status_code == 400
+
+# ----------------- Тесты синхронизации -----------------
+SYNC_EMAIL = "sync@example.com"
+
+@pytest.fixture
+def sync_perevals():
+    ids = [db_handler.add_pereval({"title": f"Синхронизация {n}", "user": {"email": SYNC_EMAIL}}, [])
+           for n in range(3)]
+    yield ids
+    for pereval_id in ids:
+        db_handler.delete_pereval(pereval_id)
+
+def sync_all(client, cursor=None, limit=None):
+    """Пройти все страницы; возвращает (upserted по источникам, deleted по источникам, курсор, reset)."""
+    upserted, deleted, reset = {}, {}, None
+    while True:
+        params = {"user__email": SYNC_EMAIL, "cursor": cursor, "limit": limit}
+        response = client.get('/sync', query_string={k: v for k, v in params.items() if v is not None})
+        assert response.status_code == 200
+        data = response.get_json()
+        reset = data["reset"] if reset is None else reset
+        for name, entry in data["changes"].items():
+            upserted.setdefault(name, []).extend(item["id"] for item in entry["upserted"])
+            deleted.setdefault(name, []).extend(entry["deleted"])
+        cursor = data["cursor"]
+        if not data["has_more"]:
+            return upserted, deleted, cursor, reset
+
+def test_sync_full_then_empty(client, sync_perevals):
+    upserted, deleted, cursor, reset = sync_all(client, limit=2)
+    assert reset is True
+    assert upserted["perevals"] == sync_perevals
+    assert len(upserted["areas"]) == len(db_handler.get_all_areas())
+    assert len(upserted["activities"]) == len(db_handler.get_activities_types())
+    response = client.get('/sync', query_string={"user__email": SYNC_EMAIL, "cursor": cursor})
+    assert response.get_json()["changes"] == {}
+    assert response.headers["Cache-Control"] == "no-store"
+
+def test_sync_delta_with_deletes_and_late_commit(client, sync_perevals):
+    cursor = sync_all(client)[2]
+    # Транзакция начата раньше, а закоммичена после следующей синхронизации — не должна потеряться
+    with db_handler.connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE pereval_added SET status = 'pending' WHERE id = %s", (sync_perevals[0],))
+        db_handler.update_pereval(sync_perevals[1], {"raw_data": {"title": "Изменён"}})
+        upserted, deleted, cursor, reset = sync_all(client, cursor)
+        assert reset is False and upserted == {"perevals": [sync_perevals[1]]}
+        conn.commit()
+    db_handler.delete_pereval(sync_perevals[2])
+    upserted, deleted, cursor, _ = sync_all(client, cursor)
+    assert upserted["perevals"] == [sync_perevals[0]]
+    assert deleted["perevals"] == [sync_perevals[2]]
+
+def test_sync_reference_delete_and_expired_cursor(client, monkeypatch):
+    import database_handler
+    with db_handler.connection() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO spr_activities_types (id, title) VALUES (9001, 'Синхронизация') RETURNING id")
+        conn.commit()
+    cursor = sync_all(client)[2]
+    with db_handler.connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM spr_activities_types WHERE id = 9001")
+        conn.commit()
+    upserted, deleted, _, reset = sync_all(client, cursor)
+    assert reset is False and deleted == {"activities": [9001]}
+    monkeypatch.setattr(database_handler, "SYNC_RETENTION_DAYS", 0)
+    assert sync_all(client, cursor)[3] is True
+    assert client.get('/sync', query_string={"cursor": "не-курсор"}).status_code == 400
+
+# ----------------- Тесты статистики -----------------
+def stats(client, **params):
+    response = client.get('/stats', query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_stats_follow_insert_update_and_delete(client):
+    before = stats(client)
+    pereval_id = db_handler.add_pereval({"title": "Статистика", "area_id": 66, "user": {"email": "stats@example.com"},
+                                         "coords": {"latitude": "50", "longitude": "87", "height": "3270"},
+                                         "level": {"summer": "2А", "winter": ""}}, [])
+    try:
+        after = stats(client)
+        assert after["total"] == before["total"] + 1
+        assert after["status"]["new"] == before["status"].get("new", 0) + 1
+        assert after["height"]["3000"] == before["height"].get("3000", 0) + 1
+        assert after["level"]["summer"]["2А"] == before["level"]["summer"].get("2А", 0) + 1
+        # Область считается и в родительской
+        for area in ("66", "65", "0"):
+            assert after["area"][area] == before["area"].get(area, 0) + 1
+
+        assert db_handler.update_pereval(pereval_id, {"raw_data": {"coords": {"height": "abc"}}})[0]
+        db_handler.transition_perevals("anna", [pereval_id], "accepted")
+        changed = stats(client, dimensions="status,height")
+        assert set(changed) == {"total", "status", "height"}
+        assert changed["status"]["accepted"] == before["status"].get("accepted", 0) + 1
+        assert changed["status"].get("new", 0) == before["status"].get("new", 0)
+        assert changed["height"][""] == before["height"].get("", 0) + 1
+    finally:
+        db_handler.delete_pereval(pereval_id)
+    assert stats(client) == before
+
+def test_stats_match_full_recount(client):
+    with db_handler.connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT k.dimension, k.key, count(*) AS count FROM pereval_added p, pereval_stats_keys(p) k
+            GROUP BY 1, 2
+            EXCEPT
+            SELECT dimension, key, sum(count) FROM pereval_stats GROUP BY 1, 2 HAVING sum(count) <> 0
+        """)
+        assert cur.fetchall() == []
+
+def test_stats_etag_and_validation(client):
+    response = client.get('/stats')
+    etag = response.headers["ETag"].strip('"')
+    assert client.get('/stats', headers={"If-None-Match": f'"{etag}"'}).status_code == 304
+    assert client.get('/stats?dimensions=status,colour').status_code == 400
+
+# ----------------- Тесты реплик для чтения -----------------
+@pytest.fixture
+def replica_handler(request, monkeypatch):
+    handler = app_module.DatabaseHandler(replica_dsns=[request.param])
+    monkeypatch.setattr(app_module, "db_handler", handler)
+    yield handler
+    with db_handler.connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM pereval_added WHERE raw_data->'user'->>'email' = 'replica@example.com'")
+        cur.execute("DELETE FROM sync_tombstones WHERE scope = 'replica@example.com'")
+        conn.commit()
+    handler.close()
+
+def submit_and_read(client):
+    response = client.post('/submitData', json={"raw_data": {"title": "Реплика", "user": {"email": "replica@example.com"}},
+                                                "images": []})
+    assert response.status_code == 201
+    token = response.headers["X-Read-After"]
+    assert f"fstr_read_after={token}" in response.headers["Set-Cookie"]
+    # Cookie с LSN записи: чтение сразу после неё видит добавленный перевал
+    perevals = client.get('/userPerevals', query_string={"user__email": "replica@example.com"}).get_json()
+    assert [p['raw_data']['title'] for p in perevals] == ["Реплика"]
+    return replica_targets(client)
+
+def replica_targets(client, ready=lambda replica: True):
+    # Реплику проверяет фоновый поток, запрос его не ждёт
+    for _ in range(100):
+        targets = {t["name"]: t for t in client.get('/replicaStats').get_json()["targets"]}
+        if ready(targets["replica1"]):
+            break
+        time.sleep(0.05)
+    return targets
+
+@pytest.mark.parametrize("replica_handler", ["host=localhost port=1 dbname=pereval connect_timeout=1"], indirect=True)
+def test_unreachable_replica_falls_back_to_primary(client, replica_handler):
+    submit_and_read(client)
+    targets = replica_targets(client, lambda replica: replica["failures"])
+    assert targets["replica1"]["available"] is False
+    assert targets["replica1"]["failures"] >= 1
+    assert targets["replica1"]["checkouts"] == 0
+    assert targets["primary"]["checkouts"] >= 2
+
+def primary_dsn():
+    return (f"host={db_handler.host} port={db_handler.port} user={db_handler.user} password={db_handler.password} "
+            f"dbname={db_handler.database}")
+
+def test_query_error_keeps_replica_routable():
+    # Основной сервер в роли «реплики»: важна только реакция на ошибку запроса
+    handler = app_module.DatabaseHandler(replica_dsns=[primary_dsn()])
+    try:
+        replica = handler.router.replicas[0]
+        handler.router.check()
+        handler.router._checker_pid = os.getpid()
+        with pytest.raises(psycopg2.errors.QueryCanceled):
+            with handler.connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute("SET statement_timeout = 1")
+                cur.execute("SELECT pg_sleep(0.1)")
+        assert replica.checkouts == 1
+        assert replica.failures == 0
+        assert handler.router.choose(read_only=True) is replica
+        with handler.connection(read_only=True) as conn, conn.cursor() as cur:
+            cur.execute("SELECT 1 AS one")
+            assert cur.fetchone()['one'] == 1
+        assert replica.checkouts == 2
+    finally:
+        handler.close()
+
+@pytest.mark.skipif(not os.getenv("FSTR_TEST_REPLICA_DSN"), reason="нужна потоковая реплика: FSTR_TEST_REPLICA_DSN")
+@pytest.mark.parametrize("replica_handler", [os.getenv("FSTR_TEST_REPLICA_DSN")], indirect=True)
+def test_reads_go_to_replica(client, replica_handler):
+    submit_and_read(client)
+    client.delete_cookie('fstr_read_after')
+    replica_targets(client, lambda replica: replica["standby"])
+    client.get('/userPerevals', query_string={"user__email": "replica@example.com"})
+    targets = replica_targets(client)
+    assert targets["replica1"]["standby"] is True
+    assert targets["replica1"]["checkouts"] >= 1
+    assert targets["replica1"]["lag_bytes"] is not None
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+import geo
+
+
+def test_haversine_known_distance():
+    # Москва — Санкт-Петербург, около 634 км
+    assert geo.haversine_km(55.7558, 37.6173, 59.9343, 30.3351) == pytest.approx(634, abs=2)
+    assert geo.haversine_km(10, 179.9, 10, -179.9) == pytest.approx(21.9, abs=0.1)
+
+
+@pytest.mark.parametrize("lat, lon, radius", [(45, 7, 100), (-60, 179.9, 50), (89.5, 0, 100), (0, 0, 1)])
+def test_bbox_around_contains_circle(lat, lon, radius):
+    min_lon, min_lat, max_lon, max_lat = geo.bbox_around(lat, lon, radius)
+    rng = random.Random(1)
+    for _ in range(500):
+        plat, plon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        if geo.haversine_km(lat, lon, plat, plon) <= radius:
+            assert min_lat <= plat <= max_lat and min_lon <= plon <= max_lon
+
+
+def test_tile_bbox():
+    assert geo.tile_bbox(0, 0, 0) == pytest.approx((-180, -85.0511, 180, 85.0511), abs=1e-4)
+    min_lon, min_lat, max_lon, max_lat = geo.tile_bbox(1, 1, 0)
+    assert (min_lon, min_lat, max_lon) == (0, 0, 180)
+    with pytest.raises(ValueError):
+        geo.tile_bbox(1, 2, 0)
+
+
+def test_parse_bbox():
+    assert geo.parse_bbox("170,-10,-170,10") == (170, -10, -170, 10)
+    for value in ("1,2,3", "a,b,c,d", "0,10,1,5", "0,0,200,1", None):
+        with pytest.raises(ValueError):
+            geo.parse_bbox(value)
+
+
+def test_feature_collection_compact():
+    collection = geo.feature_collection(
+        [{"id": 1, "lat": 45.123456789, "lon": 7.1, "title": "Перевал", "status": "new", "distance_km": 1.23456}],
+        next="abc")
+    assert collection == {
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "id": 1,
+                      "geometry": {"type": "Point", "coordinates": [7.1, 45.12346]},
+                      "properties": {"title": "Перевал", "status": "new", "distance_km": 1.235}}],
+        "next": "abc",
+    }
+
+
+def test_grid_matches_brute_force():
+    rng = random.Random(7)
+    rows = [{"id": n, "lat": rng.uniform(-85, 85), "lon": rng.uniform(-180, 180)} for n in range(3000)]
+    rows.append({"id": 5000, "lat": None, "lon": None})
+    grid = geo.GeoGrid(rows, cell_deg=2.5)
+    assert grid.size == 3000
+    for box in [(-10, -10, 10, 10), (170, -30, -170, 30), (-180, -85, 180, 85), *[geo.tile_bbox(3, 7, 3)]]:
+        expected = [r["id"] for r in rows[:-1]
+                    if any(b[1] <= r["lat"] <= b[3] and b[0] <= r["lon"] <= b[2] for b in geo.split_bbox(*box))]
+        assert [r["id"] for r in grid.query_bbox(*box)] == sorted(expected)
+    assert len(grid.query_bbox(-180, -85, 180, 85, limit=10)) == 10
@@ -0,0 +1,68 @@
+import os
+import pytest
+from ingest_queue import IngestQueue
+
+
+class FakeHandler:
+    def __init__(self):
+        self.rows = {}
+        self.fail = set()
+        self.calls = 0
+
+    def add_perevals_ingested(self, items):
+        self.calls += 1
+        if any(raw_data.get("title") in self.fail for _, raw_data, _ in items):
+            raise RuntimeError("ошибка вставки")
+        for tracking_id, raw_data, images in items:
+            self.rows.setdefault(tracking_id, len(self.rows) + 1)
+        return {tracking_id: self.rows[tracking_id] for tracking_id, _, _ in items}
+
+
+def make_queue(tmp_path, handler, **kwargs):
+    queue = IngestQueue(str(tmp_path / "queue.sqlite3"), handler, **kwargs)
+    queue._flusher_pid = os.getpid()  # без фонового потока
+    return queue
+
+
+# ----------------- Тесты IngestQueue -----------------
+def test_batch_flushed_in_one_call(tmp_path):
+    handler = FakeHandler()
+    queue = make_queue(tmp_path, handler)
+    ids = [queue.enqueue({"title": f"П{n}"}, []) for n in range(5)]
+    assert queue.flush_once() == 5
+    assert handler.calls == 1
+    assert [queue.get_status(t)['pereval_id'] for t in ids] == [1, 2, 3, 4, 5]
+    assert queue.stats()['done'] == 5
+
+
+def test_pending_entries_survive_restart(tmp_path):
+    handler = FakeHandler()
+    tracking_id = make_queue(tmp_path, handler).enqueue({"title": "после сбоя"}, [])
+    queue = make_queue(tmp_path, handler)
+    assert queue.get_status(tracking_id)['status'] == 'queued'
+    assert queue.flush_once() == 1
+    assert queue.get_status(tracking_id)['status'] == 'done'
+
+
+def test_claimed_entries_not_taken_twice(tmp_path):
+    handler = FakeHandler()
+    queue = make_queue(tmp_path, handler)
+    queue.enqueue({"title": "одна"}, [])
+    assert len(queue._claim()) == 1
+    assert queue._claim() == []
+
+
+def test_poison_entry_isolated_after_retries(tmp_path):
+    handler = FakeHandler()
+    handler.fail.add("плохая")
+    queue = make_queue(tmp_path, handler, max_attempts=2)
+    good = queue.enqueue({"title": "хорошая"}, [])
+    bad = queue.enqueue({"title": "плохая"}, [])
+    with pytest.raises(RuntimeError):
+        queue.flush_once()
+    assert queue.get_status(good)['status'] == 'queued'
+    assert queue.flush_once() == 2
+    assert queue.get_status(good)['status'] == 'done'
+    failed = queue.get_status(bad)
+    assert failed['status'] == 'failed'
+    assert failed['error'] == "ошибка вставки"
@@ -0,0 +1,51 @@
+import pytest
+from prometheus_client import REGISTRY
+
+import metrics
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+# ----------------- Тесты инструментирования -----------------
+def test_instrumented_labels_nested_calls():
+    seen = []
+
+    @metrics.instrumented
+    def inner():
+        seen.append(metrics.current_method())
+
+    @metrics.instrumented
+    def outer():
+        inner()
+        seen.append(metrics.current_method())
+
+    before = sample("fstr_db_method_duration_seconds_count", method="outer")
+    outer()
+    assert seen == ["inner", "outer"]
+    assert metrics.current_method() == "other"
+    assert sample("fstr_db_method_duration_seconds_count", method="outer") == before + 1
+
+
+def test_instrumented_counts_errors():
+    @metrics.instrumented
+    def broken():
+        raise RuntimeError("сбой")
+
+    before = sample("fstr_db_method_errors_total", method="broken")
+    with pytest.raises(RuntimeError):
+        broken()
+    assert sample("fstr_db_method_errors_total", method="broken") == before + 1
+
+
+def test_timed_json_loads():
+    before = sample("fstr_json_decode_seconds_total", method="other")
+    assert metrics.timed_json_loads('{"a": [1, 2]}') == {"a": [1, 2]}
+    assert sample("fstr_json_decode_seconds_total", method="other") > before
+
+
+def test_render_prometheus_text():
+    body, content_type = metrics.render()
+    assert content_type.startswith("text/plain")
+    assert b"# TYPE fstr_http_request_duration_seconds histogram" in body
@@ -0,0 +1,27 @@
+import pytest
+from migrate import discover_migrations, split_statements, MIGRATIONS_DIR
+
+
+# ----------------- Тесты миграций -----------------
+def test_discover_migrations_sorted(tmp_path):
+    (tmp_path / "0002_second.sql").write_text("SELECT 2;")
+    (tmp_path / "0001_first.sql").write_text("SELECT 1;")
+    (tmp_path / "README.txt").write_text("не миграция")
+    assert [(v, n) for v, n, _ in discover_migrations(str(tmp_path))] == [(1, "first"), (2, "second")]
+
+
+def test_duplicate_versions_rejected(tmp_path):
+    (tmp_path / "0001_a.sql").write_text("")
+    (tmp_path / "0001_b.sql").write_text("")
+    with pytest.raises(ValueError):
+        discover_migrations(str(tmp_path))
+
+
+def test_split_statements_skips_comments():
+    sql = "-- migrate: no-transaction\nCREATE INDEX CONCURRENTLY a ON t (x);\n\n-- комментарий\nDROP INDEX b;\n"
+    assert split_statements(sql) == ["CREATE INDEX CONCURRENTLY a ON t (x)", "DROP INDEX b"]
+
+
+def test_shipped_migrations_are_numbered():
+    versions = [v for v, _, _ in discover_migrations(MIGRATIONS_DIR)]
+    assert versions == list(range(1, len(versions) + 1))
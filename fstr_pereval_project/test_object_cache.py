@@ -0,0 +1,125 @@
+from datetime import datetime, timezone
+
+from object_cache import CachedPereval, LocalSharedStore, ObjectCache
+
+
+# ----------------- Тесты ObjectCache -----------------
+def make_cache(max_entries=10, ttl=60, shared=None):
+    calls = []
+
+    def loader(key):
+        calls.append(key)
+        return None if key < 0 else f"value-{key}-{len(calls)}"
+
+    cache = ObjectCache("test", loader, max_entries=max_entries, ttl=ttl, shared=shared,
+                        dump=str.encode, load=bytes.decode)
+    return cache, calls
+
+
+def test_read_through_and_hit():
+    cache, calls = make_cache()
+    assert cache.get(1) == "value-1-1"
+    assert cache.get(1) == "value-1-1"
+    assert calls == [1]
+    assert cache.stats()["hit"] == 1 and cache.stats()["miss"] == 1
+
+
+def test_missing_value_is_not_cached():
+    cache, calls = make_cache()
+    assert cache.get(-1) is None
+    assert cache.get(-1) is None
+    assert calls == [-1, -1]
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_eviction():
+    cache, calls = make_cache(max_entries=2)
+    cache.get(1)
+    cache.get(2)
+    cache.get(1)  # 1 теперь самая свежая, вытесняется 2
+    cache.get(3)
+    cache.get(1)
+    cache.get(2)
+    assert calls == [1, 2, 3, 2]
+    assert cache.stats()["eviction"] == 2
+
+
+def test_ttl_expiry():
+    cache, calls = make_cache(ttl=0)
+    cache.get(1)
+    cache.get(1)
+    assert calls == [1, 1]
+
+
+def test_invalidate_key_and_all():
+    cache, calls = make_cache()
+    cache.get(1)
+    cache.get(2)
+    cache.invalidate(1)
+    cache.get(1)
+    cache.get(2)
+    assert calls == [1, 2, 1]
+    cache.invalidate()
+    cache.get(2)
+    assert calls == [1, 2, 1, 2]
+
+
+def test_invalidation_during_load_is_not_overwritten():
+    calls = []
+
+    def loader(key):
+        calls.append(key)
+        if len(calls) == 1:
+            cache.invalidate(key)  # изменение пришло, пока читалась старая версия
+        return f"v{len(calls)}"
+
+    cache = ObjectCache("race", loader)
+    assert cache.get(1) == "v1"
+    assert cache.get(1) == "v2"
+    assert cache.get(1) == "v2"
+
+
+def test_shared_store_between_processes():
+    shared = LocalSharedStore()
+    first, first_calls = make_cache(shared=shared)
+    second, second_calls = make_cache(shared=shared)
+    assert first.get(1) == "value-1-1"
+    assert second.get(1) == "value-1-1"
+    assert second_calls == []
+    assert second.stats()["shared_hit"] == 1
+    first.invalidate(1)
+    second.invalidate(1)
+    assert second.get(1) == "value-1-1"
+    assert second_calls == [1]
+
+
+def test_shared_write_after_invalidation_is_rejected():
+    shared = LocalSharedStore()
+    first, _ = make_cache(shared=shared)
+    second, second_calls = make_cache(shared=shared)
+
+    def loader(key):
+        # Пока первый воркер читает старую версию, второй сбрасывает запись
+        second.invalidate(key)
+        return "old"
+
+    first.loader = loader
+    assert first.get(1) == "old"
+    assert second.get(1) == "value-1-1"
+    assert second_calls == [1]
+
+    # Сброс в том же воркере уже после проверки токена, между загрузкой и записью в общее хранилище
+    def dump(value):
+        first.invalidate(1)
+        return value.encode()
+
+    first.invalidate(1)
+    first.dump = dump
+    assert first.get(1) == "old"
+    assert shared.get("test:1") is None
+
+
+def test_cached_pereval_roundtrip():
+    entry = CachedPereval(b'{"id":1,"title":"a\\nb"}', "1-735", datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc))
+    loaded = CachedPereval.load(entry.dump())
+    assert (loaded.body, loaded.etag, loaded.last_modified) == (entry.body, entry.etag, entry.last_modified)
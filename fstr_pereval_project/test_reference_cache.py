@@ -0,0 +1,54 @@
+from reference_cache import ReferenceCache
+
+
+# ----------------- Тесты ReferenceCache -----------------
+def make_cache(ttl=60):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return [{"id": 1, "title": "пешком"}]
+
+    cache = ReferenceCache(ttl=ttl)
+    cache.register("activities", loader, tables=["spr_activities_types"])
+    return cache, calls
+
+
+def test_entry_is_serialized_once():
+    cache, calls = make_cache()
+    first = cache.get("activities")
+    second = cache.get("activities")
+    assert first is second
+    assert len(calls) == 1
+    assert first.body == '[{"id":1,"title":"пешком"}]'.encode("utf-8")
+
+
+def test_ttl_expiry():
+    cache, calls = make_cache(ttl=0)
+    cache.get("activities")
+    cache.get("activities")
+    assert len(calls) == 2
+
+
+def test_table_change_invalidates_dependent_entries():
+    cache, calls = make_cache()
+    etag = cache.get("activities").etag
+    cache.invalidate_table("pereval_areas")
+    cache.get("activities")
+    assert len(calls) == 1
+    cache.invalidate_table("spr_activities_types")
+    assert cache.get("activities").etag == etag
+    assert len(calls) == 2
+
+
+def test_notifications_dispatched_to_subscribers():
+    cache, calls = make_cache()
+    received = []
+    cache.subscribe("pereval_changed", received.append)
+    cache.get("activities")
+    cache._dispatch("pereval_changed", "42")
+    cache._publish_reset()
+    assert received == ["42", None]
+    cache._dispatch("reference_data_changed", "spr_activities_types")
+    cache.get("activities")
+    assert len(calls) == 2
@@ -0,0 +1,36 @@
+import uuid
+import decimal
+import importlib
+from datetime import datetime
+
+import pytest
+
+import serialization
+
+ROW = {"id": 1, "title": "Перевал", "height": 1200.5, "price": decimal.Decimal("1.50"),
+       "ref": uuid.UUID(int=1), "date_added": datetime(2022, 2, 21, 14, 14, 0, 720184), "tags": [None, True]}
+
+
+# ----------------- Тесты кодека JSON -----------------
+@pytest.fixture(params=["json", "orjson"])
+def codec(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    monkeypatch.setenv("FSTR_JSON_CODEC", request.param)
+    yield importlib.reload(serialization)
+    monkeypatch.undo()
+    importlib.reload(serialization)
+
+
+def test_codecs_produce_identical_bytes(codec):
+    assert codec.JSON_CODEC in ("json", "orjson")
+    assert codec.dumps(ROW) == (
+        '{"id":1,"title":"Перевал","height":1200.5,"price":"1.50",'
+        '"ref":"00000000-0000-0000-0000-000000000001","date_added":"Mon, 21 Feb 2022 14:14:00 GMT",'
+        '"tags":[null,true]}').encode("utf-8")
+    assert codec.loads(codec.dumps({"a": "б"})) == {"a": "б"}
+
+
+def test_json_array_splices_raw_text():
+    assert serialization.json_array([]) == b"[]"
+    assert serialization.json_array(['{"id": 1}', b'{"id":2}']) == b'[{"id": 1},{"id":2}]'
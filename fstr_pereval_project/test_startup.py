@@ -0,0 +1,27 @@
+import os
+import sys
+import subprocess
+
+import openapi
+
+# ----------------- Тесты холодного старта -----------------
+# Импорт в отдельном процессе: в процессе pytest эти модули уже могут быть загружены
+IMPORT_CHECK = """
+import sys
+import app
+heavy = [m for m in ("flasgger", "PIL", "dotenv", "asyncio", "sqlalchemy") if m in sys.modules]
+assert not heavy, heavy
+assert "db_handler" not in vars(app), "DatabaseHandler создан при импорте"
+app.create_app()
+assert "db_handler" not in vars(app), "DatabaseHandler создан при создании приложения"
+"""
+
+
+def test_import_does_not_load_heavy_modules_or_connect():
+    result = subprocess.run([sys.executable, "-c", IMPORT_CHECK], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.returncode == 0, result.stderr
+
+
+def test_prebuilt_spec_is_up_to_date():
+    assert openapi.main(["--check"]) == 0
@@ -0,0 +1,19 @@
+import pytest
+from validation import ValidationError, validate_pereval
+
+
+# ----------------- Тесты validate_pereval -----------------
+def test_valid_pereval():
+    assert validate_pereval({"raw_data": {"title": "Пхия"}}) == ({"title": "Пхия"}, [])
+
+
+@pytest.mark.parametrize("data", [
+    None,
+    {},
+    {"raw_data": "строка"},
+    {"raw_data": {"title": "x"}, "images": "image1.jpg"},
+    {"raw_data": {"title": "x"}, "images": ["image1.jpg"]},
+])
+def test_invalid_pereval(data):
+    with pytest.raises(ValidationError):
+        validate_pereval(data)
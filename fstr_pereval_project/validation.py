@@ -0,0 +1,31 @@
+# ----------------- Проверка входных данных -----------------
+class ValidationError(ValueError):
+    pass
+
+
+def validate_pereval(data):
+    """
+    Проверить объект {"raw_data": {...}, "images": [...]} и вернуть (raw_data, images).
+    """
+    if not isinstance(data, dict):
+        raise ValidationError("Ожидается объект с полями raw_data и images")
+    raw_data = data.get("raw_data")
+    if not raw_data:
+        raise ValidationError("Missing required raw_data")
+    return validate_raw_data(raw_data), validate_images(data.get("images"))
+
+
+# Общие проверки полей — и для POST, и для PATCH
+def validate_raw_data(raw_data):
+    if not isinstance(raw_data, dict):
+        raise ValidationError("raw_data должен быть объектом")
+    return raw_data
+
+
+def validate_images(images):
+    """None — пустой список изображений."""
+    if images is None:
+        return []
+    if not isinstance(images, list) or not all(isinstance(i, dict) for i in images):
+        raise ValidationError("images должен быть массивом объектов")
+    return images